@@ -1,4 +1,4 @@
 from .processor import TickDataProcessor
-from .db import PostgresDB, SQLiteDB
+from .db import ColumnarDB, PostgresDB, SQLiteDB
 
-__all__ = ['TickDataProcessor', 'PostgresDB', 'SQLiteDB'] 
\ No newline at end of file
+__all__ = ['TickDataProcessor', 'ColumnarDB', 'PostgresDB', 'SQLiteDB'] 
\ No newline at end of file
@@ -0,0 +1,204 @@
+import logging
+import numpy as np
+import pandas as pd
+from .db import DBInterface
+from .encoding import NS_PER_MS, moment_to_ms, moments_to_ns, ms_to_moment, ns_to_moments
+from .engine import PRICE, REMAINING_VOLUME, OrderBookEngine
+
+logger = logging.getLogger(__name__)
+
+
+SIDES = (('B', 'bid'), ('S', 'ask'))
+
+
+def sampling_grid(symbols, start: int, end: int, step_ms: int):
+    """Сетка запросов: каждый инструмент в каждый момент от start до end с шагом step_ms -> (symbols, timestamps)"""
+    start_ns, end_ns = moments_to_ns([start, end]).tolist()
+    moments = ns_to_moments(np.arange(start_ns, end_ns + 1, step_ms * NS_PER_MS, dtype=np.int64))
+    symbols = np.asarray(symbols, dtype=object)
+    return np.repeat(symbols, len(moments)), np.tile(moments, len(symbols))
+
+
+def sample_best_prices(chunks, symbols, timestamps, book: OrderBookEngine = None) -> dict:
+    """Лучшие цены по инструментам на моменты за один проход по потоку событий.
+
+    symbols и timestamps - массивы одной длины (точки запроса). chunks - порции событий
+    в колонках (decode_chunk, BinaryLogReader.chunks) в порядке времени. Точки упорядочиваются
+    по времени и сливаются с потоком: перед ответом на точку в книгу применены все события
+    с timestamp <= её момента. Результат - колонки в порядке точек: цена, остаток и id лучшей
+    заявки каждой стороны (NaN и 0, если стороны нет). book - книга на начало потока.
+    """
+    symbols = np.asarray(symbols, dtype=object)
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if len(symbols) != len(timestamps):
+        raise ValueError(f"Got {len(symbols)} symbols and {len(timestamps)} timestamps")
+    book = book if book is not None else OrderBookEngine(track_changes=False)
+    result = {'symbol': symbols, 'timestamp': timestamps}
+    for _, side in SIDES:
+        result[f'{side}_price'] = np.full(len(symbols), np.nan)
+        result[f'{side}_volume'] = np.zeros(len(symbols), dtype=np.int64)
+        result[f'{side}_order_id'] = np.zeros(len(symbols), dtype=np.int64)
+
+    order = np.argsort(timestamps, kind='stable')
+    query_times = timestamps[order]
+    wanted = pd.Index(pd.unique(symbols))
+    answered = 0
+    last_timestamp = None
+    for cols in chunks:
+        event_times = cols['timestamp']
+        if not len(event_times):
+            continue
+        if np.any(event_times[1:] < event_times[:-1]) or (last_timestamp is not None and event_times[0] < last_timestamp):
+            raise ValueError("Events are not ordered by time")
+        last_timestamp = int(event_times[-1])
+        # События других инструментов на ответы не влияют
+        mask = wanted.get_indexer(cols['symbol']) >= 0
+        cols = {name: values[mask] for name, values in cols.items()}
+
+        # Точки раньше последнего события порции: все их события уже в этой или прошлых порциях
+        ready = int(np.searchsorted(query_times, last_timestamp, side='left'))
+        positions = np.searchsorted(cols['timestamp'], query_times[answered:ready], side='right').tolist()
+        events = list(zip(cols['action'].tolist(), cols['order_id'].tolist(), cols['symbol'].tolist(),
+                          cols['operation'].tolist(), cols['price'].tolist(), cols['volume'].tolist(),
+                          cols['timestamp'].tolist()))
+        applied = 0
+        for index, position in zip(order[answered:ready].tolist(), positions):
+            for event in events[applied:position]:
+                book.apply(*event)
+            applied = max(applied, position)
+            _fill_best(book, result, index)
+        for event in events[applied:]:
+            book.apply(*event)
+        answered = ready
+
+    for index in order[answered:].tolist():
+        _fill_best(book, result, index)
+    return result
+
+
+def _fill_best(book: OrderBookEngine, result: dict, index: int):
+    symbol = result['symbol'][index]
+    for operation, side_name in SIDES:
+        order_id = book.best_order(symbol, operation)
+        if order_id is not None:
+            order = book.books[symbol][order_id]
+            result[f'{side_name}_price'][index] = order[PRICE]
+            result[f'{side_name}_volume'][index] = order[REMAINING_VOLUME]
+            result[f'{side_name}_order_id'][index] = order_id
+
+
+def history_columns(rows) -> dict:
+    """Строки get_history_range -> колонки событий, как у decode_chunk"""
+    rows = [dict(row) for row in rows]
+    return {
+        'symbol': np.array([row['symbol'] for row in rows], dtype=object),
+        'operation': np.array([row['operation'] for row in rows], dtype=object),
+        'timestamp': np.array([row['timestamp'] for row in rows], dtype=np.int64),
+        'order_id': np.array([row['order_id'] for row in rows], dtype=np.int64),
+        'action': np.array([row['action_type'] for row in rows], dtype=np.int8),
+        'price': np.array([row['price'] for row in rows], dtype=np.float64),
+        'volume': np.array([row['volume'] for row in rows], dtype=np.int64),
+    }
+
+
+class CheckpointWriter:
+    """Сохраняет снимки книги каждые every_events событий и/или every_ms миллисекунд.
+
+    Снимок делается только на границе меток времени: он содержит все события
+    с timestamp <= метки снимка и ни одного более позднего.
+    """
+
+    def __init__(self, every_events: int = None, every_ms: int = None):
+        if not every_events and not every_ms:
+            raise ValueError("Checkpoint interval is not set")
+        self.every_events = every_events
+        self.every_ms = every_ms
+        self.reset()
+
+    def reset(self):
+        self.last_timestamp = None
+        self.events_since = 0
+        self.next_moment = None
+
+    def feed(self, timestamps):
+        """Возвращает [(позиция, метка снимка)]: снимок пишется перед событием с этой позицией"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if not len(timestamps):
+            return []
+
+        if self.last_timestamp is None:
+            self.last_timestamp = int(timestamps[0])
+            self._schedule(self.last_timestamp)
+        previous = np.concatenate(([self.last_timestamp], timestamps[:-1]))
+        boundaries = np.flatnonzero(timestamps > previous)
+
+        points = []
+        start = 0
+        while len(boundaries):
+            due = np.zeros(len(boundaries), dtype=bool)
+            if self.every_events:
+                due |= self.events_since + (boundaries - start) >= self.every_events
+            if self.every_ms:
+                due |= timestamps[boundaries] >= self.next_moment
+            hits = np.flatnonzero(due)
+            if not len(hits):
+                break
+            position = int(boundaries[hits[0]])
+            checkpoint_timestamp = int(previous[position])
+            points.append((position, checkpoint_timestamp))
+            self.events_since = 0
+            self._schedule(checkpoint_timestamp)
+            start = position
+            boundaries = boundaries[hits[0] + 1:]
+
+        self.events_since += len(timestamps) - start
+        self.last_timestamp = int(timestamps[-1])
+        return points
+
+    def _schedule(self, timestamp):
+        if self.every_ms:
+            self.next_moment = ms_to_moment(moment_to_ms(timestamp) + self.every_ms)
+
+    def write(self, db: DBInterface, engine: OrderBookEngine, timestamp: int):
+        db.insert_checkpoint(timestamp, list(engine.iter_orders()))
+        logger.debug(f"Checkpoint at {timestamp}: {engine.get_active_orders_count()} orders")
+
+
+class AsOfBook:
+    """Восстановление книги на прошлый момент: ближайший снимок + история после него"""
+
+    def __init__(self, db: DBInterface):
+        self.db = db
+
+    def get_book(self, symbol: str, timestamp: int) -> OrderBookEngine:
+        checkpoint_timestamp, orders = self.db.get_checkpoint(symbol, timestamp)
+        book = OrderBookEngine(track_changes=False)
+        book.load(orders)
+        from_ts = checkpoint_timestamp + 1 if checkpoint_timestamp is not None else 0
+        for row in self.db.get_history_range(symbol, from_ts, timestamp):
+            book.apply(row['action_type'], row['order_id'], row['symbol'], row['operation'],
+                       row['price'], row['volume'], row['timestamp'])
+        return book
+
+    def get_best_prices(self, symbol: str, timestamp: int):
+        return self.get_book(symbol, timestamp).get_best_prices(symbol, timestamp)
+
+    def sample_best_prices(self, symbols, timestamps) -> dict:
+        """sample_best_prices по истории в БД: на инструмент один снимок и один запрос истории, не запрос на точку"""
+        symbols = np.asarray(symbols, dtype=object)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        result = None
+        for symbol in np.unique(symbols).tolist():
+            points = np.flatnonzero(symbols == symbol)
+            first, last = int(timestamps[points].min()), int(timestamps[points].max())
+            checkpoint_timestamp, orders = self.db.get_checkpoint(symbol, first)
+            book = OrderBookEngine(track_changes=False)
+            book.load(orders)
+            from_ts = checkpoint_timestamp + 1 if checkpoint_timestamp is not None else 0
+            events = history_columns(self.db.get_history_range(symbol, from_ts, last))
+            sampled = sample_best_prices([events], symbols[points], timestamps[points], book)
+            if result is None:
+                result = {name: np.empty(len(symbols), dtype=values.dtype) for name, values in sampled.items()}
+            for name, values in sampled.items():
+                result[name][points] = values
+        return result if result is not None else sample_best_prices([], symbols, timestamps)
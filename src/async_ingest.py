@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import time
+import numpy as np
+from .db import InstrumentedDB
+from .engine import ActiveOrderCoalescer
+from .metrics import get_registry
+from .parallel import symbol_partition
+from .processor import decode_chunk, history_rows, read_csv_chunks
+
+logger = logging.getLogger(__name__)
+
+
+class PendingWrites:
+    """Записи active_orders, которые состояние (движок, свёртка) сделало бы при flush; передаются потребителю"""
+
+    def __init__(self):
+        self.calls = []
+
+    def apply_active_changes(self, inserts, trades, deletes):
+        self.calls.append(('apply_active_changes', (inserts, trades, deletes)))
+
+    def replace_active_orders(self, orders):
+        self.calls.append(('replace_active_orders', (orders,)))
+
+
+class AsyncIngestor:
+    """Загрузка CSV в PostgreSQL с перекрытием разбора и записи.
+
+    Производитель читает и раскладывает порции в отдельном потоке, потребители пишут
+    в БД через AsyncPostgresDB из ограниченных очередей: history_writers потребителей
+    order_history (инструменты распределены по crc32(symbol), порядок событий инструмента
+    сохраняется) и один потребитель active_orders, который применяет изменения строго
+    по порядку. Состояние active_orders (engine или свёртка по порциям) ведёт производитель.
+    Глубина очередей после каждой записи в них - метрика ingest_queue_depth.
+    """
+
+    def __init__(self, db, history_writers: int = 4, queue_size: int = 8, engine=None, coalesce: bool = False,
+                 metrics=None):
+        self.metrics = metrics if metrics is not None else get_registry()
+        if self.metrics.enabled and not isinstance(db, InstrumentedDB):
+            db = InstrumentedDB(db, self.metrics)
+        self.db = db
+        self.history_writers = history_writers
+        self.queue_size = queue_size
+        self.engine = engine
+        self.coalesce = coalesce
+
+    def run(self, csv_file: str, limit: int = None, batch_size: int = 50000):
+        """Синхронная обёртка над process_csv_file"""
+        return asyncio.run(self._run_and_close(csv_file, limit, batch_size))
+
+    async def _run_and_close(self, csv_file, limit, batch_size):
+        try:
+            return await self.process_csv_file(csv_file, limit, batch_size)
+        finally:
+            await self.db.close()
+
+    async def process_csv_file(self, csv_file: str, limit: int = None, batch_size: int = 50000):
+        logger.info(f"Processing file: {csv_file} ({self.history_writers} history writers, async)")
+        await self.db.clear_tables()
+
+        if self.engine:
+            state = self.engine
+        elif self.coalesce:
+            state = ActiveOrderCoalescer()
+        else:
+            state = None
+        if state:
+            state.reset()
+
+        history_queues = [asyncio.Queue(self.queue_size) for _ in range(self.history_writers)]
+        active_queue = asyncio.Queue(self.queue_size)
+        started = time.perf_counter()
+        tasks = [asyncio.create_task(self._write_history(queue)) for queue in history_queues]
+        tasks.append(asyncio.create_task(self._write_active(active_queue)))
+        tasks.append(asyncio.create_task(self._produce(csv_file, limit, batch_size, state, history_queues, active_queue)))
+        try:
+            processed_count = (await asyncio.gather(*tasks))[-1]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        elapsed = time.perf_counter() - started
+        rate = processed_count / elapsed if elapsed > 0 else 0.0
+        active_count = await self.db.get_active_orders_count()
+        logger.info(f"Processing completed. Processed: {processed_count}, Active orders: {active_count}, "
+                    f"{rate:.0f} events/sec (async)")
+        return {'processed': processed_count, 'elapsed': elapsed, 'events_per_sec': rate}
+
+    async def _produce(self, csv_file, limit, batch_size, state, history_queues, active_queue):
+        processed_count = 0
+        chunks = read_csv_chunks(csv_file, batch_size, typed=True)
+        try:
+            while True:
+                # Разбор CSV занимает CPU: в отдельном потоке, пока потребители ждут ответов БД
+                prepared = await asyncio.to_thread(self._prepare, chunks, limit, processed_count, state)
+                if prepared is None:
+                    break
+                count, history_parts, active_writes = prepared
+                for writer, (queue, rows) in enumerate(zip(history_queues, history_parts)):
+                    if rows:
+                        await queue.put(rows)
+                        self.metrics.set_gauge('ingest_queue_depth', queue.qsize(), queue=f'history{writer}')
+                for write in active_writes:
+                    await active_queue.put(write)
+                self.metrics.set_gauge('ingest_queue_depth', active_queue.qsize(), queue='active')
+                self.metrics.inc('ingest_events_total', count)
+                self.metrics.inc('ingest_chunks_total')
+                processed_count += count
+                logger.info(f"Processed: {processed_count}")
+
+            if state:
+                pending = PendingWrites()
+                state.flush(pending)
+                for write in pending.calls:
+                    await active_queue.put(write)
+        finally:
+            chunks.close()
+        for queue in history_queues:
+            await queue.put(None)
+        await active_queue.put(None)
+        return processed_count
+
+    def _prepare(self, chunks, limit, processed_count, state):
+        """Следующая порция: строки истории по потребителям и записи active_orders"""
+        if limit and processed_count >= limit:
+            return None
+        with self.metrics.timer('ingest_stage_seconds', stage='read'):
+            chunk = next(chunks, None)
+        if chunk is None:
+            return None
+        if limit:
+            chunk = chunk.iloc[:limit - processed_count]
+
+        with self.metrics.timer('ingest_stage_seconds', stage='decode'):
+            cols = decode_chunk(chunk)
+            symbols, inverse = np.unique(cols['symbol'], return_inverse=True)
+            partition_of = np.array([symbol_partition(symbol, self.history_writers) for symbol in symbols.tolist()])
+            row_partition = partition_of[inverse]
+            history_parts = [
+                history_rows({name: values[row_partition == partition] for name, values in cols.items()})
+                for partition in range(self.history_writers)
+            ]
+
+        with self.metrics.timer('ingest_stage_seconds', stage='state'):
+            if state:
+                state.apply_columns(cols)
+                pending = PendingWrites()
+                state.maybe_flush(pending)
+                active_writes = pending.calls
+            else:
+                events = list(zip(cols['action'].tolist(), cols['order_id'].tolist(), cols['symbol'].tolist(),
+                                  cols['operation'].tolist(), cols['price'].tolist(), cols['volume'].tolist(),
+                                  cols['timestamp'].tolist()))
+                active_writes = [('apply_events', (events,))]
+        return len(chunk), history_parts, active_writes
+
+    async def _write_history(self, queue):
+        while True:
+            rows = await queue.get()
+            if rows is None:
+                return
+            await self.db.insert_history_batch(rows)
+
+    async def _write_active(self, queue):
+        while True:
+            write = await queue.get()
+            if write is None:
+                return
+            method, args = write
+            await getattr(self.db, method)(*args)
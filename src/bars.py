@@ -0,0 +1,135 @@
+import logging
+import re
+import numpy as np
+import pandas as pd
+from .encoding import NS_PER_MS, moments_to_ns, ns_to_moments
+
+logger = logging.getLogger(__name__)
+
+PERIOD_UNITS_MS = {'s': 1000, 'm': 60000, 'h': 3600000}
+
+# Окно, в котором ищется вторая сторона сделки с тем же id_deal
+DEDUP_WINDOW_MS = 60000
+
+OPEN, HIGH, LOW, CLOSE, VOLUME, TURNOVER, TRADES = range(7)
+
+
+def period_ms(period: str) -> int:
+    """Длина бара: '1s', '1m', '5m', '1h' -> миллисекунды"""
+    match = re.fullmatch(r'(\d+)([smh])', period)
+    if not match or int(match.group(1)) <= 0:
+        raise ValueError(f"Unknown bar period: {period}")
+    return int(match.group(1)) * PERIOD_UNITS_MS[match.group(2)]
+
+
+class BarAggregator:
+    """Бары OHLCV по сделкам (action 2) для нескольких длительностей, по мере загрузки.
+
+    Сделка приходит двумя событиями (покупатель и продавец) с одним id_deal и
+    учитывается один раз, по цене сделки price_deal. Бар закрывается, когда в потоке
+    появилось событие после его конца; закрытые бары пишутся через upsert_bars, который
+    складывает частичные бары одного интервала, поэтому незакрытые бары можно сбрасывать
+    в любой момент (flush). VWAP = turnover / volume. Нужен формат CSV с 10 колонками.
+    """
+
+    def __init__(self, periods=('1s', '1m', '5m'), dedup_window_ms: int = DEDUP_WINDOW_MS):
+        self.periods = [(period, period_ms(period)) for period in periods]
+        self.dedup_window_ms = dedup_window_ms
+        self.reset()
+
+    def reset(self):
+        # (период, инструмент, начало в мс) -> [open, high, low, close, volume, turnover, trades]
+        self.bars = {}
+        self.watermark = None
+        self._seen_ids = np.empty(0, dtype=np.int64)
+        self._seen_ms = np.empty(0, dtype=np.int64)
+        self._warned = False
+
+    def apply_columns(self, cols: dict):
+        if 'deal_id' not in cols:
+            if not self._warned:
+                logger.warning("Bars require id_deal and price_deal (10-column CSV), skipping")
+                self._warned = True
+            return
+        if len(cols['timestamp']):
+            # Бары закрываются по времени любых событий, не только сделок
+            last_ms = int(moments_to_ns(cols['timestamp'].max())) // NS_PER_MS
+            self.watermark = last_ms if self.watermark is None else max(self.watermark, last_ms)
+        trades = np.flatnonzero((cols['action'] == 2) & (cols['deal_id'] != 0))
+        if not len(trades):
+            return
+
+        deal_ids = cols['deal_id'][trades]
+        epoch_ms = moments_to_ns(cols['timestamp'][trades]) // NS_PER_MS
+        # Первое событие каждой сделки в порции, если сделка не встречалась в прошлых порциях
+        _, first = np.unique(deal_ids, return_index=True)
+        first = first[~np.isin(deal_ids[first], self._seen_ids)]
+        first.sort()
+        if not len(first):
+            return
+        self._remember(deal_ids[first], epoch_ms[first])
+
+        rows = trades[first]
+        price = cols['deal_price'][rows]
+        price = np.where(np.isnan(price), cols['price'][rows], price)
+        volume = cols['volume'][rows]
+        self._merge(cols['symbol'][rows], epoch_ms[first], price, volume)
+
+    def _remember(self, deal_ids, epoch_ms):
+        seen_ids = np.concatenate([self._seen_ids, deal_ids])
+        seen_ms = np.concatenate([self._seen_ms, epoch_ms])
+        keep = seen_ms >= seen_ms.max() - self.dedup_window_ms
+        self._seen_ids, self._seen_ms = seen_ids[keep], seen_ms[keep]
+
+    def _merge(self, symbols, epoch_ms, price, volume):
+        for period, length in self.periods:
+            frame = pd.DataFrame({
+                'symbol': symbols,
+                'start': epoch_ms // length * length,
+                'price': price,
+                'volume': volume,
+                'turnover': price * volume,
+            })
+            grouped = frame.groupby(['symbol', 'start'], sort=False).agg(
+                open=('price', 'first'), high=('price', 'max'), low=('price', 'min'), close=('price', 'last'),
+                volume=('volume', 'sum'), turnover=('turnover', 'sum'), trades=('price', 'size'),
+            )
+            for (symbol, start), open_, high, low, close, bar_volume, turnover, count in zip(
+                    grouped.index, *(grouped[name].tolist() for name in grouped.columns)):
+                key = (period, symbol, start)
+                bar = self.bars.get(key)
+                if bar is None:
+                    self.bars[key] = [open_, high, low, close, bar_volume, turnover, count]
+                else:
+                    bar[HIGH] = max(bar[HIGH], high)
+                    bar[LOW] = min(bar[LOW], low)
+                    bar[CLOSE] = close
+                    bar[VOLUME] += bar_volume
+                    bar[TURNOVER] += turnover
+                    bar[TRADES] += count
+
+    def closed_bars(self):
+        """Ключи баров, конец которых не позже последнего события"""
+        if self.watermark is None:
+            return []
+        lengths = dict(self.periods)
+        return [key for key in self.bars if key[2] + lengths[key[0]] <= self.watermark]
+
+    def maybe_flush(self, db):
+        """Записывает закрытые бары"""
+        self._write(db, self.closed_bars())
+
+    def flush(self, db):
+        """Записывает все бары, включая незакрытые (их продолжение сложится с ними в БД)"""
+        self._write(db, list(self.bars))
+
+    def _write(self, db, keys):
+        if not keys:
+            return
+        starts = ns_to_moments(np.array([key[2] for key in keys], dtype=np.int64) * NS_PER_MS).tolist()
+        rows = []
+        for key, start in zip(keys, starts):
+            period, symbol, _ = key
+            open_, high, low, close, volume, turnover, trades = self.bars.pop(key)
+            rows.append((symbol, period, start, open_, high, low, close, int(volume), float(turnover), int(trades)))
+        db.upsert_bars(rows)
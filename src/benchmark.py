@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+import numpy as np
+from src.db import ColumnarDB, PostgresDB, SQLiteDB
+from src.engine import OrderBookEngine
+from src.generator import TickGenerator, add_generator_arguments, generator_options
+from src.metrics import MetricsRegistry
+from src.processor import TickDataProcessor, decode_chunk, history_rows, read_csv_chunks
+
+logger = logging.getLogger(__name__)
+
+
+def load_history_rows(csv_file, limit=None):
+    """Строки order_history из CSV без записи в БД"""
+    rows = []
+    for chunk in read_csv_chunks(csv_file, 50000, typed=True):
+        rows.extend(history_rows(decode_chunk(chunk)))
+        if limit and len(rows) >= limit:
+            return rows[:limit]
+    return rows
+
+
+def benchmark_history_insert(db, rows, batch_size):
+    db.clear_tables()
+    started = time.perf_counter()
+    for start in range(0, len(rows), batch_size):
+        db.insert_history_batch(rows[start:start + batch_size])
+    return time.perf_counter() - started
+
+
+def compare_copy_and_insert(csv_file, batch_size=50000, repeats=3):
+    logger.info(f"=== order_history: COPY vs INSERT, batch {batch_size} ===")
+
+    rows = load_history_rows(csv_file)
+    results = {}
+    for use_copy in (False, True):
+        db = PostgresDB(use_copy=use_copy, copy_batch_size=batch_size)
+        db.create_tables()
+        elapsed = min(benchmark_history_insert(db, rows, batch_size) for _ in range(repeats))
+        db.clear_tables()
+        db.close()
+
+        name = 'COPY' if use_copy else 'INSERT'
+        results[name] = len(rows) / elapsed
+        logger.info(f"  {name}: {len(rows)} rows in {elapsed:.3f}s, {results[name]:.0f} rows/sec")
+
+    logger.info(f"  COPY speedup: {results['COPY'] / results['INSERT']:.1f}x")
+    return results
+
+
+BACKENDS = ('sqlite', 'sqlite-ingest', 'columnar', 'postgres')
+# Бэкенды, которые обслуживают чтение из других потоков во время загрузки
+STRESS_BACKENDS = ('sqlite', 'sqlite-ingest', 'postgres')
+READER_QUERIES = ('get_best_prices', 'get_depth', 'get_symbols_summary')
+
+# Режимы загрузки: параметры process_csv_file и движок в памяти
+MODES = {
+    'rows': ({'vectorized': False}, False),
+    'vectorized': ({'vectorized': True}, False),
+    'coalesce': ({'vectorized': True, 'coalesce': True}, False),
+    'engine': ({'vectorized': True}, True),
+}
+
+
+def open_backend(backend, work_dir, readers=0):
+    """БД для замера; readers > 0 - с подключениями для потоков-читателей"""
+    if backend == 'sqlite':
+        return SQLiteDB(os.path.join(work_dir, 'bench.db'), concurrent_reads=bool(readers))
+    if backend == 'sqlite-ingest':
+        return SQLiteDB(os.path.join(work_dir, 'bench.db'), profile='ingest', concurrent_reads=bool(readers))
+    if backend == 'columnar':
+        return ColumnarDB(os.path.join(work_dir, 'columnar'))
+    if backend == 'postgres':
+        return PostgresDB(read_max_conn=readers)
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def database_size(backend, db, work_dir):
+    if backend == 'postgres':
+        conn = db.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT pg_total_relation_size('order_history') + pg_total_relation_size('active_orders')")
+                return cursor.fetchone()[0]
+        finally:
+            db.return_connection(conn)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(work_dir) for name in names)
+
+
+def latency_summary(samples):
+    if not samples:
+        return {'p50_ms': None, 'p99_ms': None, 'count': 0}
+    return {'p50_ms': float(np.percentile(samples, 50)), 'p99_ms': float(np.percentile(samples, 99)), 'count': len(samples)}
+
+
+def latency_ms(call, arguments):
+    samples = []
+    for args in arguments:
+        started = time.perf_counter()
+        call(*args)
+        samples.append((time.perf_counter() - started) * 1000)
+    return latency_summary(samples)
+
+
+def run_case(csv_file, backend, mode, batch_size=50000, queries=1000, seed=0, profile=None):
+    """Один замер: загрузка файла и запросы; выполняется в отдельном процессе ради пикового RSS"""
+    process_kwargs, use_engine = MODES[mode]
+    work_dir = tempfile.mkdtemp(prefix='tick-bench-')
+    try:
+        db = open_backend(backend, work_dir)
+        db.create_tables()
+        metrics = MetricsRegistry()
+        processor = TickDataProcessor(db, OrderBookEngine() if use_engine else None, metrics=metrics)
+        stats = processor.process_csv_file(csv_file, batch_size=batch_size, profile=profile, **process_kwargs)
+        # Разбивка времени загрузки по этапам и вызовам БД (без запросов ниже)
+        ingest_metrics = metrics.snapshot()
+
+        rng = random.Random(seed)
+        symbols = sorted({row['symbol'] for row in db.get_symbols_summary()}) or ['']
+        result = {
+            'backend': backend,
+            'mode': mode,
+            'batch_size': batch_size,
+            'events': stats['processed'],
+            'elapsed_sec': stats['elapsed'],
+            'events_per_sec': stats['events_per_sec'],
+            'get_best_prices': latency_ms(processor.get_best_prices, [(rng.choice(symbols),) for _ in range(queries)]),
+            'get_symbols_summary': latency_ms(db.get_symbols_summary, [()] * max(queries // 100, 5)),
+            'metrics': ingest_metrics,
+        }
+        if backend == 'postgres':
+            result['db_size_bytes'] = database_size(backend, db, work_dir)
+            db.close()
+        else:
+            db.close()
+            result['db_size_bytes'] = database_size(backend, db, work_dir)
+        result['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        return result
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _read_loop(db, symbols, seed, stop, samples, errors):
+    rng = random.Random(seed)
+    # Запросы к пустым таблицам до первой порции исказили бы задержки
+    while not stop.is_set() and not db.get_active_orders_count():
+        time.sleep(0.001)
+    while not stop.is_set():
+        query = rng.choice(READER_QUERIES)
+        started = time.perf_counter()
+        try:
+            if query == 'get_symbols_summary':
+                db.get_symbols_summary()
+            else:
+                getattr(db, query)(rng.choice(symbols))
+        except Exception as error:
+            if not errors:
+                logger.error(f"Reader query {query} failed: {error}")
+            errors.append(query)
+            continue
+        samples[query].append((time.perf_counter() - started) * 1000)
+
+
+def stress_run(csv_file, backend, readers, symbols, mode='vectorized', batch_size=50000, seed=0):
+    """Загрузка файла, пока readers потоков без пауз выполняют запросы к той же БД"""
+    process_kwargs, use_engine = MODES[mode]
+    work_dir = tempfile.mkdtemp(prefix='tick-stress-')
+    stop = threading.Event()
+    samples = {query: [] for query in READER_QUERIES}
+    errors = []
+    try:
+        db = open_backend(backend, work_dir, readers)
+        # Подключение записи открывается в этом потоке до старта читателей
+        db.create_tables()
+        processor = TickDataProcessor(db, OrderBookEngine() if use_engine else None, metrics=MetricsRegistry())
+        threads = [
+            threading.Thread(target=_read_loop, args=(db, symbols, seed + index, stop, samples, errors), daemon=True)
+            for index in range(readers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            stats = processor.process_csv_file(csv_file, batch_size=batch_size, **process_kwargs)
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
+        db.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {
+        'events_per_sec': stats['events_per_sec'],
+        'reads': {query: latency_summary(values) for query, values in samples.items()},
+        'read_errors': len(errors),
+    }
+
+
+def run_stress(csv_file, backend='sqlite-ingest', readers=4, mode='vectorized', batch_size=50000, seed=0, output=None):
+    """Задержки чтения во время загрузки и падение скорости загрузки относительно загрузки без читателей"""
+    logger.info(f"=== Stress: {backend}/{mode}, {readers} readers ===")
+    chunks = read_csv_chunks(csv_file, batch_size, typed=True)
+    symbols = sorted(set(next(chunks)['symbol'].tolist()))
+    chunks.close()
+
+    baseline = stress_run(csv_file, backend, 0, symbols, mode, batch_size, seed)
+    loaded = stress_run(csv_file, backend, readers, symbols, mode, batch_size, seed)
+    slowdown = 1 - loaded['events_per_sec'] / baseline['events_per_sec'] if baseline['events_per_sec'] else None
+    result = {
+        'backend': backend,
+        'mode': mode,
+        'readers': readers,
+        'batch_size': batch_size,
+        'baseline_events_per_sec': baseline['events_per_sec'],
+        'events_per_sec': loaded['events_per_sec'],
+        'write_slowdown': slowdown,
+        'reads': loaded['reads'],
+        'read_errors': loaded['read_errors'],
+    }
+    # Без базовой скорости (пустой файл) замедление не определено
+    slowdown_text = f"{slowdown:.1%} slower" if slowdown is not None else "slowdown n/a"
+    logger.info(f"  Ingest: {baseline['events_per_sec']:.0f} -> {loaded['events_per_sec']:.0f} events/sec "
+                f"({slowdown_text}), read errors: {loaded['read_errors']}")
+    for query, latency in loaded['reads'].items():
+        if latency['count']:
+            logger.info(f"  {query}: {latency['count']} reads, p50/p99 {latency['p50_ms']:.3f}/{latency['p99_ms']:.3f} ms")
+    if output:
+        with open(output, 'w') as f:
+            json.dump(result, f, indent=2)
+        logger.info(f"Results saved: {output}")
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(csv_file, backends=('sqlite', 'columnar'), modes=('vectorized', 'coalesce', 'engine'), batch_size=50000,
+              queries=1000, output='benchmark.json', seed=0, generator=None, profile_dir=None):
+    logger.info(f"=== Benchmark suite: {csv_file} ===")
+    results = []
+    for backend in backends:
+        for mode in modes:
+            # Новый процесс на каждый замер: RSS и кэши не переходят между замерами
+            with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                profile = os.path.join(profile_dir, f'{backend}_{mode}.folded') if profile_dir else None
+                result = executor.submit(run_case, csv_file, backend, mode, batch_size, queries, seed, profile).result()
+            results.append(result)
+            logger.info(f"  {backend}/{mode}: {result['events_per_sec']:.0f} events/sec, "
+                        f"RSS {result['peak_rss_bytes'] / 2**20:.0f} MB, DB {result['db_size_bytes'] / 2**20:.1f} MB, "
+                        f"best prices p50/p99 {result['get_best_prices']['p50_ms']:.3f}/"
+                        f"{result['get_best_prices']['p99_ms']:.3f} ms")
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'csv_file': os.path.abspath(csv_file),
+        # Параметры синтетического файла, если он сгенерирован для замера
+        'generator': generator,
+        'results': results,
+    }
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Results saved: {output}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Замеры производительности')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('copy', help='COPY и INSERT для order_history (PostgreSQL)')
+    suite = commands.add_parser('suite', help='Загрузка и запросы по бэкендам и режимам')
+    suite.add_argument('--csv', help='Файл с событиями; без него генерируется синтетический')
+    suite.add_argument('--events', type=int, default=1000000)
+    suite.add_argument('--columns', type=int, choices=(7, 10), default=10)
+    # --seed задаёт и генератор, и выбор инструментов в запросах
+    add_generator_arguments(suite)
+    suite.add_argument('--backends', nargs='+', choices=BACKENDS, default=['sqlite', 'columnar'])
+    suite.add_argument('--modes', nargs='+', choices=list(MODES), default=['vectorized', 'coalesce', 'engine'])
+    suite.add_argument('--batch-size', type=int, default=50000)
+    suite.add_argument('--queries', type=int, default=1000)
+    suite.add_argument('--output', default='benchmark.json')
+    suite.add_argument('--profile-dir', help='Каталог для свёрнутых стеков профилировщика по каждому замеру')
+    stress = commands.add_parser('stress', help='Чтение из нескольких потоков во время загрузки')
+    stress.add_argument('--csv', default='resources/20241001_fut_ord_50k.csv')
+    stress.add_argument('--backend', choices=STRESS_BACKENDS, default='sqlite-ingest')
+    stress.add_argument('--readers', type=int, default=4)
+    stress.add_argument('--mode', choices=list(MODES), default='vectorized')
+    stress.add_argument('--batch-size', type=int, default=50000)
+    stress.add_argument('--seed', type=int, default=0)
+    stress.add_argument('--output')
+    args = parser.parse_args()
+
+    if args.command == 'stress':
+        run_stress(args.csv, args.backend, args.readers, args.mode, args.batch_size, args.seed, args.output)
+        return
+
+    if args.command != 'suite':
+        csv_file = "resources/20241001_fut_ord_50k.csv"
+        if not os.path.exists(csv_file):
+            logger.error(f"File not found: {csv_file}")
+        else:
+            compare_copy_and_insert(csv_file)
+        return
+
+    generated_dir = generator = None
+    csv_file = args.csv
+    if csv_file is None:
+        generated_dir = tempfile.mkdtemp(prefix='tick-bench-')
+        csv_file = os.path.join(generated_dir, f'synthetic_{args.events}.csv')
+        options = generator_options(args)
+        generator = {'events': args.events, 'columns': args.columns, **options}
+        TickGenerator(**options).write_csv(csv_file, args.events, args.columns)
+    try:
+        if args.profile_dir:
+            os.makedirs(args.profile_dir, exist_ok=True)
+        run_suite(csv_file, args.backends, args.modes, args.batch_size, args.queries, args.output, args.seed, generator,
+                  args.profile_dir)
+    finally:
+        if generated_dir:
+            shutil.rmtree(generated_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import logging
+import os
+import struct
+import numpy as np
+import pandas as pd
+from .encoding import PRICE_SCALE, price_to_ticks
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'TICKLOG\x00'
+VERSION = 1
+# magic, версия, число колонок исходного CSV (7 или 10), число записей, смещение и длина словарей
+HEADER = struct.Struct('<8sIIQQQ')
+HEADER_SIZE = 64
+
+# Запись события фиксированной длины без выравнивания (54 байта)
+RECORD_DTYPE = np.dtype([
+    ('symbol', '<u4'),
+    ('operation', 'u1'),
+    ('action', 'i1'),
+    ('timestamp', '<i8'),
+    ('order_id', '<i8'),
+    ('price', '<i8'),
+    ('volume', '<i8'),
+    ('deal_id', '<i8'),
+    ('deal_price', '<i8'),
+])
+
+# Цена сделки отсутствует (NaN в CSV)
+NO_PRICE = np.iinfo(np.int64).min
+
+
+def is_binary_log(path: str) -> bool:
+    """Файл начинается с сигнатуры двоичного журнала"""
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class BinaryLogWriter:
+    """Запись событий в двоичный журнал: заголовок, записи RECORD_DTYPE, словари инструментов и сторон (JSON).
+
+    Инструменты и стороны хранятся кодами, цены - целым числом шагов 1e-5, время - меткой
+    YYYYMMDDHHMMSSmmm как в CSV. Словари пишутся в конец файла при close(), поэтому
+    журнал пишется потоком порций.
+    """
+
+    def __init__(self, path: str, columns: int = 10):
+        self.path = path
+        self.columns = columns
+        self.count = 0
+        self.symbols = {}
+        self.operations = {}
+        self._file = open(path, 'wb')
+        self._file.write(b'\0' * HEADER_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    @staticmethod
+    def _codes(values, dictionary):
+        codes, uniques = pd.factorize(values)
+        mapping = np.array([dictionary.setdefault(value, len(dictionary)) for value in uniques.tolist()],
+                           dtype=np.int64)
+        return mapping[codes] if len(mapping) else codes
+
+    def write_columns(self, cols: dict):
+        """Порция событий в виде колонок (см. decode_chunk)"""
+        records = np.zeros(len(cols['order_id']), dtype=RECORD_DTYPE)
+        records['symbol'] = self._codes(cols['symbol'], self.symbols)
+        records['operation'] = self._codes(cols['operation'], self.operations)
+        records['action'] = cols['action']
+        records['timestamp'] = cols['timestamp']
+        records['order_id'] = cols['order_id']
+        records['price'] = price_to_ticks(cols['price'])
+        records['volume'] = cols['volume']
+        if 'deal_id' in cols:
+            records['deal_id'] = cols['deal_id']
+            deal_price = cols['deal_price']
+            records['deal_price'] = np.where(np.isnan(deal_price), NO_PRICE, price_to_ticks(np.nan_to_num(deal_price)))
+        else:
+            records['deal_price'] = NO_PRICE
+        self._file.write(records.tobytes())
+        self.count += len(records)
+
+    def close(self):
+        if self._file.closed:
+            return
+        if len(self.operations) > 255:
+            raise ValueError(f"Too many distinct operations for a one-byte code: {len(self.operations)}")
+        footer = json.dumps({'symbols': list(self.symbols), 'operations': list(self.operations)}).encode()
+        footer_offset = HEADER_SIZE + self.count * RECORD_DTYPE.itemsize
+        self._file.write(footer)
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, self.columns, self.count, footer_offset, len(footer)))
+        self._file.close()
+
+
+class BinaryLogReader:
+    """Чтение двоичного журнала через memmap: порции колонок для TickDataProcessor.process_columns без разбора текста"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"Not a tick binary log: {path}")
+            _, version, self.columns, self.count, footer_offset, footer_length = HEADER.unpack_from(header)
+            if version != VERSION:
+                raise ValueError(f"Unsupported tick binary log version {version}: {path}")
+            f.seek(footer_offset)
+            footer = json.loads(f.read(footer_length))
+        self.symbols = np.array(footer['symbols'], dtype=object)
+        self.operations = np.array(footer['operations'], dtype=object)
+        if self.count:
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(self.count,))
+        else:
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self):
+        return self.count
+
+    def columns_at(self, start: int, stop: int) -> dict:
+        records = self.records[start:stop]
+        cols = {
+            'symbol': self.symbols[records['symbol']],
+            'operation': self.operations[records['operation']],
+            'timestamp': np.array(records['timestamp']),
+            'order_id': np.array(records['order_id']),
+            'action': np.array(records['action']),
+            'price': records['price'] / PRICE_SCALE,
+            'volume': np.array(records['volume']),
+        }
+        if self.columns == 10:
+            cols['deal_id'] = np.array(records['deal_id'])
+            deal_price = records['deal_price']
+            cols['deal_price'] = np.where(deal_price == NO_PRICE, np.nan, deal_price / PRICE_SCALE)
+        return cols
+
+    def chunks(self, batch_size: int = 50000, limit: int = None):
+        end = min(self.count, limit) if limit else self.count
+        for start in range(0, end, batch_size):
+            yield self.columns_at(start, min(start + batch_size, end))
+
+
+def convert_csv(csv_file, output: str, batch_size: int = 500000):
+    """CSV (7 или 10 колонок; файл, каталог, маска, сжатые файлы) -> двоичный журнал; возвращает число событий"""
+    # processor импортирует этот модуль
+    from .processor import decode_chunk, read_csv_chunks
+
+    writer = None
+    try:
+        for chunk in read_csv_chunks(csv_file, batch_size, typed=True):
+            columns = 10 if 'id_deal' in chunk else 7
+            if writer is None:
+                writer = BinaryLogWriter(output, columns)
+            elif writer.columns != columns:
+                raise ValueError(f"Mixed CSV layouts in {csv_file}: {writer.columns} and {columns} columns")
+            writer.write_columns(decode_chunk(chunk))
+            logger.info(f"Converted: {writer.count}")
+    finally:
+        if writer is None:
+            writer = BinaryLogWriter(output)
+        writer.close()
+    return writer.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Преобразование CSV в двоичный журнал событий')
+    parser.add_argument('csv', nargs='+', help='Файлы, каталоги или маски')
+    parser.add_argument('output')
+    parser.add_argument('--batch-size', type=int, default=500000)
+    args = parser.parse_args()
+
+    count = convert_csv(args.csv, args.output, args.batch_size)
+    logger.info(f"Written {count} events ({os.path.getsize(args.output)} bytes): {args.output}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
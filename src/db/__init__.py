@@ -1,5 +1,8 @@
 from .base import DBInterface
+from .columnar import ColumnarDB
+from .instrumented import InstrumentedDB
 from .postgres import PostgresDB
+from .postgres_async import AsyncPostgresDB
 from .sqlite import SQLiteDB
 
-__all__ = ['DBInterface', 'PostgresDB', 'SQLiteDB'] 
\ No newline at end of file
+__all__ = ['DBInterface', 'AsyncPostgresDB', 'ColumnarDB', 'InstrumentedDB', 'PostgresDB', 'SQLiteDB']
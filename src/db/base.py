@@ -1,6 +1,25 @@
+import contextlib
 from abc import ABC, abstractmethod
+from ..encoding import MS_PER_DAY, NS_PER_MS, moment_day, moments_to_ns, ns_to_moments, price_to_ticks, ticks_to_price
+from ..engine import best_order_key
+
+# Необязательные возможности бэкенда и их методы: без своей реализации метод бросает NotImplementedError
+OPTIONAL_METHODS = {
+    'checkpoints': ('insert_checkpoint', 'get_checkpoint'),
+    'retention': ('history_days', 'drop_history_before', 'export_history'),
+    'bars': ('upsert_bars', 'get_bars'),
+    'flow_metrics': ('upsert_flow_metrics', 'get_flow_metrics'),
+    'ingest_progress': ('get_ingest_progress', 'save_ingest_progress'),
+}
+
 
 class DBInterface(ABC):
+    """Хранилище событий и активных заявок.
+
+    Обязательны загрузка, active_orders и запросы книги (абстрактные методы);
+    возможности из OPTIONAL_METHODS бэкенд реализует по желанию, supports() говорит, есть ли они.
+    """
+
     @abstractmethod
     def create_tables(self):
         pass
@@ -13,6 +32,10 @@ class DBInterface(ABC):
     def clear_tables(self):
         pass
 
+    def batch(self):
+        """Одна транзакция на порцию событий (контекстный менеджер); по умолчанию каждая операция фиксируется сама"""
+        return contextlib.nullcontext(self)
+
     @abstractmethod
     def insert_history_batch(self, batch):
         pass
@@ -29,10 +52,34 @@ class DBInterface(ABC):
     def delete_active_order(self, order_id):
         pass
 
+    @abstractmethod
+    def insert_active_orders_batch(self, orders):
+        pass
+
+    @abstractmethod
+    def process_trades_batch(self, trades):
+        pass
+
+    @abstractmethod
+    def delete_active_orders_batch(self, order_ids):
+        pass
+
+    @abstractmethod
+    def apply_active_changes(self, inserts, trades, deletes):
+        pass
+
+    @abstractmethod
+    def replace_active_orders(self, orders):
+        pass
+
     @abstractmethod
     def get_active_orders_count(self):
         pass
 
+    @abstractmethod
+    def get_active_orders(self):
+        pass
+
     @abstractmethod
     def get_active_orders_sample(self, limit=10):
         pass
@@ -45,6 +92,134 @@ class DBInterface(ABC):
     def get_best_prices(self, symbol: str, timestamp: int = None):
         pass
 
+    @abstractmethod
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        pass
+
+    def insert_checkpoint(self, timestamp, orders):
+        self._unsupported('checkpoints')
+
+    def get_checkpoint(self, symbol: str, timestamp: int):
+        self._unsupported('checkpoints')
+
+    @abstractmethod
+    def get_history_range(self, symbol: str, from_ts: int, to_ts: int):
+        pass
+
+    @abstractmethod
+    def get_all_best_prices(self, timestamp: int = None):
+        pass
+
+    def history_days(self):
+        """Торговые дни YYYYMMDD, за которые есть история, по возрастанию"""
+        self._unsupported('retention')
+
+    def drop_history_before(self, day: int):
+        """Удаляет историю и снимки книги дней раньше day (YYYYMMDD); возвращает удалённые дни"""
+        self._unsupported('retention')
+
+    def export_history(self, from_ts: int, to_ts: int, batch_size: int = 100000):
+        """Порции строк истории за [from_ts, to_ts] в порядке записи, в формате insert_history_batch"""
+        self._unsupported('retention')
+
+    @staticmethod
+    def group_best_prices(rows, timestamp):
+        """Строки (symbol, operation B/S, order_id, price, remaining_volume, order_timestamp) -> {symbol: результат
+        get_best_prices}. На сторону может прийти несколько строк: остаётся лучшая по best_order_key"""
+        result = {}
+        best_keys = {}
+        for symbol, operation, order_id, price, remaining_volume, order_timestamp in rows:
+            prices = result.setdefault(symbol, {
+                'symbol': symbol,
+                'timestamp': timestamp,
+                'max_buy_price': None,
+                'min_sell_price': None
+            })
+            key = best_order_key(operation, price, order_timestamp, order_id)
+            if (symbol, operation) in best_keys and best_keys[symbol, operation] <= key:
+                continue
+            best_keys[symbol, operation] = key
+            side_name, side = ('BUY', 'max_buy_price') if operation == 'B' else ('SELL', 'min_sell_price')
+            prices[side] = {'operation': side_name, 'order_id': order_id, 'price': price, 'remaining_volume': remaining_volume}
+        return result
+
+    @staticmethod
+    def group_depth(rows, symbol, timestamp):
+        """Строки (operation B/S, price, volume, orders) от лучшей цены -> результат get_depth"""
+        depth = {'symbol': symbol, 'timestamp': timestamp, 'bids': [], 'asks': []}
+        for operation, price, volume, orders in rows:
+            depth['bids' if operation == 'B' else 'asks'].append({'price': price, 'volume': volume, 'orders': orders})
+        return depth
+
+    @staticmethod
+    def encode_history_rows(batch, symbol_ids):
+        """Строки order_history -> строки компактной схемы (symbol_id, operation, timestamp_ns, order_id, action_type, цена в шагах, volume)"""
+        symbols, operations, timestamps, order_ids, actions, prices, volumes = zip(*batch)
+        return list(zip([symbol_ids[symbol] for symbol in symbols], operations, moments_to_ns(timestamps).tolist(),
+                        order_ids, actions, price_to_ticks(prices).tolist(), volumes))
+
+    @staticmethod
+    def decode_history_rows(rows, symbol):
+        """Строки компактной схемы одного инструмента -> строки get_history_range"""
+        if not rows:
+            return []
+        _, operations, timestamps, order_ids, actions, prices, volumes = zip(*rows)
+        return [
+            {
+                'symbol': symbol,
+                'operation': operation,
+                'timestamp': timestamp,
+                'order_id': order_id,
+                'action_type': action_type,
+                'price': price,
+                'volume': volume,
+            }
+            for operation, timestamp, order_id, action_type, price, volume in zip(
+                operations, ns_to_moments(timestamps).tolist(), order_ids, actions,
+                ticks_to_price(prices).tolist(), volumes)
+        ]
+
+    @staticmethod
+    def decode_export_rows(rows):
+        """Строки компактной схемы (symbol, operation, timestamp_ns, order_id, action_type, цена в шагах, volume) -> строки истории"""
+        if not rows:
+            return []
+        symbols, operations, timestamps, order_ids, actions, prices, volumes = zip(*rows)
+        return list(zip(symbols, operations, ns_to_moments(timestamps).tolist(), order_ids, actions,
+                        ticks_to_price(prices).tolist(), volumes))
+
+    @staticmethod
+    def epoch_days_to_days(epoch_days):
+        """Номера суток от эпохи -> дни YYYYMMDD"""
+        return moment_day(ns_to_moments([day * MS_PER_DAY * NS_PER_MS for day in epoch_days])).tolist()
+
+    def upsert_bars(self, rows):
+        """Строки (symbol, period, timestamp, open, high, low, close, volume, turnover, trades); существующий бар дополняется"""
+        self._unsupported('bars')
+
+    def get_bars(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        self._unsupported('bars')
+
+    def upsert_flow_metrics(self, rows):
+        """Строки (symbol, period, metric, timestamp, value); значение того же интервала заменяется"""
+        self._unsupported('flow_metrics')
+
+    def get_flow_metrics(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        self._unsupported('flow_metrics')
+
+    def get_ingest_progress(self, source: str):
+        self._unsupported('ingest_progress')
+
+    def save_ingest_progress(self, source: str, byte_offset: int, last_timestamp: int, last_order_id: int, processed: int):
+        self._unsupported('ingest_progress')
+
     @abstractmethod
     def close(self):
-        pass 
\ No newline at end of file
+        pass
+
+    def supports(self, capability: str) -> bool:
+        """Бэкенд реализует все методы возможности capability из OPTIONAL_METHODS"""
+        return all(getattr(type(self), name) is not getattr(DBInterface, name) for name in OPTIONAL_METHODS[capability])
+
+    def _unsupported(self, capability):
+        raise NotImplementedError(f"{type(self).__name__} does not support {capability}")
@@ -0,0 +1,488 @@
+import json
+import os
+import shutil
+import numpy as np
+from .base import DBInterface
+from ..encoding import LATEST_MOMENT, moment_day, price_to_ticks, ticks_to_price
+from ..engine import OrderBookEngine, OPERATION, PRICE, REMAINING_VOLUME, TIMESTAMP
+
+# Колонки истории: имя -> тип на диске
+HISTORY_COLUMNS = {
+    'timestamp': np.int64,
+    'order_id': np.int64,
+    'price': np.int64,
+    'volume': np.int32,
+    'action_type': np.int8,
+    'operation': np.uint8,
+}
+
+ACTIVE_ORDERS_FILE = 'active_orders.npz'
+SYMBOLS_FILE = 'symbols.json'
+PROGRESS_FILE = 'ingest_progress.json'
+# Бары дописываются строками JSON; строки одного бара складываются при чтении
+BARS_FILE = 'bars.jsonl'
+# Метрики потока тоже дописываются строками; последняя строка интервала заменяет прежние
+FLOW_METRICS_FILE = 'flow_metrics.jsonl'
+UNSORTED_MARKER = 'unsorted'
+
+
+class ColumnarDB(DBInterface):
+    """Колоночное хранилище на файлах: история по дням и инструментам, чтение через memmap.
+
+    order_history лежит в base_dir/history/<YYYYMMDD>/<код инструмента>/<колонка>.bin и
+    дописывается блоками по block_rows строк. Коды инструментов хранятся в symbols.json,
+    цены - целым числом шагов 1e-5. Активные заявки ведутся в памяти (OrderBookEngine)
+    и сохраняются в active_orders.npz при flush()/close().
+    """
+
+    def __init__(self, base_dir='tick_data_columnar', block_rows=1000000):
+        self.base_dir = base_dir
+        self.block_rows = block_rows
+        self.engine = OrderBookEngine(track_changes=False)
+        # Наибольшее время выставления среди загруженных заявок
+        self._last_timestamp = None
+        self.symbols = []
+        self.symbol_codes = {}
+        self._buffer = {}
+        self._buffered_rows = 0
+        self._checkpoints = []
+        self._progress = {}
+        # (symbol, period, timestamp) -> [open, high, low, close, volume, turnover, trades]
+        self._bars = {}
+        # (symbol, period, timestamp, metric) -> value
+        self._flow_metrics = {}
+
+    def _path(self, *parts):
+        return os.path.join(self.base_dir, *parts)
+
+    def create_tables(self):
+        os.makedirs(self._path('history'), exist_ok=True)
+        os.makedirs(self._path('checkpoints'), exist_ok=True)
+        if os.path.exists(self._path(SYMBOLS_FILE)):
+            with open(self._path(SYMBOLS_FILE)) as f:
+                self.symbols = json.load(f)
+            self.symbol_codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+        if os.path.exists(self._path(PROGRESS_FILE)):
+            with open(self._path(PROGRESS_FILE)) as f:
+                self._progress = json.load(f)
+        self._checkpoints = sorted(
+            tuple(int(part) for part in name[:-len('.npz')].split('_'))
+            for name in os.listdir(self._path('checkpoints'))
+        )
+        self._bars = {}
+        if os.path.exists(self._path(BARS_FILE)):
+            with open(self._path(BARS_FILE)) as f:
+                for line in f:
+                    self._merge_bar(json.loads(line))
+        self._flow_metrics = {}
+        if os.path.exists(self._path(FLOW_METRICS_FILE)):
+            with open(self._path(FLOW_METRICS_FILE)) as f:
+                for line in f:
+                    symbol, period, metric, timestamp, value = json.loads(line)
+                    self._flow_metrics[symbol, period, timestamp, metric] = value
+        self.engine.reset()
+        self._last_timestamp = None
+        if os.path.exists(self._path(ACTIVE_ORDERS_FILE)):
+            self._load(self._load_orders(self._path(ACTIVE_ORDERS_FILE)))
+
+    def create_indexes(self):
+        pass
+
+    def clear_tables(self):
+        for name in ('history', 'checkpoints'):
+            shutil.rmtree(self._path(name), ignore_errors=True)
+        for name in (ACTIVE_ORDERS_FILE, PROGRESS_FILE, BARS_FILE, FLOW_METRICS_FILE):
+            if os.path.exists(self._path(name)):
+                os.remove(self._path(name))
+        self._buffer = {}
+        self._buffered_rows = 0
+        self._progress = {}
+        self.create_tables()
+
+    # --- order_history ---
+
+    def _symbol_code(self, symbol):
+        code = self.symbol_codes.get(symbol)
+        if code is None:
+            code = self.symbol_codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return code
+
+    def insert_history_batch(self, batch):
+        if not batch:
+            return
+        symbols, operations, timestamps, order_ids, actions, prices, volumes = zip(*batch)
+        columns = {
+            'timestamp': np.array(timestamps, dtype=np.int64),
+            'order_id': np.array(order_ids, dtype=np.int64),
+            'price': price_to_ticks(prices),
+            'volume': np.array(volumes, dtype=np.int32),
+            'action_type': np.array(actions, dtype=np.int8),
+            'operation': np.frombuffer(''.join(operations).encode('ascii'), dtype=np.uint8),
+        }
+        codes = np.array([self._symbol_code(symbol) for symbol in symbols], dtype=np.int32)
+        days = moment_day(columns['timestamp'])
+
+        keys = np.stack([days, codes])
+        unique_keys, inverse = np.unique(keys, axis=1, return_inverse=True)
+        inverse = inverse.ravel()
+        for i, (day, code) in enumerate(unique_keys.T.tolist()):
+            positions = np.flatnonzero(inverse == i)
+            self._buffer.setdefault((day, code), []).append(
+                {name: values[positions] for name, values in columns.items()})
+        self._buffered_rows += len(batch)
+        if self._buffered_rows >= self.block_rows:
+            self.flush()
+
+    def flush(self):
+        """Дописывает накопленные блоки истории на диск и сохраняет активные заявки"""
+        for (day, code), parts in self._buffer.items():
+            directory = self._path('history', str(day), str(code))
+            os.makedirs(directory, exist_ok=True)
+            block = {name: np.concatenate([part[name] for part in parts]) for name in HISTORY_COLUMNS}
+            timestamp_path = os.path.join(directory, 'timestamp.bin')
+            previous = self._last_written_timestamp(timestamp_path)
+            if np.any(np.diff(block['timestamp']) < 0) or (previous is not None and block['timestamp'][0] < previous):
+                open(os.path.join(directory, UNSORTED_MARKER), 'w').close()
+            for name, dtype in HISTORY_COLUMNS.items():
+                with open(os.path.join(directory, f'{name}.bin'), 'ab') as f:
+                    f.write(block[name].astype(dtype, copy=False).tobytes())
+        self._buffer = {}
+        self._buffered_rows = 0
+
+        with open(self._path(SYMBOLS_FILE), 'w') as f:
+            json.dump(self.symbols, f)
+        self._save_orders(self._path(ACTIVE_ORDERS_FILE), list(self.engine.iter_orders()))
+
+    @staticmethod
+    def _last_written_timestamp(path):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, 'rb') as f:
+            f.seek(-8, os.SEEK_END)
+            return int(np.frombuffer(f.read(8), dtype=np.int64)[0])
+
+    @staticmethod
+    def _memmap(path, dtype):
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r')
+
+    def scan_history(self, symbol: str, from_ts: int, to_ts: int):
+        """Колонки истории инструмента за [from_ts, to_ts]; для упорядоченных файлов - срезы memmap без копирования"""
+        code = self.symbol_codes.get(symbol)
+        parts = []
+        if code is not None:
+            if self._buffer:
+                self.flush()
+            history_dir = self._path('history')
+            days = sorted(int(day) for day in os.listdir(history_dir))
+            for day in days:
+                if not moment_day(from_ts) <= day <= moment_day(to_ts):
+                    continue
+                directory = os.path.join(history_dir, str(day), str(code))
+                if not os.path.isdir(directory):
+                    continue
+                columns = {name: self._memmap(os.path.join(directory, f'{name}.bin'), dtype)
+                           for name, dtype in HISTORY_COLUMNS.items()}
+                timestamps = columns['timestamp']
+                if os.path.exists(os.path.join(directory, UNSORTED_MARKER)):
+                    selected = np.flatnonzero((timestamps >= from_ts) & (timestamps <= to_ts))
+                    parts.append({name: values[selected] for name, values in columns.items()})
+                else:
+                    start = np.searchsorted(timestamps, from_ts, side='left')
+                    stop = np.searchsorted(timestamps, to_ts, side='right')
+                    parts.append({name: values[start:stop] for name, values in columns.items()})
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in HISTORY_COLUMNS.items()}
+        return {name: np.concatenate([part[name] for part in parts]) for name in HISTORY_COLUMNS}
+
+    def get_history_range(self, symbol: str, from_ts: int, to_ts: int):
+        columns = self.scan_history(symbol, from_ts, to_ts)
+        return [
+            {
+                'symbol': symbol,
+                'operation': chr(operation),
+                'timestamp': timestamp,
+                'order_id': order_id,
+                'action_type': action_type,
+                'price': price,
+                'volume': volume,
+            }
+            for timestamp, order_id, action_type, operation, price, volume in zip(
+                columns['timestamp'].tolist(), columns['order_id'].tolist(), columns['action_type'].tolist(),
+                columns['operation'].tolist(), ticks_to_price(columns['price']).tolist(), columns['volume'].tolist())
+        ]
+
+    def history_days(self):
+        if self._buffer:
+            self.flush()
+        history_dir = self._path('history')
+        return sorted(int(day) for day in os.listdir(history_dir)) if os.path.isdir(history_dir) else []
+
+    def drop_history_before(self, day: int):
+        """Каталоги истории старых дней и файлы снимков удаляются целиком"""
+        dropped = [history_day for history_day in self.history_days() if history_day < day]
+        self.drop_history_days(dropped)
+        for checkpoint_timestamp, checkpoint_id in self._checkpoints:
+            if checkpoint_timestamp < day * 1000000000:
+                os.remove(self._path('checkpoints', f'{checkpoint_timestamp}_{checkpoint_id}.npz'))
+        self._checkpoints = [checkpoint for checkpoint in self._checkpoints if checkpoint[0] >= day * 1000000000]
+        return dropped
+
+    def drop_history_days(self, days):
+        for day in days:
+            shutil.rmtree(self._path('history', str(day)), ignore_errors=True)
+
+    def export_history(self, from_ts: int, to_ts: int, batch_size: int = 100000):
+        """Порции истории по дням; внутри дня строки всех инструментов упорядочены по времени"""
+        for day in self.history_days():
+            if not moment_day(from_ts) <= day <= moment_day(to_ts):
+                continue
+            day_from, day_to = max(from_ts, day * 1000000000), min(to_ts, day * 1000000000 + 235959999)
+            parts = []
+            for symbol in self.symbols:
+                columns = self.scan_history(symbol, day_from, day_to)
+                if len(columns['timestamp']):
+                    parts.append((symbol, columns))
+            if not parts:
+                continue
+            symbols = np.concatenate([np.full(len(part['timestamp']), symbol, dtype=object) for symbol, part in parts])
+            columns = {name: np.concatenate([part[name] for _, part in parts]) for name in HISTORY_COLUMNS}
+            order = np.argsort(columns['timestamp'], kind='stable')
+            rows = list(zip(
+                symbols[order].tolist(), [chr(operation) for operation in columns['operation'][order].tolist()],
+                columns['timestamp'][order].tolist(), columns['order_id'][order].tolist(),
+                columns['action_type'][order].tolist(), ticks_to_price(columns['price'][order]).tolist(),
+                columns['volume'][order].tolist(),
+            ))
+            for start in range(0, len(rows), batch_size):
+                yield rows[start:start + batch_size]
+
+    # --- active_orders ---
+
+    def _seen(self, timestamp):
+        if self._last_timestamp is None or timestamp > self._last_timestamp:
+            self._last_timestamp = timestamp
+
+    def insert_active_order(self, order_id, symbol, operation, price, volume, timestamp):
+        self.engine.insert(order_id, symbol, operation, price, volume, timestamp)
+        self._seen(timestamp)
+
+    def process_trade(self, order_id, trade_volume):
+        self.engine.trade(order_id, trade_volume)
+
+    def delete_active_order(self, order_id):
+        self.engine.delete(order_id)
+
+    def insert_active_orders_batch(self, orders):
+        for order in orders:
+            self.insert_active_order(*order)
+
+    def process_trades_batch(self, trades):
+        for order_id, trade_volume in trades:
+            self.engine.trade(order_id, trade_volume)
+
+    def delete_active_orders_batch(self, order_ids):
+        for order_id in order_ids:
+            self.engine.delete(order_id)
+
+    def apply_active_changes(self, inserts, trades, deletes):
+        self.delete_active_orders_batch(deletes)
+        self._load([order for order in inserts if order[0] not in self.engine.symbol_of])
+        self.process_trades_batch(trades)
+
+    def replace_active_orders(self, orders):
+        self.engine.reset()
+        self._last_timestamp = None
+        self._load(orders)
+
+    def _load(self, orders):
+        self.engine.load(orders)
+        for order in orders:
+            self._seen(order[6])
+
+    def _save_orders(self, path, orders):
+        order_ids, symbols, operations, prices, originals, remainings, timestamps = (
+            zip(*orders) if orders else ([],) * 7)
+        np.savez(
+            path,
+            order_id=np.array(order_ids, dtype=np.int64),
+            symbol=np.array([self._symbol_code(symbol) for symbol in symbols], dtype=np.int32),
+            operation=np.frombuffer(''.join(operations).encode('ascii'), dtype=np.uint8),
+            price=price_to_ticks(prices),
+            original_volume=np.array(originals, dtype=np.int32),
+            remaining_volume=np.array(remainings, dtype=np.int32),
+            timestamp=np.array(timestamps, dtype=np.int64),
+        )
+
+    def _load_orders(self, path, symbol=None):
+        with np.load(path) as data:
+            columns = {name: data[name] for name in data.files}
+        if symbol is not None:
+            selected = columns['symbol'] == self.symbol_codes.get(symbol, -1)
+            columns = {name: values[selected] for name, values in columns.items()}
+        return list(zip(
+            columns['order_id'].tolist(), [self.symbols[code] for code in columns['symbol'].tolist()],
+            [chr(operation) for operation in columns['operation'].tolist()],
+            ticks_to_price(columns['price']).tolist(), columns['original_volume'].tolist(),
+            columns['remaining_volume'].tolist(), columns['timestamp'].tolist(),
+        ))
+
+    def get_active_orders_count(self):
+        return self.engine.get_active_orders_count()
+
+    def get_active_orders(self):
+        return list(self.engine.iter_orders())
+
+    def get_active_orders_sample(self, limit=10):
+        return self.engine.get_active_orders_sample(limit)
+
+    def get_symbols_summary(self):
+        return self.engine.get_symbols_summary()
+
+    def _best_rows(self, symbols, timestamp):
+        """Лучшие заявки по сторонам в виде строк group_best_prices"""
+        for symbol in symbols:
+            if self._last_timestamp is None or timestamp >= self._last_timestamp:
+                # Фильтр по времени ничего не отсекает: ответ по уровням цен движка
+                for operation in ('B', 'S'):
+                    order_id = self.engine.best_order(symbol, operation)
+                    if order_id is not None:
+                        order = self.engine.books[symbol][order_id]
+                        yield symbol, operation, order_id, order[PRICE], order[REMAINING_VOLUME], order[TIMESTAMP]
+                continue
+            # Прошлый момент: все заявки, выставленные не позже него; лучшую выбирает group_best_prices
+            for order_id, order in self.engine.books.get(symbol, {}).items():
+                if order[REMAINING_VOLUME] > 0 and order[TIMESTAMP] <= timestamp and order[OPERATION] in ('B', 'S'):
+                    yield symbol, order[OPERATION], order_id, order[PRICE], order[REMAINING_VOLUME], order[TIMESTAMP]
+
+    def get_best_prices(self, symbol: str, timestamp: int = None):
+        if timestamp is None:
+            timestamp = LATEST_MOMENT
+        return self.group_best_prices(self._best_rows([symbol], timestamp), timestamp).get(symbol, {
+            'symbol': symbol,
+            'timestamp': timestamp,
+            'max_buy_price': None,
+            'min_sell_price': None
+        })
+
+    def get_all_best_prices(self, timestamp: int = None):
+        if timestamp is None:
+            timestamp = LATEST_MOMENT
+        return self.group_best_prices(self._best_rows(list(self.engine.books), timestamp), timestamp)
+
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        if timestamp is None:
+            timestamp = LATEST_MOMENT
+        if self._last_timestamp is None or timestamp >= self._last_timestamp:
+            return self.engine.get_depth(symbol, levels, timestamp)
+        # Запрос на прошлый момент: уровни собираются из заявок инструмента, выставленных не позже timestamp
+        sides = {'B': {}, 'S': {}}
+        for order in self.engine.books.get(symbol, {}).values():
+            if order[REMAINING_VOLUME] <= 0 or order[TIMESTAMP] > timestamp or order[OPERATION] not in sides:
+                continue
+            level = sides[order[OPERATION]].setdefault(order[PRICE], [0, 0])
+            level[0] += order[REMAINING_VOLUME]
+            level[1] += 1
+        rows = []
+        for operation, descending in (('B', True), ('S', False)):
+            for price in sorted(sides[operation], reverse=descending)[:levels]:
+                rows.append((operation, price, *sides[operation][price]))
+        return self.group_depth(rows, symbol, timestamp)
+
+    # --- снимки книги и прогресс загрузки ---
+
+    def insert_checkpoint(self, timestamp, orders):
+        checkpoint_id = self._checkpoints[-1][1] + 1 if self._checkpoints else 1
+        self._save_orders(self._path('checkpoints', f'{timestamp}_{checkpoint_id}.npz'), orders)
+        self._checkpoints.append((timestamp, checkpoint_id))
+        self._checkpoints.sort()
+        with open(self._path(SYMBOLS_FILE), 'w') as f:
+            json.dump(self.symbols, f)
+        return checkpoint_id
+
+    def get_checkpoint(self, symbol: str, timestamp: int):
+        earlier = [checkpoint for checkpoint in self._checkpoints if checkpoint[0] <= timestamp]
+        if not earlier:
+            return None, []
+        checkpoint_timestamp, checkpoint_id = earlier[-1]
+        return checkpoint_timestamp, self._load_orders(
+            self._path('checkpoints', f'{checkpoint_timestamp}_{checkpoint_id}.npz'), symbol)
+
+    # --- бары ---
+
+    def _merge_bar(self, row):
+        symbol, period, timestamp, open_, high, low, close, volume, turnover, trades = row
+        bar = self._bars.get((symbol, period, timestamp))
+        if bar is None:
+            self._bars[symbol, period, timestamp] = [open_, high, low, close, volume, turnover, trades]
+        else:
+            bar[1] = max(bar[1], high)
+            bar[2] = min(bar[2], low)
+            bar[3] = close
+            bar[4] += volume
+            bar[5] += turnover
+            bar[6] += trades
+
+    def upsert_bars(self, rows):
+        os.makedirs(self.base_dir, exist_ok=True)
+        with open(self._path(BARS_FILE), 'a') as f:
+            for row in rows:
+                f.write(json.dumps(row) + '\n')
+                self._merge_bar(row)
+
+    def get_bars(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        return [
+            {
+                'symbol': bar_symbol,
+                'period': bar_period,
+                'timestamp': timestamp,
+                'open': open_,
+                'high': high,
+                'low': low,
+                'close': close,
+                'volume': volume,
+                'vwap': turnover / volume,
+                'trades': trades,
+            }
+            for (bar_symbol, bar_period, timestamp), (open_, high, low, close, volume, turnover, trades)
+            in sorted(self._bars.items())
+            if bar_symbol == symbol and bar_period == period and from_ts <= timestamp <= to_ts
+        ]
+
+    # --- метрики потока ---
+
+    def upsert_flow_metrics(self, rows):
+        os.makedirs(self.base_dir, exist_ok=True)
+        with open(self._path(FLOW_METRICS_FILE), 'a') as f:
+            for symbol, period, metric, timestamp, value in rows:
+                f.write(json.dumps([symbol, period, metric, timestamp, value]) + '\n')
+                self._flow_metrics[symbol, period, timestamp, metric] = value
+
+    def get_flow_metrics(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        return [
+            {'symbol': row_symbol, 'period': row_period, 'metric': metric, 'timestamp': timestamp, 'value': value}
+            for (row_symbol, row_period, timestamp, metric), value in sorted(self._flow_metrics.items())
+            if row_symbol == symbol and row_period == period and from_ts <= timestamp <= to_ts
+        ]
+
+    def get_ingest_progress(self, source: str):
+        return self._progress.get(source)
+
+    def save_ingest_progress(self, source: str, byte_offset: int, last_timestamp: int, last_order_id: int, processed: int):
+        self.flush()
+        self._progress[source] = {
+            'byte_offset': byte_offset,
+            'last_timestamp': last_timestamp,
+            'last_order_id': last_order_id,
+            'processed': processed,
+        }
+        with open(self._path(PROGRESS_FILE), 'w') as f:
+            json.dump(self._progress, f)
+
+    def close(self):
+        if os.path.isdir(self._path('history')):
+            self.flush()
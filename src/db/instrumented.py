@@ -0,0 +1,72 @@
+import contextlib
+import functools
+import inspect
+import time
+from .base import OPTIONAL_METHODS, DBInterface
+from ..metrics import get_registry
+
+# Методы, время и ошибки которых учитываются; apply_events есть только у AsyncPostgresDB
+INSTRUMENTED_METHODS = (frozenset(DBInterface.__abstractmethods__) | {'apply_events'}
+                        | {name for names in OPTIONAL_METHODS.values() for name in names})
+
+
+class InstrumentedDB:
+    """Обёртка над БД: время каждого вызова метода DBInterface и число ошибок в приёмник метрик.
+
+    Остальные атрибуты передаются БД без изменений. Транзакция batch() учитывается
+    целиком (внешний уровень, с фиксацией). Асинхронные методы (AsyncPostgresDB)
+    оборачиваются корутинами.
+    """
+
+    def __init__(self, db, metrics=None):
+        self.db = db
+        self.metrics = metrics if metrics is not None else get_registry()
+        self.backend = type(db).__name__
+        self._batch_depth = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.db, name)
+        if name not in INSTRUMENTED_METHODS or not callable(attribute):
+            return attribute
+        wrapped = self._wrap(name, attribute)
+        # Обёртка кэшируется в экземпляре, следующие обращения не доходят до __getattr__
+        self.__dict__[name] = wrapped
+        return wrapped
+
+    def _wrap(self, name, method):
+        metrics = self.metrics
+        labels = {'backend': self.backend, 'method': name}
+
+        if inspect.iscoroutinefunction(method):
+            async def wrapped(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await method(*args, **kwargs)
+                except Exception:
+                    metrics.inc('db_errors_total', **labels)
+                    raise
+                finally:
+                    metrics.observe('db_call_seconds', time.perf_counter() - started, **labels)
+        else:
+            def wrapped(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                except Exception:
+                    metrics.inc('db_errors_total', **labels)
+                    raise
+                finally:
+                    metrics.observe('db_call_seconds', time.perf_counter() - started, **labels)
+        return functools.wraps(method)(wrapped)
+
+    @contextlib.contextmanager
+    def batch(self):
+        started = time.perf_counter()
+        self._batch_depth += 1
+        try:
+            with self.db.batch():
+                yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.metrics.observe('db_batch_seconds', time.perf_counter() - started, backend=self.backend)
@@ -1,11 +1,137 @@
+import contextlib
+import io
+import re
+import threading
+import time
 import psycopg2
 from psycopg2.extras import RealDictCursor, execute_values
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2.pool import ThreadedConnectionPool
 from .base import DBInterface
+from ..encoding import (LATEST_MOMENT, MAX_MOMENT, MIN_MOMENT, MS_PER_DAY, NS_PER_MS, moment_day, moment_range_to_ns, moments_to_ns,
+                        ns_to_moments)
+from ..metrics import get_registry
 from ..queries import *
 
-class PostgresDB(DBInterface):
-    def __init__(self, host='localhost', port=5432, database='tick_data', user='tick_user', password='tick_pass', min_conn=1, max_conn=10):
+COPY_BUFFER_SIZE = 1 << 20
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+PARTITION_MODES = ('day',)
+DAY_PARTITION_NAME = re.compile(r'_d(\d{8})$')
+
+
+def format_copy_row(row):
+    """Строка в текстовом формате COPY (значения через табуляцию, NULL как \\N)"""
+    return '\t'.join(
+        '\\N' if value is None else value.translate(COPY_ESCAPES) if isinstance(value, str) else str(value)
+        for value in row
+    ) + '\n'
+
+
+class PostgresSchema:
+    """DDL таблиц PostgreSQL без подключения к серверу: общий для PostgresDB и AsyncPostgresDB"""
+
+    def __init__(self, compact=False, partition_by=None, symbol_partitions=0):
+        if partition_by is not None and partition_by not in PARTITION_MODES:
+            raise ValueError(f"Unknown partition mode: {partition_by}")
+        # Компактная схема истории: order_history_v2 + словарь symbols
+        self.compact = compact
+        self.history_table = 'order_history_v2' if compact else 'order_history'
+        # Секции истории по торговым дням, внутри дня - symbol_partitions секций по инструменту
+        self.partition_by = partition_by
+        self.symbol_partitions = symbol_partitions
+
+    @property
+    def timestamp_column(self):
+        return 'timestamp_ns' if self.compact else 'timestamp'
+
+    def table_statements(self):
+        """CREATE TABLE всех таблиц; секция по умолчанию и индекс истории - в partition_statements"""
+        statements = [SYMBOLS_TABLE] if self.compact else []
+        if self.partition_by:
+            statements.append(ORDER_HISTORY_COMPACT_PARTITIONED_TABLE if self.compact else ORDER_HISTORY_PARTITIONED_TABLE)
+        else:
+            statements.append(ORDER_HISTORY_COMPACT_TABLE if self.compact else ORDER_HISTORY_TABLE)
+        return statements + [ACTIVE_ORDERS_TABLE, BOOK_CHECKPOINTS_TABLE, BOOK_CHECKPOINT_ORDERS_TABLE,
+                             INGEST_PROGRESS_TABLE, BARS_TABLE, FLOW_METRICS_TABLE]
+
+    def check_partitioned(self, relkind):
+        """relkind истории из TABLE_KIND: таблица, созданная раньше без секций, не подменяется молча"""
+        if relkind != 'p':
+            raise RuntimeError(f"Table {self.history_table} exists and is not partitioned")
+
+    def partition_statements(self):
+        # Индекс родительской таблицы создаётся и во всех её секциях, в том числе будущих
+        return [HISTORY_DEFAULT_PARTITION.format(table=self.history_table),
+                IDX_HISTORY_TS_BRIN.format(table=self.history_table, column=self.timestamp_column)]
+
+    def truncate_statement(self):
+        tables = ['active_orders', self.history_table, 'book_checkpoint_orders', 'book_checkpoints',
+                  'ingest_progress', 'bars', 'flow_metrics']
+        if self.compact:
+            tables.append('symbols')
+        return TRUNCATE_TABLES.format(tables=', '.join(tables))
+
+    def day_partition_name(self, day):
+        return f'{self.history_table}_d{day}'
+
+    def day_bounds(self, day):
+        """Границы секции дня YYYYMMDD в единицах ключа секционирования; None, если это не дата"""
+        if not MIN_MOMENT <= day * 1000000000 < MAX_MOMENT:
+            return None
+        start_ns = int(moments_to_ns(day * 1000000000))
+        if moment_day(int(ns_to_moments(start_ns))) != day:
+            return None
+        end_ns = start_ns + MS_PER_DAY * NS_PER_MS
+        if self.compact:
+            return start_ns, end_ns
+        return day * 1000000000, moment_day(int(ns_to_moments(end_ns))) * 1000000000
+
+    def day_partition_statements(self, day):
+        """CREATE TABLE секции дня и её секций по инструменту; метки вне календаря попадут в секцию по умолчанию"""
+        bounds = self.day_bounds(day)
+        if bounds is None:
+            return []
+        partition = self.day_partition_name(day)
+        symbol_column = 'symbol_id' if self.compact else 'symbol'
+        statements = [HISTORY_DAY_PARTITION.format(
+            partition=partition, table=self.history_table, start=bounds[0], end=bounds[1],
+            subpartition=f'PARTITION BY HASH ({symbol_column})' if self.symbol_partitions else '',
+        )]
+        for remainder in range(self.symbol_partitions):
+            statements.append(HISTORY_HASH_PARTITION.format(
+                partition=f'{partition}_h{remainder}', table=partition,
+                modulus=self.symbol_partitions, remainder=remainder,
+            ))
+        return statements
+
+
+class BlockingConnectionPool(ThreadedConnectionPool):
+    """Потокобезопасный пул, который ждёт освобождения подключения вместо ошибки PoolError"""
+
+    def __init__(self, min_conn, max_conn, *args, **kwargs):
+        self._slots = threading.BoundedSemaphore(max_conn)
+        super().__init__(min_conn, max_conn, *args, **kwargs)
+
+    def getconn(self, key=None):
+        self._slots.acquire()
+        try:
+            return super().getconn(key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            super().putconn(conn, key, close)
+        finally:
+            self._slots.release()
+
+
+class PostgresDB(PostgresSchema, DBInterface):
+    def __init__(self, host='localhost', port=5432, database='tick_data', user='tick_user', password='tick_pass', min_conn=1, max_conn=10,
+                 use_copy=True, copy_batch_size=50000, compact=False, metrics=None, partition_by=None,
+                 symbol_partitions=0, read_max_conn=0):
+        super().__init__(compact, partition_by, symbol_partitions)
         self.connection_params = {
             'host': host,
             'port': port,
@@ -13,49 +139,239 @@ class PostgresDB(DBInterface):
             'user': user,
             'password': password
         }
-        self.pool = SimpleConnectionPool(min_conn, max_conn, **self.connection_params)
+        self.pool = BlockingConnectionPool(min_conn, max_conn, **self.connection_params)
+        # Отдельный пул для запросов: чтение не ждёт подключений загрузки, каждый запрос - снимок REPEATABLE READ
+        self.read_pool = BlockingConnectionPool(1, read_max_conn, **self.connection_params) if read_max_conn else None
+        # Подключение, закреплённое за потоком на время batch()
+        self._local = threading.local()
+        # COPY FROM STDIN для order_history и снимков active_orders; INSERT остаётся запасным путём
+        self.use_copy = use_copy
+        self.copy_batch_size = copy_batch_size
+        self.symbol_ids = {}
+        self.metrics = metrics if metrics is not None else get_registry()
+        self._history_days = set()
+
+    def _take(self, pool, name):
+        # Время ожидания пула включает открытие нового подключения
+        started = time.perf_counter()
+        conn = pool.getconn()
+        self.metrics.observe('db_pool_wait_seconds', time.perf_counter() - started, backend='PostgresDB', pool=name)
+        return conn
+
+    def _pinned(self):
+        return getattr(self._local, 'conn', None)
 
     def get_connection(self):
-        return self.pool.getconn()
+        conn = self._pinned()
+        return conn if conn is not None else self._take(self.pool, 'write')
 
     def return_connection(self, conn):
-        self.pool.putconn(conn)
+        if conn is not self._pinned():
+            self.pool.putconn(conn)
+
+    def get_read_connection(self):
+        """Подключение для запросов; внутри batch() этого потока - подключение порции (видны её изменения)"""
+        if self.read_pool is None or self._pinned() is not None:
+            return self.get_connection()
+        conn = self._take(self.read_pool, 'read')
+        conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        return conn
+
+    def return_read_connection(self, conn):
+        # Пул откатывает незавершённую транзакцию чтения при возврате
+        if self.read_pool is None or conn is self._pinned():
+            self.return_connection(conn)
+        else:
+            self.read_pool.putconn(conn)
+
+    def _commit(self, conn):
+        # Внутри batch() фиксация откладывается до конца порции
+        if conn is not self._pinned():
+            conn.commit()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Порция в одной транзакции на подключении, закреплённом за потоком: читатели видят её целиком или не видят"""
+        if self._pinned() is not None:
+            yield self
+            return
+        conn = self._take(self.pool, 'write')
+        self._local.conn = conn
+        completed = False
+        try:
+            yield self
+            completed = True
+        finally:
+            self._local.conn = None
+            try:
+                if completed:
+                    conn.commit()
+                else:
+                    conn.rollback()
+                    # Секции и коды инструментов, созданные в откаченной транзакции, не сохранились
+                    self._history_days = set()
+                    self.symbol_ids = {}
+            finally:
+                self.pool.putconn(conn)
 
     def create_tables(self):
         conn = self.get_connection()
         try:
             with conn.cursor() as cursor:
-                cursor.execute(ORDER_HISTORY_TABLE)
-                cursor.execute(ACTIVE_ORDERS_TABLE)
-                conn.commit()
+                for statement in self.table_statements():
+                    cursor.execute(statement)
+                if self.partition_by:
+                    cursor.execute(TABLE_KIND, (self.history_table,))
+                    self.check_partitioned(cursor.fetchone()[0])
+                    for statement in self.partition_statements():
+                        cursor.execute(statement)
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+
+    # --- секции истории ---
+
+    def history_partitions(self):
+        """Дни YYYYMMDD, для которых есть секции истории"""
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(HISTORY_PARTITIONS, (self.history_table,))
+                names = [name for name, in cursor.fetchall()]
+                self._commit(conn)
         finally:
             self.return_connection(conn)
+        return sorted(int(match.group(1)) for match in map(DAY_PARTITION_NAME.search, names) if match)
+
+    def _ensure_day_partitions(self, cursor, days):
+        missing = sorted(set(days) - self._history_days)
+        if not missing:
+            return
+        cursor.execute(PARTITION_LOCK, (self.history_table,))
+        for day in missing:
+            for statement in self.day_partition_statements(day):
+                cursor.execute(statement)
+            self._history_days.add(day)
+
+    def history_days(self):
+        if self.partition_by:
+            return self.history_partitions()
+        conn = self.get_read_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(HISTORY_DAYS_COMPACT if self.compact else HISTORY_DAYS)
+                values = [value for value, in cursor.fetchall()]
+        finally:
+            self.return_read_connection(conn)
+        return sorted(self.epoch_days_to_days(values) if self.compact else values)
+
+    def drop_history_before(self, day):
+        """Секции истории старых дней удаляются целиком (DROP TABLE), без секций - DELETE"""
+        dropped = [history_day for history_day in self.history_days() if history_day < day]
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                if self.partition_by:
+                    cursor.execute(PARTITION_LOCK, (self.history_table,))
+                    for partition_day in dropped:
+                        cursor.execute(f'DROP TABLE IF EXISTS {self.day_partition_name(partition_day)}')
+                elif dropped:
+                    bound = int(moments_to_ns(day * 1000000000)) if self.compact else day * 1000000000
+                    cursor.execute(f'DELETE FROM {self.history_table} WHERE {self.timestamp_column} < %s', (bound,))
+                cursor.execute(DELETE_CHECKPOINT_ORDERS_BEFORE, (day * 1000000000,))
+                cursor.execute(DELETE_CHECKPOINTS_BEFORE, (day * 1000000000,))
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+        self._history_days.difference_update(dropped)
+        return dropped
+
+    def export_history(self, from_ts: int, to_ts: int, batch_size: int = 100000):
+        """Порции истории через курсор на сервере: в памяти не больше batch_size строк"""
+        if self.compact:
+            query, params = EXPORT_HISTORY_COMPACT, moment_range_to_ns(from_ts, to_ts)
+        else:
+            query, params = EXPORT_HISTORY, (from_ts, to_ts)
+        conn = self.get_read_connection()
+        try:
+            with conn.cursor(name='export_history') as cursor:
+                cursor.itersize = batch_size
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield self.decode_export_rows(rows) if self.compact else rows
+        finally:
+            self.return_read_connection(conn)
 
     def clear_tables(self):
         conn = self.get_connection()
         try:
             with conn.cursor() as cursor:
-                cursor.execute('DELETE FROM active_orders')
-                cursor.execute('DELETE FROM order_history')
-                conn.commit()
+                cursor.execute(self.truncate_statement())
+                self._commit(conn)
         finally:
             self.return_connection(conn)
+        self.symbol_ids = {}
+
+    def copy_rows(self, cursor, copy_sql, rows):
+        for start in range(0, len(rows), self.copy_batch_size):
+            buffer = io.StringIO()
+            buffer.writelines(map(format_copy_row, rows[start:start + self.copy_batch_size]))
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer, size=COPY_BUFFER_SIZE)
 
     def insert_history_batch(self, batch):
+        if self.partition_by and batch:
+            days = {moment_day(row[2]) for row in batch}
+            if not days <= self._history_days:
+                conn = self.get_connection()
+                try:
+                    with conn.cursor() as cursor:
+                        self._ensure_day_partitions(cursor, days)
+                        self._commit(conn)
+                finally:
+                    self.return_connection(conn)
+        if self.compact:
+            if not batch:
+                return
+            batch = self.encode_history_rows(batch, self.get_symbol_ids(row[0] for row in batch))
+            copy_sql, insert_sql = COPY_HISTORY_COMPACT, INSERT_HISTORY_COMPACT_BATCH
+        else:
+            copy_sql, insert_sql = COPY_HISTORY, INSERT_HISTORY_BATCH
         conn = self.get_connection()
         try:
             with conn.cursor() as cursor:
-                execute_values(cursor, INSERT_HISTORY_BATCH, batch, template=None, page_size=1000)
-                conn.commit()
+                if self.use_copy:
+                    self.copy_rows(cursor, copy_sql, batch)
+                else:
+                    execute_values(cursor, insert_sql, batch, template=None, page_size=1000)
+                self._commit(conn)
         finally:
             self.return_connection(conn)
 
+    def get_symbol_ids(self, symbols):
+        """Коды инструментов из словаря symbols; новые инструменты добавляются"""
+        missing = set(symbols) - self.symbol_ids.keys()
+        if missing:
+            conn = self.get_connection()
+            try:
+                with conn.cursor() as cursor:
+                    execute_values(cursor, INSERT_SYMBOLS, [(symbol,) for symbol in sorted(missing)])
+                    cursor.execute(ALL_SYMBOLS)
+                    self.symbol_ids = dict(cursor.fetchall())
+                    self._commit(conn)
+            finally:
+                self.return_connection(conn)
+        return self.symbol_ids
+
     def insert_active_order(self, order_id, symbol, operation, price, volume, timestamp):
         conn = self.get_connection()
         try:
             with conn.cursor() as cursor:
                 cursor.execute(INSERT_ACTIVE_ORDER, (order_id, symbol, operation, price, volume, volume, timestamp))
-                conn.commit()
+                self._commit(conn)
         finally:
             self.return_connection(conn)
 
@@ -68,11 +384,12 @@ class PostgresDB(DBInterface):
                 if result:
                     remaining_volume = result[0]
                     new_remaining = remaining_volume - trade_volume
+                    # Удаление на том же подключении: вложенный get_connection ждал бы пул из одного подключения
                     if new_remaining <= 0:
-                        self.delete_active_order(order_id)
+                        cursor.execute(DELETE_ACTIVE_ORDER, (order_id,))
                     else:
                         cursor.execute(UPDATE_ACTIVE_ORDER_VOLUME, (new_remaining, order_id))
-                        conn.commit()
+                    self._commit(conn)
         finally:
             self.return_connection(conn)
 
@@ -81,41 +398,109 @@ class PostgresDB(DBInterface):
         try:
             with conn.cursor() as cursor:
                 cursor.execute(DELETE_ACTIVE_ORDER, (order_id,))
-                conn.commit()
+                self._commit(conn)
         finally:
             self.return_connection(conn)
 
-    def get_active_orders_count(self):
+    def insert_active_orders_batch(self, orders):
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, INSERT_ACTIVE_ORDERS_BATCH, [
+                    (order_id, symbol, operation, price, volume, volume, timestamp)
+                    for order_id, symbol, operation, price, volume, timestamp in orders
+                ], page_size=1000)
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+
+    def process_trades_batch(self, trades):
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, APPLY_TRADES_BATCH, trades, page_size=1000)
+                cursor.execute(DELETE_FILLED_ORDERS, ([order_id for order_id, _ in trades],))
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+
+    def delete_active_orders_batch(self, order_ids):
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(DELETE_ACTIVE_ORDERS_BATCH, (list(order_ids),))
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+
+    def apply_active_changes(self, inserts, trades, deletes):
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                if deletes:
+                    cursor.execute(DELETE_ACTIVE_ORDERS_BATCH, (list(deletes),))
+                if inserts:
+                    execute_values(cursor, INSERT_ACTIVE_ORDERS_BATCH, inserts, page_size=1000)
+                if trades:
+                    execute_values(cursor, APPLY_TRADES_BATCH, trades, page_size=1000)
+                    cursor.execute(DELETE_FILLED_ORDERS, ([order_id for order_id, _ in trades],))
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+
+    def replace_active_orders(self, orders):
         conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('DELETE FROM active_orders')
+                if orders and self.use_copy:
+                    self.copy_rows(cursor, COPY_ACTIVE_ORDERS, orders)
+                elif orders:
+                    execute_values(cursor, INSERT_ACTIVE_ORDERS_BATCH, orders, page_size=1000)
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+
+    def get_active_orders_count(self):
+        conn = self.get_read_connection()
         try:
             with conn.cursor() as cursor:
                 cursor.execute('SELECT COUNT(*) FROM active_orders')
                 return cursor.fetchone()[0]
         finally:
-            self.return_connection(conn)
+            self.return_read_connection(conn)
+
+    def get_active_orders(self):
+        conn = self.get_read_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(ALL_ACTIVE_ORDERS)
+                return cursor.fetchall()
+        finally:
+            self.return_read_connection(conn)
 
     def get_active_orders_sample(self, limit=10):
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 cursor.execute(SAMPLE_ACTIVE_ORDERS, (limit,))
                 return cursor.fetchall()
         finally:
-            self.return_connection(conn)
+            self.return_read_connection(conn)
 
     def get_symbols_summary(self):
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 cursor.execute(SYMBOLS_SUMMARY)
                 return cursor.fetchall()
         finally:
-            self.return_connection(conn)
+            self.return_read_connection(conn)
 
     def get_best_prices(self, symbol: str, timestamp: int = None):
         if timestamp is None:
-            timestamp = 99999999999999999
-        conn = self.get_connection()
+            timestamp = LATEST_MOMENT
+        conn = self.get_read_connection()
         try:
             with conn.cursor(cursor_factory=RealDictCursor) as cursor:
                 cursor.execute(BEST_PRICES_QUERY, (symbol, timestamp, symbol, timestamp))
@@ -133,11 +518,145 @@ class PostgresDB(DBInterface):
                     'max_buy_price': best_buy,
                     'min_sell_price': best_sell
                 }
+        finally:
+            self.return_read_connection(conn)
+
+    def get_all_best_prices(self, timestamp: int = None):
+        if timestamp is None:
+            timestamp = LATEST_MOMENT
+        conn = self.get_read_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(ALL_BEST_PRICES_QUERY, (timestamp,))
+                return self.group_best_prices(cursor.fetchall(), timestamp)
+        finally:
+            self.return_read_connection(conn)
+
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        if timestamp is None:
+            timestamp = LATEST_MOMENT
+        conn = self.get_read_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(DEPTH_QUERY, (symbol, timestamp, levels, symbol, timestamp, levels))
+                return self.group_depth(cursor.fetchall(), symbol, timestamp)
+        finally:
+            self.return_read_connection(conn)
+
+    def insert_checkpoint(self, timestamp, orders):
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(INSERT_CHECKPOINT, (timestamp,))
+                checkpoint_id = cursor.fetchone()[0]
+                rows = [(checkpoint_id, *order) for order in orders]
+                if rows and self.use_copy:
+                    self.copy_rows(cursor, COPY_CHECKPOINT_ORDERS, rows)
+                elif rows:
+                    execute_values(cursor, INSERT_CHECKPOINT_ORDERS, rows, page_size=1000)
+                self._commit(conn)
+                return checkpoint_id
+        finally:
+            self.return_connection(conn)
+
+    def get_checkpoint(self, symbol: str, timestamp: int):
+        conn = self.get_read_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(GET_CHECKPOINT, (timestamp,))
+                checkpoint = cursor.fetchone()
+                if not checkpoint:
+                    return None, []
+                checkpoint_id, checkpoint_timestamp = checkpoint
+                cursor.execute(GET_CHECKPOINT_ORDERS, (checkpoint_id, symbol))
+                return checkpoint_timestamp, cursor.fetchall()
+        finally:
+            self.return_read_connection(conn)
+
+    def get_history_range(self, symbol: str, from_ts: int, to_ts: int):
+        conn = self.get_read_connection()
+        try:
+            if self.compact:
+                # Код инструмента подставляется константой: по нему отсекаются секции HASH
+                with conn.cursor() as cursor:
+                    cursor.execute(GET_SYMBOL_ID, (symbol,))
+                    symbol_row = cursor.fetchone()
+                    if symbol_row is None:
+                        return []
+                    cursor.execute(HISTORY_RANGE_COMPACT_BY_ID, (symbol_row[0], *moment_range_to_ns(from_ts, to_ts)))
+                    return self.decode_history_rows(cursor.fetchall(), symbol)
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(HISTORY_RANGE, (symbol, from_ts, to_ts))
+                return cursor.fetchall()
+        finally:
+            self.return_read_connection(conn)
+
+    def upsert_bars(self, rows):
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, UPSERT_BARS, rows, page_size=1000)
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+
+    def get_bars(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        conn = self.get_read_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(BARS_RANGE, (symbol, period, from_ts, to_ts))
+                return cursor.fetchall()
+        finally:
+            self.return_read_connection(conn)
+
+    def upsert_flow_metrics(self, rows):
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                execute_values(cursor, UPSERT_FLOW_METRICS, rows, page_size=1000)
+                self._commit(conn)
+        finally:
+            self.return_connection(conn)
+
+    def get_flow_metrics(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        conn = self.get_read_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(FLOW_METRICS_RANGE, (symbol, period, from_ts, to_ts))
+                return cursor.fetchall()
+        finally:
+            self.return_read_connection(conn)
+
+    def get_ingest_progress(self, source: str):
+        conn = self.get_connection()
+        try:
+            with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                cursor.execute(GET_INGEST_PROGRESS, (source,))
+                row = cursor.fetchone()
+                return dict(row) if row else None
+        finally:
+            self.return_connection(conn)
+
+    def save_ingest_progress(self, source: str, byte_offset: int, last_timestamp: int, last_order_id: int, processed: int):
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(SAVE_INGEST_PROGRESS, (source, byte_offset, last_timestamp, last_order_id, processed))
+                self._commit(conn)
         finally:
             self.return_connection(conn)
 
     def close(self):
         self.pool.closeall()
+        if self.read_pool is not None:
+            self.read_pool.closeall()
 
     def create_indexes(self):
-        pass 
\ No newline at end of file
+        conn = self.get_connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(IDX_HISTORY_COMPACT_SYMBOL_TS if self.compact else IDX_HISTORY_SYMBOL_TS)
+                cursor.execute(IDX_ACTIVE_SYMBOL_SIDE_PRICE)
+                self._commit(conn)
+        finally:
+            self.return_connection(conn) 
\ No newline at end of file
@@ -0,0 +1,162 @@
+import asyncio
+import contextlib
+import time
+from .postgres import PostgresSchema
+from ..encoding import moment_day
+from ..metrics import get_registry
+from ..queries import *
+
+try:
+    import psycopg
+except ImportError:  # psycopg 3 нужен только асинхронному бэкенду
+    psycopg = None
+
+
+class AsyncPostgresDB(PostgresSchema):
+    """Асинхронный доступ к PostgreSQL через psycopg 3 (пишущая часть DBInterface).
+
+    Подключения выдаются из собственного пула на max_conn подключений. Запросы одной
+    операции отправляются конвейером (pipeline mode): следующий запрос уходит на сервер,
+    не дожидаясь ответа на предыдущий, и задержка сети оплачивается один раз на порцию.
+    Схема и секции истории по дням - те же, что у PostgresDB (без компактной истории).
+    """
+
+    def __init__(self, host='localhost', port=5432, database='tick_data', user='tick_user', password='tick_pass', max_conn=10,
+                 use_copy=True, metrics=None, partition_by=None, symbol_partitions=0):
+        if psycopg is None:
+            raise ImportError("AsyncPostgresDB requires psycopg 3: pip install 'psycopg[binary]'")
+        super().__init__(partition_by=partition_by, symbol_partitions=symbol_partitions)
+        self.connection_params = {
+            'host': host,
+            'port': port,
+            'dbname': database,
+            'user': user,
+            'password': password
+        }
+        self.max_conn = max_conn
+        self.use_copy = use_copy
+        self._idle = []
+        # Пул создаётся в цикле событий первого запроса
+        self._slots = None
+        self.metrics = metrics if metrics is not None else get_registry()
+        self._history_days = set()
+
+    @contextlib.asynccontextmanager
+    async def connection(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_conn)
+        started = time.perf_counter()
+        async with self._slots:
+            conn = self._idle.pop() if self._idle else await psycopg.AsyncConnection.connect(**self.connection_params)
+            self.metrics.observe('db_pool_wait_seconds', time.perf_counter() - started, backend='AsyncPostgresDB')
+            try:
+                yield conn
+            except BaseException:
+                # Ошибка отката не заменяет исходную: подключение закрывается ниже
+                with contextlib.suppress(psycopg.Error):
+                    await conn.rollback()
+                raise
+            finally:
+                # В пул возвращается только исправное подключение без незавершённой транзакции
+                if conn.closed or conn.info.transaction_status != psycopg.pq.TransactionStatus.IDLE:
+                    await conn.close()
+                else:
+                    self._idle.append(conn)
+
+    async def create_tables(self):
+        async with self.connection() as conn:
+            async with conn.cursor() as cursor:
+                for statement in self.table_statements():
+                    await cursor.execute(statement)
+                if self.partition_by:
+                    await cursor.execute(TABLE_KIND, (self.history_table,))
+                    self.check_partitioned((await cursor.fetchone())[0])
+                    for statement in self.partition_statements():
+                        await cursor.execute(statement)
+            await conn.commit()
+
+    async def clear_tables(self):
+        async with self.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(self.truncate_statement())
+            await conn.commit()
+
+    async def insert_history_batch(self, batch):
+        days = {moment_day(row[2]) for row in batch} if self.partition_by else set()
+        async with self.connection() as conn:
+            async with conn.cursor() as cursor:
+                missing = sorted(days - self._history_days)
+                if missing:
+                    # Секции создаются в транзакции порции: при откате не остаются в _history_days
+                    await cursor.execute(PARTITION_LOCK, (self.history_table,))
+                    for day in missing:
+                        for statement in self.day_partition_statements(day):
+                            await cursor.execute(statement)
+                if self.use_copy:
+                    async with cursor.copy(COPY_HISTORY) as copy:
+                        for row in batch:
+                            await copy.write_row(row)
+                else:
+                    await cursor.executemany(INSERT_HISTORY, batch)
+            await conn.commit()
+        self._history_days.update(days)
+
+    async def apply_events(self, events):
+        """Построчные события active_orders (action, order_id, symbol, operation, price, volume, timestamp) по порядку.
+
+        Семантика совпадает с insert_active_order, process_trade и delete_active_order;
+        сделка выражена без чтения остатка, поэтому все запросы порции идут конвейером
+        и фиксируются одной транзакцией.
+        """
+        async with self.connection() as conn:
+            async with conn.pipeline():
+                async with conn.cursor() as cursor:
+                    for action, order_id, symbol, operation, price, volume, timestamp in events:
+                        if action == 1:
+                            await cursor.execute(INSERT_ACTIVE_ORDER,
+                                                 (order_id, symbol, operation, price, volume, volume, timestamp))
+                        elif action == 2:
+                            await cursor.execute(APPLY_TRADE, (volume, order_id))
+                            await cursor.execute(DELETE_FILLED_ORDER, (order_id,))
+                        elif action == 0:
+                            await cursor.execute(DELETE_ACTIVE_ORDER, (order_id,))
+            await conn.commit()
+
+    async def apply_active_changes(self, inserts, trades, deletes):
+        async with self.connection() as conn:
+            async with conn.pipeline():
+                async with conn.cursor() as cursor:
+                    if deletes:
+                        await cursor.execute(DELETE_ACTIVE_ORDERS_BATCH, (list(deletes),))
+                    if inserts:
+                        await cursor.executemany(INSERT_ACTIVE_ORDER, inserts)
+                    if trades:
+                        await cursor.executemany(APPLY_TRADE, [(volume, order_id) for order_id, volume in trades])
+                        await cursor.execute(DELETE_FILLED_ORDERS, ([order_id for order_id, _ in trades],))
+            await conn.commit()
+
+    async def replace_active_orders(self, orders):
+        async with self.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute('DELETE FROM active_orders')
+                if orders and self.use_copy:
+                    async with cursor.copy(COPY_ACTIVE_ORDERS) as copy:
+                        for order in orders:
+                            await copy.write_row(order)
+                elif orders:
+                    await cursor.executemany(INSERT_ACTIVE_ORDER, orders)
+            await conn.commit()
+
+    async def get_active_orders_count(self):
+        async with self.connection() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute('SELECT COUNT(*) FROM active_orders')
+                count = (await cursor.fetchone())[0]
+            await conn.commit()
+            return count
+
+    async def close(self):
+        for conn in self._idle:
+            await conn.close()
+        self._idle = []
+        self._slots = None
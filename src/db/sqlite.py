@@ -1,49 +1,356 @@
+import contextlib
+import os
+import re
+import shutil
 import sqlite3
+import threading
+from urllib.request import pathname2url
 from .base import DBInterface
+from ..encoding import LATEST_MOMENT, moment_day, moment_range_to_ns, moments_to_ns
 from ..queries import *
 
+PROFILES = {
+    'default': [],
+    'ingest': INGEST_PRAGMAS_SQLITE,
+}
+
+SHARD_MODES = ('symbol', 'day')
+
+# PRAGMA user_version файла, созданного SQLiteDB: только такой файл clear_tables пересоздаёт целиком
+OWNED_FILE_VERSION = 0x7469636B
+OWN_TABLES = frozenset(('order_history', 'order_history_v2', 'symbols', 'active_orders', 'book_checkpoints',
+                        'book_checkpoint_orders', 'ingest_progress', 'bars', 'flow_metrics'))
+
+
 class SQLiteDB(DBInterface):
-    def __init__(self, db_path='tick_data.db'):
+    def __init__(self, db_path='tick_data.db', compact=False, profile='default', shard_by=None, shard_dir=None,
+                 concurrent_reads=False):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown SQLite profile: {profile}")
+        if shard_by is not None and shard_by not in SHARD_MODES:
+            raise ValueError(f"Unknown shard mode: {shard_by}")
         self.db_path = db_path
         self.conn = None
+        # Компактная схема истории: order_history_v2 + словарь symbols
+        self.compact = compact
+        self.history_table = 'order_history_v2' if compact else 'order_history'
+        self.symbol_ids = {}
+        self.profile = profile
+        # История в отдельных файлах по инструменту или дню; у каждого файла своё подключение
+        self.shard_by = shard_by
+        self.shard_dir = shard_dir or f'{db_path}.history'
+        self._shards = {}
+        self._next_history_ids = {}
+        self._batch_depth = 0
+        # Чтение из других потоков во время загрузки: WAL и своё подключение только для чтения у каждого потока
+        self.concurrent_reads = concurrent_reads
+        self._writer_thread = None
+        self._readers = threading.local()
+        self._reader_connections = []
+        self._reader_lock = threading.Lock()
+
+    def _connect(self, path):
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        for pragma in PROFILES[self.profile]:
+            conn.execute(pragma)
+        if self.concurrent_reads:
+            conn.execute('PRAGMA journal_mode = WAL')
+        return conn
 
     def get_connection(self):
         if not self.conn:
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row
+            self.conn = self._connect(self.db_path)
+            self._writer_thread = threading.get_ident()
         return self.conn
 
+    def _reader_connection(self, path):
+        """Подключение потока-читателя к файлу или None для потока записи"""
+        if not self.concurrent_reads or threading.get_ident() == self._writer_thread:
+            return None
+        connections = self._readers.__dict__.setdefault('connections', {})
+        conn = connections.get(path)
+        if conn is None:
+            uri = f'file:{pathname2url(os.path.abspath(path))}?mode=ro'
+            conn = connections[path] = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            with self._reader_lock:
+                self._reader_connections.append(conn)
+        return conn
+
+    @contextlib.contextmanager
+    def _read_cursor(self, shard_key=None):
+        """Курсор для запросов; в потоке-читателе все запросы внутри блока видят один снимок БД.
+
+        Запись фиксируется порциями (batch()), поэтому читатель видит порцию целиком или не видит её.
+        """
+        conn = self._reader_connection(self.db_path if shard_key is None else self.shard_path(shard_key))
+        if conn is None:
+            yield (self.get_connection() if shard_key is None else self._shard_connection(shard_key)).cursor()
+            return
+        conn.execute('BEGIN')
+        try:
+            yield conn.cursor()
+        finally:
+            conn.rollback()
+
+    def _commit(self, conn):
+        # Внутри batch() фиксация откладывается до конца порции
+        if not self._batch_depth:
+            conn.commit()
+
+    @contextlib.contextmanager
+    def batch(self):
+        self._batch_depth += 1
+        completed = False
+        try:
+            yield self
+            completed = True
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                for conn in [self.get_connection(), *self._shards.values()]:
+                    if completed:
+                        conn.commit()
+                    else:
+                        conn.rollback()
+                if not completed:
+                    # Коды инструментов и следующие id истории из откаченной транзакции не сохранились
+                    self.symbol_ids = {}
+                    self._next_history_ids = {}
+
     def create_tables(self):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute(ORDER_HISTORY_TABLE_SQLITE)
+        # Пустой файл создаёт этот класс: помечается как свой
+        if not cursor.execute(SCHEMA_OBJECTS_COUNT_SQLITE).fetchone()[0]:
+            cursor.execute(f'PRAGMA user_version = {OWNED_FILE_VERSION}')
+        if self.compact:
+            cursor.execute(SYMBOLS_TABLE_SQLITE)
+        if self.shard_by:
+            os.makedirs(self.shard_dir, exist_ok=True)
+        else:
+            self._create_history_table(cursor)
         cursor.execute(ACTIVE_ORDERS_TABLE_SQLITE)
-        conn.commit()
+        cursor.execute(BOOK_CHECKPOINTS_TABLE_SQLITE)
+        cursor.execute(BOOK_CHECKPOINT_ORDERS_TABLE_SQLITE)
+        cursor.execute(INGEST_PROGRESS_TABLE_SQLITE)
+        cursor.execute(BARS_TABLE_SQLITE)
+        cursor.execute(FLOW_METRICS_TABLE_SQLITE)
+        self._commit(conn)
+
+    def _create_history_table(self, cursor):
+        cursor.execute(ORDER_HISTORY_COMPACT_TABLE_SQLITE if self.compact else ORDER_HISTORY_TABLE_SQLITE)
 
     def create_indexes(self):
+        if self.shard_by:
+            connections = [self._shard_connection(key) for key in self.history_shards()]
+        else:
+            connections = [self.get_connection()]
+        for conn in connections:
+            cursor = conn.cursor()
+            if self.compact:
+                # (symbol_id, timestamp_ns) уже первичный ключ
+                cursor.execute(IDX_HISTORY_COMPACT_ORDER_ID_SQLITE)
+            else:
+                cursor.execute(IDX_HISTORY_ORDER_ID_SQLITE)
+                cursor.execute(IDX_HISTORY_SYMBOL_TS_SQLITE)
+            self._commit(conn)
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(IDX_HISTORY_ORDER_ID_SQLITE)
-        conn.commit()
+        conn.execute(IDX_ACTIVE_SYMBOL_SIDE_PRICE_SQLITE)
+        self._commit(conn)
 
     def clear_tables(self):
+        """Пустые таблицы: файл БД пересоздаётся вместе с индексами, это не зависит от объёма данных
+        и не оставляет свободных страниц. Пересоздаётся только файл, который создала SQLiteDB
+        (метка в user_version) и в котором нет чужих таблиц; иначе, а также внутри batch(),
+        при чтении из других потоков и для :memory: таблицы очищаются DELETE в транзакции.
+        """
+        if self._batch_depth or self.concurrent_reads or self.db_path == ':memory:' or not self._owns_file():
+            self._delete_tables()
+            return
+        indexes = [sql for sql, in self.get_connection().execute(INDEX_DEFINITIONS_SQLITE)]
+        self.close()
+        self.conn = None
+        for suffix in ('', '-wal', '-shm', '-journal'):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.db_path + suffix)
+        if self.shard_by:
+            shutil.rmtree(self.shard_dir, ignore_errors=True)
+        self.create_tables()
+        conn = self.get_connection()
+        for sql in indexes:
+            conn.execute(sql)
+        self._commit(conn)
+        self.symbol_ids = {}
+        self._next_history_ids = {}
+
+    def _owns_file(self):
+        conn = self.get_connection()
+        if conn.execute('PRAGMA user_version').fetchone()[0] != OWNED_FILE_VERSION:
+            return False
+        return {name for name, in conn.execute(TABLE_NAMES_SQLITE)} <= OWN_TABLES
+
+    def _delete_tables(self):
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute('DELETE FROM active_orders')
-        cursor.execute('DELETE FROM order_history')
-        conn.commit()
+        if self.shard_by:
+            self._close_shards()
+            shutil.rmtree(self.shard_dir, ignore_errors=True)
+            os.makedirs(self.shard_dir, exist_ok=True)
+        else:
+            cursor.execute(f'DELETE FROM {self.history_table}')
+        if self.compact:
+            cursor.execute('DELETE FROM symbols')
+        cursor.execute('DELETE FROM book_checkpoint_orders')
+        cursor.execute('DELETE FROM book_checkpoints')
+        cursor.execute('DELETE FROM ingest_progress')
+        cursor.execute('DELETE FROM bars')
+        cursor.execute('DELETE FROM flow_metrics')
+        self._commit(conn)
+        self.symbol_ids = {}
+        self._next_history_ids = {}
 
-    def insert_history_batch(self, batch):
+    # --- файлы истории ---
+
+    def shard_key(self, symbol, timestamp):
+        if self.shard_by == 'symbol':
+            return re.sub(r'[^\w.-]', '_', symbol)
+        return str(moment_day(timestamp))
+
+    def history_shards(self):
+        """Ключи существующих файлов истории (инструменты или дни YYYYMMDD)"""
+        if not os.path.isdir(self.shard_dir):
+            return []
+        return sorted(name[:-len('.db')] for name in os.listdir(self.shard_dir) if name.endswith('.db'))
+
+    def shard_path(self, key):
+        return os.path.join(self.shard_dir, f'{key}.db')
+
+    def _shard_connection(self, key):
+        conn = self._shards.get(key)
+        if conn is None:
+            conn = self._shards[key] = self._connect(self.shard_path(key))
+            self._create_history_table(conn.cursor())
+            self._commit(conn)
+        return conn
+
+    def _history_connections(self):
+        if not self.shard_by:
+            return [self.get_connection()]
+        return [self._shard_connection(key) for key in self.history_shards()]
+
+    def history_days(self):
+        if self.shard_by == 'day':
+            return [int(key) for key in self.history_shards()]
+        days = set()
+        for conn in self._history_connections():
+            values = [value for value, in conn.execute(
+                HISTORY_DAYS_COMPACT_SQLITE if self.compact else HISTORY_DAYS_SQLITE)]
+            days.update(self.epoch_days_to_days(values) if self.compact else values)
+        return sorted(days)
+
+    def drop_history_before(self, day: int):
+        """Файлы истории по дням удаляются целиком, в остальных случаях - DELETE; освободившиеся
+        страницы используются следующими вставками"""
+        dropped = [history_day for history_day in self.history_days() if history_day < day]
+        if self.shard_by == 'day':
+            for history_day in dropped:
+                conn = self._shards.pop(str(history_day), None)
+                if conn is not None:
+                    conn.close()
+                for suffix in ('', '-wal', '-shm', '-journal'):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(self.shard_path(history_day) + suffix)
+        elif dropped:
+            bound = int(moments_to_ns(day * 1000000000)) if self.compact else day * 1000000000
+            column = 'timestamp_ns' if self.compact else 'timestamp'
+            for conn in self._history_connections():
+                conn.execute(f'DELETE FROM {self.history_table} WHERE {column} < ?', (bound,))
+                self._commit(conn)
         conn = self.get_connection()
+        conn.execute(DELETE_CHECKPOINT_ORDERS_BEFORE_SQLITE, (day * 1000000000,))
+        conn.execute(DELETE_CHECKPOINTS_BEFORE_SQLITE, (day * 1000000000,))
+        self._commit(conn)
+        return dropped
+
+    def export_history(self, from_ts: int, to_ts: int, batch_size: int = 100000):
+        """Порции истории; у файлов по инструменту - по очереди файлов"""
+        if self.shard_by == 'day':
+            keys = [key for key in self.history_shards() if moment_day(from_ts) <= int(key) <= moment_day(to_ts)]
+        elif self.shard_by:
+            keys = self.history_shards()
+        else:
+            keys = [None]
+        if self.compact:
+            with self._read_cursor() as cursor:
+                cursor.execute(ALL_SYMBOLS_SQLITE)
+                symbols = {symbol_id: symbol for symbol, symbol_id in cursor.fetchall()}
+            query, params = EXPORT_HISTORY_COMPACT_SQLITE, moment_range_to_ns(from_ts, to_ts)
+        else:
+            query, params = EXPORT_HISTORY_SQLITE, (from_ts, to_ts)
+        for key in keys:
+            with self._read_cursor(key) as cursor:
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    if self.compact:
+                        yield self.decode_export_rows([(symbols[row[0]], *row[1:]) for row in rows])
+                    else:
+                        yield [tuple(row) for row in rows]
+
+    def _close_shards(self):
+        for conn in self._shards.values():
+            conn.close()
+        self._shards = {}
+
+    def insert_history_batch(self, batch):
+        if not batch:
+            return
+        if not self.shard_by:
+            self._insert_history(self.get_connection(), None, batch)
+            return
+        shards = {}
+        for row in batch:
+            shards.setdefault(self.shard_key(row[0], row[2]), []).append(row)
+        for key, rows in shards.items():
+            self._insert_history(self._shard_connection(key), key, rows)
+
+    def _insert_history(self, conn, key, batch):
         cursor = conn.cursor()
-        cursor.executemany(INSERT_HISTORY_BATCH_SQLITE, batch)
-        conn.commit()
+        if self.compact:
+            rows = self.encode_history_rows(batch, self.get_symbol_ids(row[0] for row in batch))
+            start = self._next_history_ids.get(key)
+            if start is None:
+                cursor.execute(MAX_HISTORY_COMPACT_ID_SQLITE)
+                start = cursor.fetchone()[0] + 1
+            self._next_history_ids[key] = start + len(rows)
+            cursor.executemany(INSERT_HISTORY_COMPACT_BATCH_SQLITE,
+                               [(history_id, *row) for history_id, row in enumerate(rows, start)])
+        else:
+            cursor.executemany(INSERT_HISTORY_BATCH_SQLITE, batch)
+        self._commit(conn)
+
+    def get_symbol_ids(self, symbols):
+        """Коды инструментов из словаря symbols; новые инструменты добавляются"""
+        missing = set(symbols) - self.symbol_ids.keys()
+        if missing:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.executemany(INSERT_SYMBOL_SQLITE, [(symbol,) for symbol in missing])
+            self._commit(conn)
+            cursor.execute(ALL_SYMBOLS_SQLITE)
+            self.symbol_ids = dict(cursor.fetchall())
+        return self.symbol_ids
 
     def insert_active_order(self, order_id, symbol, operation, price, volume, timestamp):
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute(INSERT_ACTIVE_ORDER_SQLITE, (order_id, symbol, operation, price, volume, volume, timestamp))
-        conn.commit()
+        self._commit(conn)
 
     def process_trade(self, order_id, trade_volume):
         conn = self.get_connection()
@@ -57,41 +364,80 @@ class SQLiteDB(DBInterface):
                 self.delete_active_order(order_id)
             else:
                 cursor.execute(UPDATE_ACTIVE_ORDER_VOLUME_SQLITE, (new_remaining, order_id))
-                conn.commit()
+                self._commit(conn)
 
     def delete_active_order(self, order_id):
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute(DELETE_ACTIVE_ORDER_SQLITE, (order_id,))
-        conn.commit()
+        self._commit(conn)
 
-    def get_active_orders_count(self):
+    def insert_active_orders_batch(self, orders):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT COUNT(*) FROM active_orders')
-        return cursor.fetchone()[0]
+        cursor.executemany(INSERT_ACTIVE_ORDER_SQLITE, [
+            (order_id, symbol, operation, price, volume, volume, timestamp)
+            for order_id, symbol, operation, price, volume, timestamp in orders
+        ])
+        self._commit(conn)
 
-    def get_active_orders_sample(self, limit=10):
+    def process_trades_batch(self, trades):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute(SAMPLE_ACTIVE_ORDERS_SQLITE, (limit,))
-        return cursor.fetchall()
+        cursor.executemany(APPLY_TRADE_SQLITE, [(volume, order_id) for order_id, volume in trades])
+        cursor.executemany(DELETE_FILLED_ORDER_SQLITE, [(order_id,) for order_id, _ in trades])
+        self._commit(conn)
 
-    def get_symbols_summary(self):
+    def delete_active_orders_batch(self, order_ids):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute(SYMBOLS_SUMMARY_SQLITE)
-        return cursor.fetchall()
+        cursor.executemany(DELETE_ACTIVE_ORDER_SQLITE, [(order_id,) for order_id in order_ids])
+        self._commit(conn)
 
-    def get_best_prices(self, symbol: str, timestamp: int = None):
-        if timestamp is None:
-            timestamp = 99999999999999999
+    def apply_active_changes(self, inserts, trades, deletes):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute(BEST_PRICES_QUERY_SQLITE, (symbol, timestamp))
-        best_buy = cursor.fetchone()
-        cursor.execute(BEST_PRICES_QUERY_SQLITE_SELL, (symbol, timestamp))
-        best_sell = cursor.fetchone()
+        cursor.executemany(DELETE_ACTIVE_ORDER_SQLITE, [(order_id,) for order_id in deletes])
+        cursor.executemany(INSERT_ACTIVE_ORDER_SQLITE, inserts)
+        cursor.executemany(APPLY_TRADE_SQLITE, [(volume, order_id) for order_id, volume in trades])
+        cursor.executemany(DELETE_FILLED_ORDER_SQLITE, [(order_id,) for order_id, _ in trades])
+        self._commit(conn)
+
+    def replace_active_orders(self, orders):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM active_orders')
+        cursor.executemany(INSERT_ACTIVE_ORDER_SQLITE, orders)
+        self._commit(conn)
+
+    def get_active_orders_count(self):
+        with self._read_cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM active_orders')
+            return cursor.fetchone()[0]
+
+    def get_active_orders(self):
+        with self._read_cursor() as cursor:
+            cursor.execute(ALL_ACTIVE_ORDERS_SQLITE)
+            return cursor.fetchall()
+
+    def get_active_orders_sample(self, limit=10):
+        with self._read_cursor() as cursor:
+            cursor.execute(SAMPLE_ACTIVE_ORDERS_SQLITE, (limit,))
+            return cursor.fetchall()
+
+    def get_symbols_summary(self):
+        with self._read_cursor() as cursor:
+            cursor.execute(SYMBOLS_SUMMARY_SQLITE)
+            return cursor.fetchall()
+
+    def get_best_prices(self, symbol: str, timestamp: int = None):
+        if timestamp is None:
+            timestamp = LATEST_MOMENT
+        with self._read_cursor() as cursor:
+            cursor.execute(BEST_PRICES_QUERY_SQLITE, (symbol, timestamp))
+            best_buy = cursor.fetchone()
+            cursor.execute(BEST_PRICES_QUERY_SQLITE_SELL, (symbol, timestamp))
+            best_sell = cursor.fetchone()
         return {
             'symbol': symbol,
             'timestamp': timestamp,
@@ -99,6 +445,112 @@ class SQLiteDB(DBInterface):
             'min_sell_price': dict(best_sell) if best_sell else None
         }
 
+    def get_all_best_prices(self, timestamp: int = None):
+        if timestamp is None:
+            timestamp = LATEST_MOMENT
+        with self._read_cursor() as cursor:
+            cursor.execute(ALL_BEST_PRICES_QUERY_SQLITE, (timestamp,))
+            return self.group_best_prices(cursor.fetchall(), timestamp)
+
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        if timestamp is None:
+            timestamp = LATEST_MOMENT
+        with self._read_cursor() as cursor:
+            cursor.execute(DEPTH_QUERY_SQLITE, (symbol, timestamp, levels, symbol, timestamp, levels))
+            return self.group_depth(cursor.fetchall(), symbol, timestamp)
+
+    def insert_checkpoint(self, timestamp, orders):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(INSERT_CHECKPOINT_SQLITE, (timestamp,))
+        checkpoint_id = cursor.lastrowid
+        cursor.executemany(INSERT_CHECKPOINT_ORDERS_SQLITE, [(checkpoint_id, *order) for order in orders])
+        self._commit(conn)
+        return checkpoint_id
+
+    def get_checkpoint(self, symbol: str, timestamp: int):
+        with self._read_cursor() as cursor:
+            cursor.execute(GET_CHECKPOINT_SQLITE, (timestamp,))
+            checkpoint = cursor.fetchone()
+            if not checkpoint:
+                return None, []
+            cursor.execute(GET_CHECKPOINT_ORDERS_SQLITE, (checkpoint['checkpoint_id'], symbol))
+            return checkpoint['timestamp'], cursor.fetchall()
+
+    def get_history_range(self, symbol: str, from_ts: int, to_ts: int):
+        if self.shard_by:
+            return self._sharded_history_range(symbol, from_ts, to_ts)
+        with self._read_cursor() as cursor:
+            if self.compact:
+                cursor.execute(HISTORY_RANGE_COMPACT_SQLITE, (symbol, *moment_range_to_ns(from_ts, to_ts)))
+                return self.decode_history_rows(cursor.fetchall(), symbol)
+            cursor.execute(HISTORY_RANGE_SQLITE, (symbol, from_ts, to_ts))
+            return cursor.fetchall()
+
+    def _sharded_history_range(self, symbol, from_ts, to_ts):
+        # Файлы открываются по требованию отдельными подключениями: ATTACH ограничен
+        # десятью базами и недоступен внутри открытой транзакции
+        if self.shard_by == 'symbol':
+            keys = [key for key in [self.shard_key(symbol, None)] if key in self.history_shards()]
+        else:
+            keys = [key for key in self.history_shards() if moment_day(from_ts) <= int(key) <= moment_day(to_ts)]
+        if self.compact:
+            with self._read_cursor() as cursor:
+                cursor.execute(GET_SYMBOL_ID_SQLITE, (symbol,))
+                symbol_row = cursor.fetchone()
+            if symbol_row is None:
+                return []
+            params = (symbol_row[0], *moment_range_to_ns(from_ts, to_ts))
+        else:
+            params = (symbol, from_ts, to_ts)
+
+        # У каждого файла свой снимок: порция, попавшая в несколько файлов, может быть видна частично
+        rows = []
+        for key in keys:
+            with self._read_cursor(key) as cursor:
+                cursor.execute(HISTORY_RANGE_COMPACT_BY_ID_SQLITE if self.compact else HISTORY_RANGE_SQLITE, params)
+                rows.extend(cursor.fetchall())
+        return self.decode_history_rows(rows, symbol) if self.compact else rows
+
+    def upsert_bars(self, rows):
+        conn = self.get_connection()
+        conn.executemany(UPSERT_BARS_SQLITE, rows)
+        self._commit(conn)
+
+    def get_bars(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        with self._read_cursor() as cursor:
+            cursor.execute(BARS_RANGE_SQLITE, (symbol, period, from_ts, to_ts))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def upsert_flow_metrics(self, rows):
+        conn = self.get_connection()
+        conn.executemany(UPSERT_FLOW_METRICS_SQLITE, rows)
+        self._commit(conn)
+
+    def get_flow_metrics(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        with self._read_cursor() as cursor:
+            cursor.execute(FLOW_METRICS_RANGE_SQLITE, (symbol, period, from_ts, to_ts))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_ingest_progress(self, source: str):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(GET_INGEST_PROGRESS_SQLITE, (source,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def save_ingest_progress(self, source: str, byte_offset: int, last_timestamp: int, last_order_id: int, processed: int):
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(SAVE_INGEST_PROGRESS_SQLITE, (source, byte_offset, last_timestamp, last_order_id, processed))
+        self._commit(conn)
+
     def close(self):
+        self._close_shards()
+        with self._reader_lock:
+            for conn in self._reader_connections:
+                conn.close()
+            self._reader_connections = []
+        self._readers = threading.local()
         if self.conn:
             self.conn.close() 
\ No newline at end of file
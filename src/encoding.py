@@ -0,0 +1,80 @@
+import calendar
+from datetime import datetime, timezone
+import numpy as np
+
+# Цены хранятся целым числом шагов 1e-5 (как DECIMAL(15,5))
+PRICE_SCALE = 100000
+
+
+def moment_to_ms(moment: int) -> int:
+    """Метка вида YYYYMMDDHHMMSSmmm -> миллисекунды от эпохи"""
+    seconds, ms = divmod(int(moment), 1000)
+    seconds, second = divmod(seconds, 100)
+    seconds, minute = divmod(seconds, 100)
+    seconds, hour = divmod(seconds, 100)
+    seconds, day = divmod(seconds, 100)
+    year, month = divmod(seconds, 100)
+    return calendar.timegm((year, month, day, hour, minute, second)) * 1000 + ms
+
+
+def ms_to_moment(epoch_ms: int) -> int:
+    """Миллисекунды от эпохи -> метка вида YYYYMMDDHHMMSSmmm"""
+    seconds, ms = divmod(int(epoch_ms), 1000)
+    dt = datetime.fromtimestamp(seconds, timezone.utc)
+    return int(dt.strftime('%Y%m%d%H%M%S')) * 1000 + ms
+
+
+def moment_day(moment):
+    """Торговый день YYYYMMDD из метки YYYYMMDDHHMMSSmmm (число или массив)"""
+    return moment // 1000000000
+
+
+def price_to_ticks(price):
+    return np.rint(np.asarray(price, dtype=np.float64) * PRICE_SCALE).astype(np.int64)
+
+
+def ticks_to_price(ticks):
+    return np.asarray(ticks, dtype=np.int64) / PRICE_SCALE
+
+
+NS_PER_MS = 1000000
+MS_PER_DAY = 86400000
+# Границы меток, представимых в int64 наносекунд
+MIN_MOMENT = 19700101000000000
+MAX_MOMENT = 22620101000000000
+# Метка в ответах на запросы без timestamp: текущее состояние книги
+LATEST_MOMENT = 99999999999999999
+
+
+def moments_to_ns(moments):
+    """Метки YYYYMMDDHHMMSSmmm -> наносекунды от эпохи (UTC), массивом"""
+    moments = np.asarray(moments, dtype=np.int64)
+    date, time_of_day = np.divmod(moments, 1000000000)
+    year, month_day = np.divmod(date, 10000)
+    month, day = np.divmod(month_day, 100)
+    months = (year - 1970) * 12 + month - 1
+    days = months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) + day - 1
+    hour, rest = np.divmod(time_of_day, 10000000)
+    minute, rest = np.divmod(rest, 100000)
+    second, ms = np.divmod(rest, 1000)
+    return (days * MS_PER_DAY + ((hour * 60 + minute) * 60 + second) * 1000 + ms) * NS_PER_MS
+
+
+def ns_to_moments(epoch_ns):
+    """Наносекунды от эпохи -> метки YYYYMMDDHHMMSSmmm, массивом"""
+    days, ms_of_day = np.divmod(np.asarray(epoch_ns, dtype=np.int64) // NS_PER_MS, MS_PER_DAY)
+    dates = days.astype('datetime64[D]')
+    months = dates.astype('datetime64[M]')
+    years = dates.astype('datetime64[Y]')
+    year = years.astype(np.int64) + 1970
+    month = (months - years.astype('datetime64[M]')).astype(np.int64) + 1
+    day = (dates - months.astype('datetime64[D]')).astype(np.int64) + 1
+    seconds, ms = np.divmod(ms_of_day, 1000)
+    minutes, second = np.divmod(seconds, 60)
+    hour, minute = np.divmod(minutes, 60)
+    return (((((year * 100 + month) * 100 + day) * 100 + hour) * 100 + minute) * 100 + second) * 1000 + ms
+
+
+def moment_range_to_ns(from_ts: int, to_ts: int):
+    """Границы запроса по меткам -> границы в наносекундах (0 и 99999999999999999 допустимы)"""
+    return moments_to_ns(np.clip([from_ts, to_ts], MIN_MOMENT, MAX_MOMENT)).tolist()
@@ -0,0 +1,475 @@
+import bisect
+import heapq
+import logging
+import numpy as np
+from .encoding import LATEST_MOMENT
+
+logger = logging.getLogger(__name__)
+
+# Индексы полей заявки в книге
+OPERATION, PRICE, ORIGINAL_VOLUME, REMAINING_VOLUME, TIMESTAMP = range(5)
+
+FLUSH_MODES = ('diff', 'snapshot')
+
+
+def best_order_key(operation, price, timestamp, order_id):
+    """Порядок заявок стороны от лучшей, общий для движка и БД: покупки по убыванию цены,
+    продажи по возрастанию; при равной цене раньше выставленная, затем с меньшим order_id"""
+    return (-price if operation == 'B' else price, timestamp, order_id)
+
+
+def sample_orders(orders, limit: int = 10):
+    """limit последних по времени заявок из строк iter_orders, как SAMPLE_ACTIVE_ORDERS в БД"""
+    return [
+        {
+            'order_id': order_id,
+            'symbol': symbol,
+            'operation': operation,
+            'price': price,
+            'original_volume': original,
+            'remaining_volume': remaining,
+            'timestamp': timestamp,
+        }
+        for order_id, symbol, operation, price, original, remaining, timestamp in heapq.nlargest(
+            limit, orders, key=lambda order: order[6])
+    ]
+
+
+class PriceLevels:
+    """Одна сторона книги: отсортированные цены и агрегаты по уровню (объём, заявки)"""
+
+    def __init__(self, descending: bool):
+        self.descending = descending
+        self.prices = []
+        # price -> [суммарный остаток, {order_id: timestamp}]
+        self.levels = {}
+
+    def add(self, price, order_id, volume, timestamp):
+        level = self.levels.get(price)
+        if level is None:
+            level = self.levels[price] = [0, {}]
+            bisect.insort(self.prices, price)
+        level[0] += volume
+        level[1][order_id] = timestamp
+
+    def change(self, price, volume_delta):
+        self.levels[price][0] += volume_delta
+
+    def remove(self, price, order_id, volume):
+        level = self.levels[price]
+        level[0] -= volume
+        del level[1][order_id]
+        if not level[1]:
+            del self.levels[price]
+            del self.prices[bisect.bisect_left(self.prices, price)]
+
+    def best_price(self):
+        if not self.prices:
+            return None
+        return self.prices[-1] if self.descending else self.prices[0]
+
+    def top(self, count):
+        """До count уровней от лучшей цены: (цена, суммарный остаток, число заявок)"""
+        prices = self.prices[:-count - 1:-1] if self.descending else self.prices[:count]
+        return [(price, self.levels[price][0], len(self.levels[price][1])) for price in prices]
+
+    def best_order_id(self):
+        """Лучшая заявка по best_order_key: время пропорционально числу заявок лучшего уровня"""
+        price = self.best_price()
+        if price is None:
+            return None
+        return min(self.levels[price][1].items(), key=lambda item: (item[1], item[0]))[0]
+
+
+class ActiveOrderState:
+    """Общий разбор событий для состояний active_orders, которые ведутся в процессе"""
+
+    events_since_flush = 0
+    last_timestamp = None
+
+    def apply(self, action, order_id, symbol, operation, price, volume, timestamp):
+        if action == 1:
+            self.insert(order_id, symbol, operation, price, volume, timestamp)
+        elif action == 2:
+            self.trade(order_id, volume)
+        elif action == 0:
+            self.delete(order_id)
+        self.last_timestamp = timestamp
+        self.events_since_flush += 1
+
+    def apply_columns(self, cols: dict):
+        for event in zip(cols['action'].tolist(), cols['order_id'].tolist(), cols['symbol'].tolist(),
+                         cols['operation'].tolist(), cols['price'].tolist(), cols['volume'].tolist(),
+                         cols['timestamp'].tolist()):
+            self.apply(*event)
+
+
+class OrderBookEngine(ActiveOrderState):
+    """Состояние активных заявок в памяти процесса с периодической записью в active_orders.
+
+    События применяются к книгам по инструментам (order_id -> заявка) без обращений к БД.
+    Таблица active_orders обновляется при flush(): целиком (snapshot) или разницей
+    с момента предыдущей записи (diff). Семантика событий совпадает с insert_active_order,
+    process_trade и delete_active_order.
+    """
+
+    def __init__(self, flush_every: int = None, flush_mode: str = 'diff', track_changes: bool = True):
+        if flush_mode not in FLUSH_MODES:
+            raise ValueError(f"Unknown flush mode: {flush_mode}")
+        self.flush_every = flush_every
+        self.flush_mode = flush_mode
+        # Без учёта изменений движок только хранит книгу (flush в режиме diff ничего не пишет)
+        self.track_changes = track_changes
+        self.reset()
+
+    def reset(self):
+        self.books = {}
+        self.symbol_of = {}
+        # symbol -> {'B': PriceLevels, 'S': PriceLevels}, ведутся вместе с книгами
+        self.levels = {}
+        self.last_timestamp = None
+        self.events_since_flush = 0
+        # Изменения с момента последней записи в БД
+        self._inserted = set()
+        self._traded = {}
+        self._deleted = set()
+
+    def insert(self, order_id, symbol, operation, price, volume, timestamp):
+        if order_id in self.symbol_of:
+            return
+        self._add(order_id, symbol, [operation, price, volume, volume, timestamp])
+        if self.track_changes:
+            self._inserted.add(order_id)
+
+    def trade(self, order_id, trade_volume):
+        symbol = self.symbol_of.get(order_id)
+        if symbol is None:
+            return
+        order = self.books[symbol][order_id]
+        if order[REMAINING_VOLUME] - trade_volume <= 0:
+            self.delete(order_id)
+            return
+        order[REMAINING_VOLUME] -= trade_volume
+        side = self._side(symbol, order[OPERATION])
+        if side is not None:
+            side.change(order[PRICE], -trade_volume)
+        if self.track_changes and order_id not in self._inserted:
+            self._traded[order_id] = self._traded.get(order_id, 0) + trade_volume
+
+    def delete(self, order_id):
+        symbol = self.symbol_of.pop(order_id, None)
+        if symbol is None:
+            return
+        order = self.books[symbol].pop(order_id)
+        side = self._side(symbol, order[OPERATION])
+        if side is not None and order[REMAINING_VOLUME] > 0:
+            side.remove(order[PRICE], order_id, order[REMAINING_VOLUME])
+        if not self.track_changes:
+            return
+        self._traded.pop(order_id, None)
+        if order_id in self._inserted:
+            self._inserted.discard(order_id)
+        else:
+            self._deleted.add(order_id)
+
+    def load(self, orders):
+        """Загружает заявки, уже записанные в active_orders (или в снимок)"""
+        for order_id, symbol, operation, price, original, remaining, timestamp in orders:
+            self._add(order_id, symbol, [operation, price, original, remaining, timestamp])
+
+    def _add(self, order_id, symbol, order):
+        self.books.setdefault(symbol, {})[order_id] = order
+        self.symbol_of[order_id] = symbol
+        if order[REMAINING_VOLUME] > 0:
+            side = self._side(symbol, order[OPERATION], create=True)
+            if side is not None:
+                side.add(order[PRICE], order_id, order[REMAINING_VOLUME], order[TIMESTAMP])
+
+    def _side(self, symbol, operation, create=False):
+        sides = self.levels.get(symbol)
+        if sides is None:
+            if not create:
+                return None
+            sides = self.levels[symbol] = {'B': PriceLevels(descending=True), 'S': PriceLevels(descending=False)}
+        return sides.get(operation)
+
+    def get_active_orders_count(self):
+        return len(self.symbol_of)
+
+    def best_order(self, symbol: str, operation: str):
+        """id лучшей заявки стороны (порядок best_order_key) или None, если сторона пуста"""
+        side = self._side(symbol, operation)
+        return side.best_order_id() if side is not None else None
+
+    def _best_order(self, symbol, operation, side_name):
+        order_id = self.best_order(symbol, operation)
+        if order_id is None:
+            return None
+        return {
+            'operation': side_name,
+            'order_id': order_id,
+            'price': self.books[symbol][order_id][PRICE],
+            'remaining_volume': self.books[symbol][order_id][REMAINING_VOLUME],
+        }
+
+    def get_best_prices(self, symbol: str, timestamp: int = None):
+        """Лучшие цены по текущему состоянию книги без обхода остальных уровней"""
+        return {
+            'symbol': symbol,
+            'timestamp': LATEST_MOMENT if timestamp is None else timestamp,
+            'max_buy_price': self._best_order(symbol, 'B', 'BUY'),
+            'min_sell_price': self._best_order(symbol, 'S', 'SELL')
+        }
+
+    def get_all_best_prices(self, timestamp: int = None):
+        """Как в БД: только инструменты, у которых есть хотя бы одна непустая сторона"""
+        return {symbol: self.get_best_prices(symbol, timestamp)
+                for symbol, sides in self.levels.items() if sides['B'].prices or sides['S'].prices}
+
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        """Уровни цен стакана по текущему состоянию книги, время пропорционально levels"""
+        depth = {'symbol': symbol, 'timestamp': LATEST_MOMENT if timestamp is None else timestamp,
+                 'bids': [], 'asks': []}
+        for operation, key in (('B', 'bids'), ('S', 'asks')):
+            side = self._side(symbol, operation)
+            if side is not None:
+                depth[key] = [{'price': price, 'volume': volume, 'orders': orders}
+                              for price, volume, orders in side.top(levels)]
+        return depth
+
+    def covers(self, timestamp: int = None):
+        """Можно ли ответить на запрос с фильтром timestamp <= ? по текущему состоянию"""
+        return timestamp is None or (self.last_timestamp is not None and timestamp >= self.last_timestamp)
+
+    def get_active_orders_sample(self, limit: int = 10):
+        return sample_orders(self.iter_orders(), limit)
+
+    def get_symbols_summary(self):
+        """Сводка по инструментам и сторонам, как SYMBOLS_SUMMARY в БД"""
+        summary = {}
+        for symbol, book in self.books.items():
+            for order in book.values():
+                row = summary.get((symbol, order[OPERATION]))
+                if row is None:
+                    row = summary[(symbol, order[OPERATION])] = {
+                        'symbol': symbol,
+                        'operation': order[OPERATION],
+                        'orders_count': 0,
+                        'total_volume': 0,
+                        'min_price': order[PRICE],
+                        'max_price': order[PRICE],
+                        'avg_price': 0,
+                    }
+                row['orders_count'] += 1
+                row['total_volume'] += order[REMAINING_VOLUME]
+                row['min_price'] = min(row['min_price'], order[PRICE])
+                row['max_price'] = max(row['max_price'], order[PRICE])
+                row['avg_price'] += order[PRICE]
+        for row in summary.values():
+            row['avg_price'] /= row['orders_count']
+        return [summary[key] for key in sorted(summary)]
+
+    def iter_orders(self):
+        for symbol, book in self.books.items():
+            for order_id, (operation, price, original, remaining, timestamp) in book.items():
+                yield order_id, symbol, operation, price, original, remaining, timestamp
+
+    def _order_row(self, order_id):
+        symbol = self.symbol_of[order_id]
+        operation, price, original, remaining, timestamp = self.books[symbol][order_id]
+        return order_id, symbol, operation, price, original, remaining, timestamp
+
+    def maybe_flush(self, db):
+        if self.flush_every and self.events_since_flush >= self.flush_every:
+            self.flush(db)
+
+    def flush(self, db):
+        """Записывает состояние в active_orders через DBInterface"""
+        if self.flush_mode == 'snapshot':
+            db.replace_active_orders(list(self.iter_orders()))
+        else:
+            # Заявка, снятая и выставленная заново с тем же id, попадает и в удаления, и во вставки
+            inserts = [self._order_row(order_id) for order_id in self._inserted]
+            trades = list(self._traded.items())
+            deletes = list(self._deleted)
+            if inserts or trades or deletes:
+                db.apply_active_changes(inserts, trades, deletes)
+        logger.debug(f"Active orders flushed ({self.flush_mode}): {len(self.symbol_of)} orders")
+        self.events_since_flush = 0
+        self._inserted = set()
+        self._traded = {}
+        self._deleted = set()
+
+
+class ActiveOrderCoalescer(ActiveOrderState):
+    """Сворачивает события active_orders внутри окна в одну итоговую операцию на заявку.
+
+    Заявка, выставленная и снятая (или исполненная) внутри окна, не порождает записей;
+    выставленная и частично исполненная записывается одной вставкой с итоговым остатком.
+    Для заявок из предыдущих окон копятся объём сделок и признак снятия.
+
+    Итог построчной загрузки зависит от того, есть ли заявка в active_orders: повторная
+    вставка живой заявки игнорируется, а вставка после исполнения или снятия создаёт её
+    заново. Поэтому свёртка помнит остатки заявок, записанных в БД (order_id -> остаток, без
+    цен и книг); заявка, снятая и выставленная заново с тем же id, записывается удалением
+    и вставкой. При продолжении загрузки в непустую БД остатки передаются через load().
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # Остатки заявок в active_orders на начало окна
+        self._live = {}
+        self._reset_window()
+
+    def _reset_window(self):
+        self.events_since_flush = 0
+        # Вставки окна; заявка в _deleted и _inserted удаляется из БД и вставляется заново
+        self._inserted = {}
+        self._traded = {}
+        self._deleted = set()
+
+    def load(self, orders):
+        """Заявки, уже записанные в active_orders: строки (order_id, ..., remaining_volume, timestamp)"""
+        for order in orders:
+            self._live[order[0]] = order[5]
+
+    def _exists(self, order_id):
+        """Есть ли заявка в active_orders после событий окна"""
+        if order_id in self._inserted:
+            return True
+        if order_id in self._deleted or order_id not in self._live:
+            return False
+        traded = self._traded.get(order_id)
+        return traded is None or self._live[order_id] - traded > 0
+
+    def insert(self, order_id, symbol, operation, price, volume, timestamp):
+        if self._exists(order_id):
+            return
+        if order_id in self._live:
+            # Запись из прошлых окон снята или исполнена: удаление перед новой вставкой
+            self._deleted.add(order_id)
+        self._traded.pop(order_id, None)
+        self._inserted[order_id] = [order_id, symbol, operation, price, volume, volume, timestamp]
+
+    def trade(self, order_id, trade_volume):
+        row = self._inserted.get(order_id)
+        if row is not None:
+            row[5] -= trade_volume
+            if row[5] <= 0:
+                del self._inserted[order_id]
+        elif order_id not in self._deleted and order_id in self._live:
+            self._traded[order_id] = self._traded.get(order_id, 0) + trade_volume
+
+    def delete(self, order_id):
+        self._inserted.pop(order_id, None)
+        self._traded.pop(order_id, None)
+        if order_id in self._live:
+            self._deleted.add(order_id)
+
+    def maybe_flush(self, db):
+        # Окно свёртки — одна порция процессора
+        self.flush(db)
+
+    def flush(self, db):
+        inserts = [tuple(row) for row in self._inserted.values()]
+        trades = list(self._traded.items())
+        deletes = list(self._deleted)
+        if inserts or trades or deletes:
+            db.apply_active_changes(inserts, trades, deletes)
+
+        live = self._live
+        for order_id in deletes:
+            del live[order_id]
+        for order_id, volume in trades:
+            remaining = live[order_id] - volume
+            if remaining > 0:
+                live[order_id] = remaining
+            else:
+                del live[order_id]
+        for row in inserts:
+            live[row[0]] = row[5]
+        self._reset_window()
+
+
+ACTIVE_COLUMNS = ('order_id', 'symbol', 'operation', 'price', 'original_volume', 'remaining_volume', 'timestamp')
+
+
+def replay_active_columns(active: dict, cols: dict) -> dict:
+    """Активные заявки после применения порции событий, векторно; active и результат - колонки ACTIVE_COLUMNS.
+
+    Семантика совпадает с OrderBookEngine. Заявка с одной вставкой активна, если после
+    вставки не было снятия и сделки не исчерпали объём (события до вставки игнорируются).
+    Заявки с несколькими вставками в порции применяются построчно движком.
+    """
+    if active is None:
+        active = {name: np.empty(0, dtype=object if name in ('symbol', 'operation') else np.int64)
+                  for name in ACTIVE_COLUMNS}
+        active['price'] = np.empty(0, dtype=np.float64)
+    count = len(active['order_id'])
+    # Активные заявки - вставки в начале потока с исходным объёмом отдельно
+    order_ids = np.concatenate([active['order_id'], cols['order_id']])
+    action = np.concatenate([np.ones(count, dtype=np.int8), cols['action']])
+    volume = np.concatenate([active['remaining_volume'], cols['volume']])
+    original = np.concatenate([active['original_volume'], cols['volume']])
+    events = np.flatnonzero(np.isin(action, (0, 1, 2)))
+    events = events[np.lexsort((events, order_ids[events]))]
+
+    # Группы событий одной заявки в исходном порядке
+    ids = order_ids[events]
+    first = np.ones(len(ids), dtype=bool)
+    first[1:] = ids[1:] != ids[:-1]
+    group = np.cumsum(first) - 1
+    groups = int(first.sum())
+    event_action = action[events]
+    is_insert = event_action == 1
+    inserts = np.bincount(group, weights=is_insert, minlength=groups).astype(np.int64)
+
+    # Заявки с одной вставкой: её позиция, сделки и снятия после неё
+    single = inserts[group] == 1
+    insert_at = np.full(groups, -1, dtype=np.int64)
+    insert_at[group[is_insert & single]] = np.flatnonzero(is_insert & single)
+    after = single & (np.arange(len(ids)) > insert_at[group])
+    trades = after & (event_action == 2)
+    traded = np.bincount(group[trades], weights=volume[events[trades]], minlength=groups).astype(np.int64)
+    traded_any = np.bincount(group[trades], minlength=groups) > 0
+    deleted = np.bincount(group[after & (event_action == 0)], minlength=groups) > 0
+    inserted = insert_at[insert_at >= 0]
+    # Сделка, исчерпавшая остаток, снимает заявку; заявка с нулевым объёмом активна до первой сделки
+    owner = group[inserted]
+    live = ~deleted[owner] & (~traded_any[owner] | (traded[owner] < volume[events[inserted]]))
+    survivors = events[inserted[live]]
+    remaining = volume[survivors] - traded[owner[live]]
+
+    def column(name):
+        return np.concatenate([active[name], cols[name]])
+
+    result = {
+        'order_id': order_ids[survivors],
+        'symbol': column('symbol')[survivors],
+        'operation': column('operation')[survivors],
+        'price': column('price')[survivors],
+        'original_volume': original[survivors],
+        'remaining_volume': remaining,
+        'timestamp': np.concatenate([active['timestamp'], cols['timestamp']])[survivors],
+    }
+
+    irregular = events[inserts[group] > 1]
+    if len(irregular):
+        engine = OrderBookEngine(track_changes=False)
+        irregular.sort()
+        symbols, operations, prices, timestamps = (column('symbol'), column('operation'), column('price'),
+                                                   np.concatenate([active['timestamp'], cols['timestamp']]))
+        for position in irregular.tolist():
+            if position < count:
+                engine.load([tuple(active[name][position] for name in ACTIVE_COLUMNS)])
+            else:
+                engine.apply(int(action[position]), int(order_ids[position]), symbols[position], operations[position],
+                             float(prices[position]), int(volume[position]), int(timestamps[position]))
+        rows = list(engine.iter_orders())
+        if rows:
+            extra = dict(zip(ACTIVE_COLUMNS, map(list, zip(*rows))))
+            result = {name: np.concatenate([result[name], np.array(extra[name], dtype=result[name].dtype)])
+                      for name in ACTIVE_COLUMNS}
+    return result
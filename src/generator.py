@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+from .encoding import moments_to_ns, ns_to_moments, NS_PER_MS
+from .processor import COLUMNS_10, COLUMNS_7
+
+logger = logging.getLogger(__name__)
+
+LIFETIME_DISTRIBUTIONS = ('exponential', 'lognormal', 'pareto')
+
+HEADER_10 = '#SYMBOL,SYSTEM,TYPE,MOMENT,ID,ACTION,PRICE,VOLUME,ID_DEAL,PRICE_DEAL'
+HEADER_7 = ','.join(COLUMNS_7)
+
+
+class TickGenerator:
+    """Синтетический поток событий заявок с воспроизводимым результатом (seed).
+
+    Каждая заявка выставляется (action 1) и живёт случайное время (lifetime_mean_ms,
+    распределение lifetime); с вероятностью fill_ratio она исполняется одной или двумя
+    сделками (action 2) на весь объём, иначе снимается (action 0). Цена заявки отстоит
+    от середины стакана инструмента, которая меняется случайным блужданием с шагом
+    volatility на заявку. События генерируются блоками и выдаются по времени, поэтому
+    файл любого размера пишется с ограниченной памятью; заявки, не закрытые к концу
+    файла, остаются активными.
+    """
+
+    def __init__(self, symbols: int = 50, seed: int = 0, lifetime: str = 'exponential', lifetime_mean_ms: float = 5000,
+                 fill_ratio: float = 0.3, volatility: float = 0.0005, orders_per_ms: float = 20,
+                 start_moment: int = 20241001100000000, block_orders: int = 200000):
+        if lifetime not in LIFETIME_DISTRIBUTIONS:
+            raise ValueError(f"Unknown lifetime distribution: {lifetime}")
+        self.lifetime = lifetime
+        self.lifetime_mean_ms = lifetime_mean_ms
+        self.fill_ratio = fill_ratio
+        self.volatility = volatility
+        self.orders_per_ms = orders_per_ms
+        self.start_ms = int(moments_to_ns(start_moment)) // NS_PER_MS
+        self.block_orders = block_orders
+        self.rng = np.random.default_rng(seed)
+
+        self.symbols = np.array([f'S{index:04d}' for index in range(symbols)], dtype=object)
+        # Цены инструментов от 1 до 100000, шаг цены - 1e-4 от начальной цены (степень десяти)
+        base = np.exp(self.rng.uniform(0, np.log(100000), symbols))
+        self.tick = 10.0 ** np.floor(np.log10(base) - 4)
+        self.mid = base
+        # Частота инструментов неравномерна, как на бирже
+        weights = self.rng.pareto(1.2, symbols) + 1
+        self.symbol_weights = weights / weights.sum()
+
+    def _lifetimes(self, count):
+        mean = self.lifetime_mean_ms
+        if self.lifetime == 'exponential':
+            return self.rng.exponential(mean, count)
+        if self.lifetime == 'lognormal':
+            sigma = 1.5
+            return self.rng.lognormal(np.log(mean) - sigma ** 2 / 2, sigma, count)
+        # Парето с показателем 1.5: много коротких заявок и длинный хвост
+        return (self.rng.pareto(1.5, count)) * mean * 0.5
+
+    def _orders(self, first_order_index, clock_start):
+        """Блок заявок: время выставления, инструмент, сторона, цена, объём"""
+        count = self.block_orders
+        clock = clock_start + np.cumsum(self.rng.exponential(1 / self.orders_per_ms, count))
+        symbol = self.rng.choice(len(self.symbols), count, p=self.symbol_weights)
+
+        # Случайное блуждание середины по заявкам каждого инструмента
+        steps = self.rng.normal(0, self.volatility, count)
+        order = np.argsort(symbol, kind='stable')
+        sorted_symbols = symbol[order]
+        cumulative = np.cumsum(steps[order])
+        starts = np.searchsorted(sorted_symbols, np.arange(len(self.symbols)))
+        offset = np.concatenate([[0], cumulative])[starts]
+        walk = np.empty(count)
+        walk[order] = cumulative - offset[sorted_symbols]
+        mid = self.mid[symbol] * np.exp(walk)
+        ends = np.searchsorted(sorted_symbols, np.arange(len(self.symbols)), side='right') - 1
+        present = ends >= starts
+        self.mid[present] = self.mid[present] * np.exp(cumulative[ends[present]] - offset[present])
+
+        buy = self.rng.random(count) < 0.5
+        depth = np.abs(self.rng.normal(0, 0.002, count)) + 0.0002
+        tick = self.tick[symbol]
+        price = np.round(mid * np.where(buy, 1 - depth, 1 + depth) / tick) * tick
+        volume = np.minimum(self.rng.geometric(0.3, count), 1000)
+        order_id = 1000000000 + first_order_index + np.arange(count, dtype=np.int64)
+        return clock, symbol, buy, np.round(price, 5), volume, order_id
+
+    def _block_events(self, first_order_index, clock_start):
+        clock, symbol, buy, price, volume, order_id = self._orders(first_order_index, clock_start)
+        count = len(clock)
+        end = clock + self._lifetimes(count)
+        filled = self.rng.random(count) < self.fill_ratio
+        # Часть исполняемых заявок исполняется двумя сделками
+        split = filled & (volume > 1) & (self.rng.random(count) < 0.5)
+        first_trade = np.where(split, self.rng.integers(1, np.maximum(volume, 2)), volume)
+        split_clock = clock + (end - clock) * self.rng.random(count)
+
+        parts = [
+            (clock, np.ones(count, dtype=np.int8), volume, np.ones(count, dtype=bool)),
+            (np.where(split, split_clock, end), np.where(filled, 2, 0).astype(np.int8),
+             np.where(filled, first_trade, volume), np.ones(count, dtype=bool)),
+            (end, np.full(count, 2, dtype=np.int8), volume - first_trade, split),
+        ]
+        # Порядок внутри одной миллисекунды: выставление раньше сделок и снятия той же заявки
+        events = {name: [] for name in ('clock', 'stage', 'action', 'volume', 'order')}
+        for stage, (event_clock, action, event_volume, mask) in enumerate(parts):
+            events['clock'].append(event_clock[mask])
+            events['stage'].append(np.full(mask.sum(), stage, dtype=np.int8))
+            events['action'].append(action[mask])
+            events['volume'].append(event_volume[mask])
+            events['order'].append(np.flatnonzero(mask))
+        events = {name: np.concatenate(values) for name, values in events.items()}
+        orders = events.pop('order')
+        events.update(
+            symbol=symbol[orders], buy=buy[orders], price=price[orders], order_id=order_id[orders],
+        )
+        return events, clock[-1]
+
+    def blocks(self, events: int):
+        """Блоки событий по времени (словари колонок), всего events событий"""
+        emitted = 0
+        order_index = 0
+        clock_start = 0.0
+        pending = None
+        while emitted < events:
+            block, clock_start = self._block_events(order_index, clock_start)
+            order_index += self.block_orders
+            if pending is not None:
+                block = {name: np.concatenate([pending[name], block[name]]) for name in block}
+            # События позже последнего выставления блока переносятся в следующий блок
+            ready = block['clock'] <= clock_start
+            pending = {name: values[~ready] for name, values in block.items()}
+            block = {name: values[ready] for name, values in block.items()}
+            order = np.lexsort((block['stage'], block['order_id'], block['clock'].astype(np.int64)))
+            block = {name: values[order][:events - emitted] for name, values in block.items()}
+            emitted += len(block['clock'])
+            yield block
+
+    def frames(self, events: int, columns: int = 10):
+        """Блоки событий в виде DataFrame с колонками CSV нужного формата"""
+        deal_id = 0
+        for block in self.blocks(events):
+            moments = ns_to_moments((self.start_ms + block['clock'].astype(np.int64)) * NS_PER_MS)
+            frame = pd.DataFrame({
+                'symbol': self.symbols[block['symbol']],
+                'system': 'F',
+                'type': np.where(block['buy'], 'B', 'S'),
+                'moment': moments,
+                'id': block['order_id'],
+                'action': block['action'],
+                'price': block['price'],
+                'volume': block['volume'],
+            })
+            trades = block['action'] == 2
+            id_deal = pd.array(5000000000 + deal_id + np.cumsum(trades) - 1, dtype='Int64')
+            id_deal[~trades] = pd.NA
+            frame['id_deal'] = id_deal
+            frame['price_deal'] = np.where(trades, block['price'], np.nan)
+            deal_id += int(trades.sum())
+            yield frame[COLUMNS_10 if columns == 10 else COLUMNS_7]
+
+    def write_csv(self, path: str, events: int, columns: int = 10):
+        if columns not in (7, 10):
+            raise ValueError(f"Unexpected number of columns: {columns}")
+        written = 0
+        with open(path, 'w', newline='') as f:
+            f.write((HEADER_10 if columns == 10 else HEADER_7) + '\n')
+            for frame in self.frames(events, columns):
+                frame.to_csv(f, header=False, index=False, float_format='%.5f')
+                written += len(frame)
+                logger.info(f"Generated: {written}")
+        return written
+
+
+def add_generator_arguments(parser):
+    """Параметры TickGenerator в командной строке (общие для генератора и замеров)"""
+    parser.add_argument('--symbols', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--lifetime', choices=LIFETIME_DISTRIBUTIONS, default='exponential')
+    parser.add_argument('--lifetime-mean-ms', type=float, default=5000)
+    parser.add_argument('--fill-ratio', type=float, default=0.3)
+    parser.add_argument('--volatility', type=float, default=0.0005)
+    parser.add_argument('--orders-per-ms', type=float, default=20)
+    parser.add_argument('--start-moment', type=int, default=20241001100000000)
+    parser.add_argument('--block-orders', type=int, default=200000)
+
+
+def generator_options(args):
+    """Аргументы TickGenerator из разобранной командной строки"""
+    return {
+        'symbols': args.symbols,
+        'seed': args.seed,
+        'lifetime': args.lifetime,
+        'lifetime_mean_ms': args.lifetime_mean_ms,
+        'fill_ratio': args.fill_ratio,
+        'volatility': args.volatility,
+        'orders_per_ms': args.orders_per_ms,
+        'start_moment': args.start_moment,
+        'block_orders': args.block_orders,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетический CSV с событиями заявок')
+    parser.add_argument('output')
+    parser.add_argument('--events', type=int, default=1000000)
+    parser.add_argument('--columns', type=int, choices=(7, 10), default=10)
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    TickGenerator(**generator_options(args)).write_csv(args.output, args.events, args.columns)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -62,7 +62,7 @@ def process_real_data():
         logger.error(f"File not found: {csv_file}")
         return
     
-    db = SQLiteDB()
+    db = SQLiteDB(profile='ingest')
     db.create_tables()
     
     processor = TickDataProcessor(db)
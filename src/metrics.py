@@ -0,0 +1,275 @@
+import collections
+import os
+import sys
+import threading
+import time
+
+# Имена метрик в формате Prometheus получают этот префикс
+METRIC_PREFIX = 'tick_'
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items())) if labels else ()
+
+
+def _format_labels(key: tuple) -> str:
+    if not key:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in key
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+class _Timer:
+    __slots__ = ('metrics', 'name', 'labels', 'started')
+
+    def __init__(self, metrics, name, labels):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Метрики в памяти процесса: счётчики, таймеры (число, сумма, максимум) и уровни (gauge).
+
+    Запись - словарь и блокировка на вызов, поэтому реестр можно держать включённым
+    постоянно и писать в него из потоков. Метки передаются именованными аргументами.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+        self.gauges = {}
+
+    def inc(self, name: str, value=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+
+    def set_gauge(self, name: str, value, **labels):
+        """Текущее значение и максимум за время работы (например, глубина очереди)"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            gauge = self.gauges.get(key)
+            if gauge is None:
+                self.gauges[key] = [value, value]
+            else:
+                gauge[0] = value
+                if value > gauge[1]:
+                    gauge[1] = value
+
+    def timer(self, name: str, **labels):
+        """Контекстный менеджер: время выполнения блока в таймер name"""
+        return _Timer(self, name, labels)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+            self.gauges.clear()
+
+    def snapshot(self) -> dict:
+        """Копия метрик в виде, пригодном для JSON и передачи между процессами"""
+        with self._lock:
+            return {
+                'counters': [{'name': name, 'labels': dict(key), 'value': value}
+                             for (name, key), value in self.counters.items()],
+                'timers': [{'name': name, 'labels': dict(key), 'count': count, 'sum': total, 'max': peak}
+                           for (name, key), (count, total, peak) in self.timers.items()],
+                'gauges': [{'name': name, 'labels': dict(key), 'value': value, 'max': peak}
+                           for (name, key), (value, peak) in self.gauges.items()],
+            }
+
+    def merge(self, snapshot: dict, **labels):
+        """Добавляет снимок другого реестра (например, воркера) с дополнительными метками"""
+        for item in snapshot['counters']:
+            self.inc(item['name'], item['value'], **item['labels'], **labels)
+        for item in snapshot['timers']:
+            key = (item['name'], _label_key({**item['labels'], **labels}))
+            with self._lock:
+                timer = self.timers.setdefault(key, [0, 0.0, 0.0])
+                timer[0] += item['count']
+                timer[1] += item['sum']
+                timer[2] = max(timer[2], item['max'])
+        for item in snapshot['gauges']:
+            key = (item['name'], _label_key({**item['labels'], **labels}))
+            with self._lock:
+                gauge = self.gauges.get(key)
+                self.gauges[key] = [item['value'], item['max'] if gauge is None else max(gauge[1], item['max'])]
+
+    def to_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus; таймеры - summary с _count и _sum плюс gauge _max"""
+        lines = []
+        snapshot = self.snapshot()
+
+        def grouped(items):
+            groups = collections.defaultdict(list)
+            for item in items:
+                groups[METRIC_PREFIX + item['name']].append(item)
+            return sorted(groups.items())
+
+        for name, items in grouped(snapshot['counters']):
+            lines.append(f'# TYPE {name} counter')
+            lines.extend(f'{name}{_format_labels(_label_key(item["labels"]))} {item["value"]}' for item in items)
+        for name, items in grouped(snapshot['timers']):
+            lines.append(f'# TYPE {name} summary')
+            for item in items:
+                labels = _format_labels(_label_key(item['labels']))
+                lines.append(f'{name}_count{labels} {item["count"]}')
+                lines.append(f'{name}_sum{labels} {item["sum"]:.9f}')
+            lines.append(f'# TYPE {name}_max gauge')
+            lines.extend(f'{name}_max{_format_labels(_label_key(item["labels"]))} {item["max"]:.9f}' for item in items)
+        for name, items in grouped(snapshot['gauges']):
+            lines.append(f'# TYPE {name} gauge')
+            lines.extend(f'{name}{_format_labels(_label_key(item["labels"]))} {item["value"]}' for item in items)
+            lines.append(f'# TYPE {name}_max gauge')
+            lines.extend(f'{name}_max{_format_labels(_label_key(item["labels"]))} {item["max"]}' for item in items)
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str):
+        """Запись дампа целиком через временный файл (textfile collector node_exporter)"""
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+
+class NullMetrics:
+    """Приёмник метрик, который ничего не записывает"""
+
+    enabled = False
+
+    def inc(self, name: str, value=1, **labels):
+        pass
+
+    def observe(self, name: str, seconds: float, **labels):
+        pass
+
+    def set_gauge(self, name: str, value, **labels):
+        pass
+
+    def timer(self, name: str, **labels):
+        return _NULL_TIMER
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+_registry = MetricsRegistry()
+
+
+def get_registry():
+    """Реестр процесса, в который пишут компоненты без явно заданного приёмника"""
+    return _registry
+
+
+def set_registry(metrics):
+    """Замена приёмника процесса (MetricsRegistry, NullMetrics или свой с теми же методами)"""
+    global _registry
+    _registry = metrics
+
+
+def queue_depth(queue):
+    """Число элементов в очереди или None, если платформа не сообщает его (multiprocessing на macOS)"""
+    try:
+        return queue.qsize()
+    except NotImplementedError:
+        return None
+
+
+class SamplingProfiler:
+    """Семплирующий профилировщик одного потока на время одного прогона.
+
+    Фоновый поток раз в interval секунд снимает стек профилируемого потока
+    (sys._current_frames) и считает одинаковые стеки. Результат - свёрнутые стеки
+    (формат flamegraph.pl и speedscope) и функции с наибольшим собственным временем.
+    """
+
+    def __init__(self, output: str = None, interval: float = 0.005, thread_id: int = None):
+        self.output = output
+        self.interval = interval
+        self.thread_id = thread_id
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.thread_id is None:
+            self.thread_id = threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        if self.output:
+            self.write(self.output)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self) -> list:
+        return [f'{stack} {count}' for stack, count in self.stacks.most_common()]
+
+    def write(self, path: str):
+        with open(path, 'w') as f:
+            f.write('\n'.join(self.collapsed()) + '\n')
+
+    def top(self, limit: int = 20) -> list:
+        """(функция, доля семплов, где она на вершине стека)"""
+        total = sum(self.stacks.values()) or 1
+        leaves = collections.Counter()
+        for stack, count in self.stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        return [(function, count / total) for function, count in leaves.most_common(limit)]
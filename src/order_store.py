@@ -0,0 +1,306 @@
+import logging
+import numpy as np
+from .db.base import DBInterface
+from .encoding import LATEST_MOMENT, PRICE_SCALE
+from .engine import ActiveOrderState, sample_orders
+
+logger = logging.getLogger(__name__)
+
+# Мультипликатор хеширования Фибоначчи (2^64 / золотое сечение)
+HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+MASK_64 = (1 << 64) - 1
+EMPTY = -1
+
+
+class ActiveOrderStore(ActiveOrderState):
+    """Активные заявки в колонках NumPy: около 49 байт на заявку при полной загрузке.
+
+    Колонки (order_id, код инструмента, код стороны, цена в шагах 1e-5, исходный и
+    текущий остаток, метка времени) выделяются заранее на capacity заявок и удваиваются
+    при заполнении. Индекс order_id -> слот - открытая адресация с линейным пробированием
+    (заполнение не выше половины), освобождённые слоты переиспользуются через стек
+    свободных. Вставка, сделка и снятие - O(1); сводки считаются векторно по колонкам.
+
+    Подходит как engine процессора: active_orders записывается снимком (replace_active_orders)
+    каждые flush_every событий и в конце загрузки. Запросы к лучшим ценам и стакану
+    просматривают заявки инструмента, в отличие от уровней цен OrderBookEngine - память
+    здесь важнее. Объёмы должны помещаться в int32.
+    """
+
+    def __init__(self, capacity: int = 1 << 16, flush_every: int = None):
+        self.initial_capacity = max(int(capacity), 16)
+        self.flush_every = flush_every
+        self.reset()
+
+    def reset(self):
+        self._allocate(self.initial_capacity)
+        self.symbols = []
+        self._symbol_codes = {}
+        self.operations = []
+        self._operation_codes = {}
+        self.last_timestamp = None
+        self.events_since_flush = 0
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.order_id = np.zeros(capacity, dtype=np.int64)
+        # Код инструмента; EMPTY - слот свободен
+        self.symbol = np.full(capacity, EMPTY, dtype=np.int32)
+        self.operation = np.zeros(capacity, dtype=np.int8)
+        self.price = np.zeros(capacity, dtype=np.int64)
+        self.original_volume = np.zeros(capacity, dtype=np.int32)
+        self.remaining_volume = np.zeros(capacity, dtype=np.int32)
+        self.timestamp = np.zeros(capacity, dtype=np.int64)
+        self._free = np.zeros(capacity, dtype=np.int32)
+        self._free_count = 0
+        # Слоты, ни разу не занятые, идут подряд с _next_slot
+        self._next_slot = 0
+        self._count = 0
+        self._build_index(capacity)
+
+    def _build_index(self, capacity):
+        bits = max((2 * capacity - 1).bit_length(), 4)
+        self._index_shift = 64 - bits
+        self._index_mask = (1 << bits) - 1
+        self._index = np.full(1 << bits, EMPTY, dtype=np.int32)
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        used = self._next_slot
+        for name in ('order_id', 'symbol', 'operation', 'price', 'original_volume', 'remaining_volume', 'timestamp'):
+            old = getattr(self, name)
+            column = np.full(capacity, EMPTY, dtype=old.dtype) if name == 'symbol' else np.zeros(capacity, dtype=old.dtype)
+            column[:used] = old[:used]
+            setattr(self, name, column)
+        free = np.zeros(capacity, dtype=np.int32)
+        free[:self._free_count] = self._free[:self._free_count]
+        self._free = free
+        self.capacity = capacity
+        self._build_index(capacity)
+        for slot in np.flatnonzero(self.symbol[:used] != EMPTY).tolist():
+            self._index[self._probe(int(self.order_id[slot]))] = slot
+        logger.debug(f"Active order store grown to {capacity} slots")
+
+    def _home(self, order_id):
+        return ((order_id * HASH_MULTIPLIER) & MASK_64) >> self._index_shift
+
+    def _probe(self, order_id):
+        """Позиция order_id в индексе или первая пустая позиция его цепочки"""
+        index, order_ids, mask = self._index, self.order_id, self._index_mask
+        position = self._home(order_id)
+        while True:
+            slot = index[position]
+            if slot == EMPTY or order_ids[slot] == order_id:
+                return position
+            position = (position + 1) & mask
+
+    def _slot(self, order_id):
+        slot = self._index[self._probe(order_id)]
+        return None if slot == EMPTY else int(slot)
+
+    def _code(self, value, codes, values):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def insert(self, order_id, symbol, operation, price, volume, timestamp):
+        self._put(order_id, symbol, operation, price, volume, volume, timestamp)
+
+    def _put(self, order_id, symbol, operation, price, original, remaining, timestamp):
+        position = self._probe(order_id)
+        if self._index[position] != EMPTY:
+            return
+        if self._free_count:
+            self._free_count -= 1
+            slot = int(self._free[self._free_count])
+        else:
+            if self._next_slot == self.capacity:
+                self._grow()
+                position = self._probe(order_id)
+            slot = self._next_slot
+            self._next_slot += 1
+        self._index[position] = slot
+        self.order_id[slot] = order_id
+        self.symbol[slot] = self._code(symbol, self._symbol_codes, self.symbols)
+        self.operation[slot] = self._code(operation, self._operation_codes, self.operations)
+        self.price[slot] = round(price * PRICE_SCALE)
+        self.original_volume[slot] = original
+        self.remaining_volume[slot] = remaining
+        self.timestamp[slot] = timestamp
+        self._count += 1
+
+    def trade(self, order_id, trade_volume):
+        slot = self._slot(order_id)
+        if slot is None:
+            return
+        remaining = int(self.remaining_volume[slot]) - trade_volume
+        if remaining <= 0:
+            self.delete(order_id)
+        else:
+            self.remaining_volume[slot] = remaining
+
+    def delete(self, order_id):
+        position = self._probe(order_id)
+        slot = self._index[position]
+        if slot == EMPTY:
+            return
+        self.symbol[slot] = EMPTY
+        self._free[self._free_count] = slot
+        self._free_count += 1
+        self._count -= 1
+        self._remove_from_index(position)
+
+    def _remove_from_index(self, position):
+        """Удаление со сдвигом назад: цепочки линейного пробирования остаются без разрывов"""
+        index, order_ids, mask = self._index, self.order_id, self._index_mask
+        index[position] = EMPTY
+        hole = position
+        position = (position + 1) & mask
+        while True:
+            slot = index[position]
+            if slot == EMPTY:
+                return
+            home = self._home(int(order_ids[slot]))
+            # Элемент можно перенести в дыру, если его домашняя позиция не между дырой и им
+            if (position - home) & mask >= (position - hole) & mask:
+                index[hole] = slot
+                index[position] = EMPTY
+                hole = position
+            position = (position + 1) & mask
+
+    def load(self, orders):
+        """Загружает заявки, уже записанные в active_orders (или в снимок)"""
+        for order_id, symbol, operation, price, original, remaining, timestamp in orders:
+            self._put(order_id, symbol, operation, price, original, remaining, timestamp)
+
+    def get_active_orders_count(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        """Память под колонки, индекс и стек свободных слотов"""
+        columns = (self.order_id, self.symbol, self.operation, self.price, self.original_volume,
+                   self.remaining_volume, self.timestamp, self._free, self._index)
+        return sum(column.nbytes for column in columns)
+
+    def _live_slots(self, symbol: str = None, timestamp: int = None):
+        live = self.symbol[:self._next_slot]
+        if symbol is None:
+            mask = live != EMPTY
+        else:
+            code = self._symbol_codes.get(symbol)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            mask = live == code
+        if timestamp is not None:
+            mask &= self.timestamp[:self._next_slot] <= timestamp
+        return np.flatnonzero(mask)
+
+    def iter_orders(self):
+        slots = self._live_slots()
+        symbols, operations = self.symbols, self.operations
+        prices = (self.price[slots] / PRICE_SCALE).tolist()
+        for order_id, symbol, operation, price, original, remaining, timestamp in zip(
+                self.order_id[slots].tolist(), self.symbol[slots].tolist(), self.operation[slots].tolist(), prices,
+                self.original_volume[slots].tolist(), self.remaining_volume[slots].tolist(),
+                self.timestamp[slots].tolist()):
+            yield order_id, symbols[symbol], operations[operation], price, original, remaining, timestamp
+
+    def get_active_orders_sample(self, limit: int = 10):
+        return sample_orders(self.iter_orders(), limit)
+
+    def get_symbols_summary(self):
+        """Сводка по инструментам и сторонам, как SYMBOLS_SUMMARY в БД"""
+        slots = self._live_slots()
+        if not len(slots):
+            return []
+        symbol, operation = self.symbol[slots], self.operation[slots]
+        price, volume = self.price[slots], self.remaining_volume[slots].astype(np.int64)
+        order = np.lexsort((price, operation, symbol))
+        group = symbol[order].astype(np.int64) * len(self.operations) + operation[order]
+        starts = np.flatnonzero(np.diff(group, prepend=-1))
+        ends = np.append(starts[1:], len(order)) - 1
+        counts = np.diff(np.append(starts, len(order)))
+        sorted_price = price[order]
+
+        rows = [
+            {
+                'symbol': self.symbols[symbol_code],
+                'operation': self.operations[operation_code],
+                'orders_count': count,
+                'total_volume': total_volume,
+                'min_price': min_price / PRICE_SCALE,
+                'max_price': max_price / PRICE_SCALE,
+                'avg_price': price_sum / PRICE_SCALE / count,
+            }
+            for symbol_code, operation_code, count, total_volume, min_price, max_price, price_sum in zip(
+                symbol[order][starts].tolist(), operation[order][starts].tolist(), counts.tolist(),
+                np.add.reduceat(volume[order], starts).tolist(), sorted_price[starts].tolist(),
+                sorted_price[ends].tolist(), np.add.reduceat(sorted_price, starts).tolist())
+        ]
+        return sorted(rows, key=lambda row: (row['symbol'], row['operation']))
+
+    def _best_rows(self, slots):
+        """Лучшие заявки по (инструмент, сторона) среди slots: строки group_best_prices"""
+        codes = {self._operation_codes[operation]: operation for operation in ('B', 'S')
+                 if operation in self._operation_codes}
+        slots = slots[(self.remaining_volume[slots] > 0) & np.isin(self.operation[slots], list(codes))]
+        if not len(slots):
+            return []
+        symbol, operation = self.symbol[slots], self.operation[slots]
+        # Порядок best_order_key: цена, затем более ранняя заявка, затем меньший order_id
+        key = np.where(operation == self._operation_codes.get('B', EMPTY), -self.price[slots], self.price[slots])
+        order = np.lexsort((self.order_id[slots], self.timestamp[slots], key, operation, symbol))
+        group = symbol[order].astype(np.int64) * len(self.operations) + operation[order]
+        best = slots[order[np.flatnonzero(np.diff(group, prepend=-1))]]
+        return [
+            (self.symbols[symbol_code], codes[operation_code], order_id, price / PRICE_SCALE, remaining, timestamp)
+            for symbol_code, operation_code, order_id, price, remaining, timestamp in zip(
+                self.symbol[best].tolist(), self.operation[best].tolist(), self.order_id[best].tolist(),
+                self.price[best].tolist(), self.remaining_volume[best].tolist(), self.timestamp[best].tolist())
+        ]
+
+    def get_best_prices(self, symbol: str, timestamp: int = None):
+        label = LATEST_MOMENT if timestamp is None else timestamp
+        result = DBInterface.group_best_prices(self._best_rows(self._live_slots(symbol, timestamp)), label)
+        return result.get(symbol, {'symbol': symbol, 'timestamp': label,
+                                   'max_buy_price': None, 'min_sell_price': None})
+
+    def get_all_best_prices(self, timestamp: int = None):
+        label = LATEST_MOMENT if timestamp is None else timestamp
+        return DBInterface.group_best_prices(self._best_rows(self._live_slots(timestamp=timestamp)), label)
+
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        depth = {'symbol': symbol, 'timestamp': LATEST_MOMENT if timestamp is None else timestamp,
+                 'bids': [], 'asks': []}
+        slots = self._live_slots(symbol, timestamp)
+        slots = slots[self.remaining_volume[slots] > 0]
+        for operation, key in (('B', 'bids'), ('S', 'asks')):
+            code = self._operation_codes.get(operation)
+            side = slots[self.operation[slots] == code] if code is not None else slots[:0]
+            if not len(side):
+                continue
+            prices, inverse = np.unique(self.price[side], return_inverse=True)
+            volumes = np.bincount(inverse, weights=self.remaining_volume[side]).astype(np.int64)
+            orders = np.bincount(inverse)
+            top = slice(None, -levels - 1, -1) if operation == 'B' else slice(None, levels)
+            depth[key] = [{'price': price / PRICE_SCALE, 'volume': volume, 'orders': count}
+                          for price, volume, count in zip(prices[top].tolist(), volumes[top].tolist(),
+                                                          orders[top].tolist())]
+        return depth
+
+    def covers(self, timestamp: int = None):
+        """Можно ли ответить на запрос с фильтром timestamp <= ? по текущему состоянию"""
+        return timestamp is None or (self.last_timestamp is not None and timestamp >= self.last_timestamp)
+
+    def maybe_flush(self, db):
+        if self.flush_every and self.events_since_flush >= self.flush_every:
+            self.flush(db)
+
+    def flush(self, db):
+        """Записывает состояние в active_orders снимком"""
+        db.replace_active_orders(list(self.iter_orders()))
+        logger.debug(f"Active orders flushed (snapshot): {self._count} orders")
+        self.events_since_flush = 0
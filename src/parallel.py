@@ -0,0 +1,276 @@
+import logging
+import multiprocessing
+import os
+import queue
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .db import PostgresDB, SQLiteDB
+from .metrics import MetricsRegistry, get_registry, queue_depth
+from .processor import TickDataProcessor, decode_chunk, read_csv_chunks
+from .sources import expand_sources, group_sources_by_day
+
+logger = logging.getLogger(__name__)
+
+QUEUE_PUT_TIMEOUT = 1.0
+
+
+def symbol_partition(symbol: str, partitions: int) -> int:
+    """Номер партиции инструмента; crc32 одинаков во всех процессах, в отличие от hash()"""
+    return zlib.crc32(symbol.encode()) % partitions
+
+
+class SQLitePartitions:
+    """Фабрика БД для воркеров: отдельный файл SQLite на каждую партицию"""
+
+    def __init__(self, path_template: str = 'tick_data.part{partition}.db', compact: bool = False):
+        self.path_template = path_template
+        self.compact = compact
+
+    def path(self, partition: int) -> str:
+        return self.path_template.format(partition=partition)
+
+    def __call__(self, partition: int):
+        return SQLiteDB(self.path(partition), compact=self.compact)
+
+    def merge(self, target_path: str, partitions: int):
+        """Сливает файлы партиций в одну БД SQLite"""
+        target = SQLiteDB(target_path, compact=self.compact)
+        target.create_tables()
+        target.clear_tables()
+        conn = target.get_connection()
+        for partition in range(partitions):
+            conn.execute('ATTACH DATABASE ? AS part', (self.path(partition),))
+            if self.compact:
+                # Коды инструментов в файлах партиций свои: сопоставляются по имени
+                conn.execute('INSERT OR IGNORE INTO main.symbols (symbol) SELECT symbol FROM part.symbols ORDER BY id')
+                offset = conn.execute('SELECT COALESCE(MAX(id), 0) FROM main.order_history_v2').fetchone()[0]
+                conn.execute('''
+                    INSERT INTO main.order_history_v2
+                        (id, symbol_id, operation, timestamp_ns, order_id, action_type, price, volume)
+                    SELECT ? + h.id, s.id, h.operation, h.timestamp_ns, h.order_id, h.action_type, h.price, h.volume
+                    FROM part.order_history_v2 h
+                    JOIN part.symbols ps ON ps.id = h.symbol_id
+                    JOIN main.symbols s ON s.symbol = ps.symbol
+                ''', (offset,))
+            else:
+                conn.execute('''
+                    INSERT INTO order_history (symbol, operation, timestamp, order_id, action_type, price, volume)
+                    SELECT symbol, operation, timestamp, order_id, action_type, price, volume
+                    FROM part.order_history ORDER BY id
+                ''')
+            conn.execute('''
+                INSERT OR IGNORE INTO active_orders
+                    (order_id, symbol, operation, price, original_volume, remaining_volume, timestamp)
+                SELECT order_id, symbol, operation, price, original_volume, remaining_volume, timestamp
+                FROM part.active_orders
+            ''')
+            conn.commit()
+            conn.execute('DETACH DATABASE part')
+        return target
+
+
+class PostgresPartitions:
+    """Фабрика БД для воркеров: общая база PostgreSQL, у каждого воркера своё подключение"""
+
+    def __init__(self, **connection_params):
+        self.connection_params = connection_params
+
+    def __call__(self, partition: int):
+        return PostgresDB(min_conn=1, max_conn=1, **self.connection_params)
+
+
+def _ingest_worker(partition, db_factory, engine_factory, coalesce, events, results):
+    db = db_factory(partition)
+    # Свой реестр: при fork реестр процесса унаследовал бы метрики родителя
+    metrics = MetricsRegistry()
+    processor = TickDataProcessor(db, engine_factory() if engine_factory else None, metrics=metrics)
+    processor.begin(coalesce=coalesce, clear=False)
+
+    processed_count = 0
+    symbols = set()
+    started = time.perf_counter()
+    while True:
+        cols = events.get()
+        if cols is None:
+            break
+        processor.process_columns(cols)
+        processed_count += len(cols['order_id'])
+        symbols.update(np.unique(cols['symbol']).tolist())
+    processor.finish()
+    elapsed = time.perf_counter() - started
+
+    results.put({
+        'partition': partition,
+        'pid': os.getpid(),
+        'processed': processed_count,
+        'symbols': len(symbols),
+        'elapsed': elapsed,
+        'metrics': metrics.snapshot(),
+    })
+    db.close()
+
+
+class ParallelIngestor:
+    """Многопроцессная загрузка: инструменты распределяются по воркерам, у каждого своё состояние и подключение.
+
+    Читатель раскладывает порции по партициям crc32(symbol) % workers; события одного
+    инструмента попадают к одному воркеру в исходном порядке. Метрики воркеров
+    добавляются в metrics с меткой worker.
+    """
+
+    def __init__(self, db_factory, workers: int = None, engine_factory=None, coalesce: bool = False,
+                 queue_size: int = 4, metrics=None):
+        self.db_factory = db_factory
+        self.workers = workers or os.cpu_count() or 1
+        self.engine_factory = engine_factory
+        self.coalesce = coalesce
+        self.queue_size = queue_size
+        self.metrics = metrics if metrics is not None else get_registry()
+
+    def process_csv_file(self, csv_file: str, limit: int = None, batch_size: int = 50000):
+        logger.info(f"Processing file: {csv_file} ({self.workers} workers)")
+
+        for partition in range(self.workers):
+            db = self.db_factory(partition)
+            db.create_tables()
+            db.clear_tables()
+            db.close()
+
+        events = [multiprocessing.Queue(self.queue_size) for _ in range(self.workers)]
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(
+                target=_ingest_worker,
+                args=(partition, self.db_factory, self.engine_factory, self.coalesce, events[partition], results),
+            )
+            for partition in range(self.workers)
+        ]
+        for process in processes:
+            process.start()
+
+        processed_count = 0
+        started = time.perf_counter()
+        try:
+            read_started = time.perf_counter()
+            for chunk in read_csv_chunks(csv_file, batch_size, typed=True):
+                self.metrics.observe('ingest_stage_seconds', time.perf_counter() - read_started, stage='read')
+                if limit:
+                    if processed_count >= limit:
+                        break
+                    chunk = chunk.iloc[:limit - processed_count]
+
+                with self.metrics.timer('ingest_stage_seconds', stage='decode'):
+                    cols = decode_chunk(chunk)
+                    symbols, inverse = np.unique(cols['symbol'], return_inverse=True)
+                    partition_of = np.array([symbol_partition(symbol, self.workers) for symbol in symbols.tolist()])
+                    row_partition = partition_of[inverse]
+                for partition in range(self.workers):
+                    mask = row_partition == partition
+                    if mask.any():
+                        # Время ожидания места в очереди - признак того, что воркер не успевает
+                        with self.metrics.timer('ingest_queue_wait_seconds', queue=f'events{partition}'):
+                            self._put(events[partition], processes[partition],
+                                      {name: values[mask] for name, values in cols.items()})
+                        depth = queue_depth(events[partition])
+                        if depth is not None:
+                            self.metrics.set_gauge('ingest_queue_depth', depth, queue=f'events{partition}')
+
+                processed_count += len(chunk)
+                logger.info(f"Processed: {processed_count}")
+                read_started = time.perf_counter()
+        finally:
+            for partition in range(self.workers):
+                if processes[partition].is_alive():
+                    self._put(events[partition], processes[partition], None)
+
+        report = self._collect(results, processes)
+        for process in processes:
+            process.join()
+        for worker in report:
+            self.metrics.merge(worker.pop('metrics'), worker=worker['partition'])
+
+        elapsed = time.perf_counter() - started
+        rate = processed_count / elapsed if elapsed > 0 else 0.0
+        for worker in sorted(report, key=lambda item: item['partition']):
+            logger.info(f"  Worker {worker['partition']}: {worker['processed']} events, "
+                        f"{worker['symbols']} symbols, {worker['elapsed']:.2f}s")
+        logger.info(f"Processing completed. Processed: {processed_count}, {rate:.0f} events/sec "
+                    f"({self.workers} workers)")
+        return {'processed': processed_count, 'elapsed': elapsed, 'events_per_sec': rate, 'workers': report}
+
+    @staticmethod
+    def _collect(results, processes):
+        report = []
+        while len(report) < len(processes):
+            try:
+                report.append(results.get(timeout=QUEUE_PUT_TIMEOUT))
+            except queue.Empty:
+                for process in processes:
+                    if process.exitcode:
+                        raise RuntimeError(f"Worker process {process.pid} exited with code {process.exitcode}")
+        return report
+
+    @staticmethod
+    def _put(events, process, item):
+        while True:
+            if not process.is_alive():
+                raise RuntimeError(f"Worker process {process.pid} exited with code {process.exitcode}")
+            try:
+                events.put(item, timeout=QUEUE_PUT_TIMEOUT)
+                return
+            except queue.Full:
+                continue
+
+
+def _ingest_day(day, files, db_factory, engine_factory, options):
+    db = db_factory(day)
+    db.create_tables()
+    metrics = MetricsRegistry()
+    processor = TickDataProcessor(db, engine_factory() if engine_factory else None, metrics=metrics)
+    result = processor.process_csv_file(files, **options)
+    db.close()
+    return {'day': day, 'files': len(files), 'pid': os.getpid(), **result, 'metrics': metrics.snapshot()}
+
+
+class DailyIngestor:
+    """Загрузка архива по дням: файлы одного дня читаются по порядку одним процессом, разные дни - параллельно.
+
+    Состояние стакана у каждого дня своё (день начинается с пустой книги), поэтому
+    db_factory(day) должна давать для дня отдельное хранилище, например
+    SQLitePartitions('tick_data.{partition}.db'): загрузка дня очищает таблицы.
+    День берётся из имени файла (YYYYMMDD). Метрики дней добавляются в metrics с меткой day.
+    """
+
+    def __init__(self, db_factory, workers: int = None, engine_factory=None, metrics=None):
+        self.db_factory = db_factory
+        self.workers = workers or os.cpu_count() or 1
+        self.engine_factory = engine_factory
+        self.metrics = metrics if metrics is not None else get_registry()
+
+    def process_sources(self, source, batch_size: int = 50000, vectorized: bool = True, coalesce: bool = False):
+        days = group_sources_by_day(expand_sources(source))
+        if not days:
+            logger.info("No days to process")
+            return {'processed': 0, 'elapsed': 0.0, 'events_per_sec': 0.0, 'days': []}
+        logger.info(f"Processing {len(days)} days ({self.workers} workers)")
+        options = {'batch_size': batch_size, 'vectorized': vectorized, 'coalesce': coalesce}
+
+        started = time.perf_counter()
+        with ProcessPoolExecutor(min(self.workers, len(days))) as executor:
+            futures = [
+                executor.submit(_ingest_day, day, files, self.db_factory, self.engine_factory, options)
+                for day, files in sorted(days.items())
+            ]
+            report = [future.result() for future in futures]
+        for day in report:
+            self.metrics.merge(day.pop('metrics'), day=day['day'])
+            logger.info(f"  Day {day['day']}: {day['files']} files, {day['processed']} events, {day['elapsed']:.2f}s")
+
+        processed_count = sum(day['processed'] for day in report)
+        elapsed = time.perf_counter() - started
+        rate = processed_count / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Processing completed. Processed: {processed_count}, {rate:.0f} events/sec "
+                    f"({self.workers} workers)")
+        return {'processed': processed_count, 'elapsed': elapsed, 'events_per_sec': rate, 'days': report}
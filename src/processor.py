@@ -1,39 +1,375 @@
+import contextlib
+import io
+import os
+import threading
+import time
+import numpy as np
 import pandas as pd
 import logging
-from .db import DBInterface
+from .analytics import FlowAnalytics
+from .asof import AsOfBook, CheckpointWriter, sample_best_prices
+from .bars import BarAggregator
+from .binlog import BinaryLogReader, is_binary_log
+from .db import DBInterface, InstrumentedDB
+from .engine import ACTIVE_COLUMNS, ActiveOrderCoalescer, OrderBookEngine, replay_active_columns
+from .metrics import SamplingProfiler, get_registry
+from .sources import expand_sources, open_source
 
 logger = logging.getLogger(__name__)
 
+COLUMNS_10 = ['symbol', 'system', 'type', 'moment', 'id', 'action', 'price', 'volume', 'id_deal', 'price_deal']
+COLUMNS_7 = ['symbol', 'type', 'moment', 'id', 'action', 'price', 'volume']
+
+# Типы колонок для колоночного режима
+CSV_DTYPES = {
+    'symbol': 'category',
+    'system': 'category',
+    'type': 'category',
+    'moment': 'int64',
+    'id': 'int64',
+    'action': 'int8',
+    'price': 'float64',
+    'volume': 'int64',
+    'id_deal': 'Int64',
+    'price_deal': 'float64',
+}
+
+# Номера сделок длиннее мантиссы float64: читаются целыми и в построчном режиме
+DEAL_DTYPES = {'id_deal': 'Int64'}
+
+# Режим слежения за растущим файлом
+FOLLOW_READ_BLOCK = 16 << 20
+
+# Порядок применения событий к active_orders внутри порции
+KIND_INSERT, KIND_TRADE, KIND_DELETE = 0, 1, 2
+
+
+def columns_for(count: int) -> list:
+    if count == 10:
+        return COLUMNS_10
+    elif count == 7:
+        return COLUMNS_7
+    raise ValueError(f"Unexpected number of columns: {count}")
+
+
+def typed_dtypes(columns: list) -> dict:
+    return {name: CSV_DTYPES[name] for name in columns if name in CSV_DTYPES}
+
+
+def read_csv_chunks(csv_file, batch_size: int, typed: bool = False):
+    """Порции CSV из файла, каталога, маски или списка файлов по порядку; сжатые файлы читаются без распаковки на диск"""
+    for path in expand_sources(csv_file):
+        with open_source(path) as stream:
+            # Первая строка - заголовок, по нему определяем формат
+            columns = columns_for(stream.readline().count(b',') + 1)
+            dtype = typed_dtypes(columns) if typed else {name: DEAL_DTYPES[name] for name in columns if name in DEAL_DTYPES}
+
+            # Читаем CSV порциями для экономии памяти
+            with pd.read_csv(stream, comment='#', chunksize=batch_size, names=columns, header=None,
+                             dtype=dtype) as reader:
+                yield from reader
+
+
+def decode_chunk(chunk: pd.DataFrame) -> dict:
+    """Раскладывает порцию CSV в типизированные массивы NumPy"""
+    def decode_category(series):
+        series = series.astype('category')
+        categories = np.asarray(series.cat.categories, dtype=object)
+        return categories[series.cat.codes.to_numpy()]
+
+    cols = {
+        'symbol': decode_category(chunk['symbol']),
+        'operation': decode_category(chunk['type']),
+        'timestamp': chunk['moment'].to_numpy(dtype=np.int64),
+        'order_id': chunk['id'].to_numpy(dtype=np.int64),
+        'action': chunk['action'].to_numpy(dtype=np.int8),
+        'price': chunk['price'].to_numpy(dtype=np.float64),
+        'volume': chunk['volume'].to_numpy(dtype=np.int64),
+    }
+    # Сделки есть только в формате с 10 колонками; 0 - событие без сделки
+    if 'id_deal' in chunk:
+        cols['deal_id'] = chunk['id_deal'].astype('Int64').fillna(0).to_numpy(dtype=np.int64)
+        cols['deal_price'] = chunk['price_deal'].to_numpy(dtype=np.float64, na_value=np.nan)
+    return cols
+
+
+def slice_columns(cols: dict, start: int, stop: int = None) -> dict:
+    return {name: values[start:stop] for name, values in cols.items()}
+
+
+def history_rows(cols: dict) -> list:
+    """Строки order_history из колонок порции"""
+    return list(zip(
+        cols['symbol'].tolist(), cols['operation'].tolist(), cols['timestamp'].tolist(),
+        cols['order_id'].tolist(), cols['action'].tolist(), cols['price'].tolist(), cols['volume'].tolist(),
+    ))
+
+
 class TickDataProcessor:
-    def __init__(self, db: DBInterface):
+    def __init__(self, db: DBInterface, engine: OrderBookEngine = None, checkpoints: CheckpointWriter = None,
+                 metrics=None, bars: BarAggregator = None, analytics: FlowAnalytics = None):
+        # Время этапов загрузки и вызовов БД пишется в приёмник метрик (по умолчанию реестр процесса)
+        self.metrics = metrics if metrics is not None else get_registry()
+        for stage, capability in ((checkpoints, 'checkpoints'), (bars, 'bars'), (analytics, 'flow_metrics')):
+            if stage and db is not None and not db.supports(capability):
+                raise ValueError(f"{type(db).__name__} does not support {capability}")
+        if self.metrics.enabled and not isinstance(db, InstrumentedDB):
+            db = InstrumentedDB(db, self.metrics)
         self.db = db
-    
-    def process_csv_file(self, csv_file: str, limit: int = None, batch_size: int = 1000):
+        # Если задан движок, заявки ведутся в памяти, а active_orders пишется снимками
+        self.engine = engine
+        # Снимки книги для запросов на прошлые моменты снимаются с движка
+        if checkpoints and not engine:
+            raise ValueError("Checkpoints require an in-memory engine")
+        self.checkpoints = checkpoints
+        # Бары OHLCV по сделкам строятся при загрузке и пишутся в bars
+        self.bars = bars
+        # Метрики потока заявок по интервалам считаются при загрузке и пишутся в flow_metrics
+        self.analytics = analytics
+        self._state = None
+        # Изменения движка идут под блокировкой; version растёт после каждого изменения,
+        # по ней читатели из других потоков (service.QueryService) узнают, что состояние обновилось
+        self.lock = threading.Lock()
+        self.version = 0
+
+    def process_csv_file(self, csv_file: str, limit: int = None, batch_size: int = 1000, vectorized: bool = False,
+                         coalesce: bool = False, profile: str = None):
+        """Загрузка CSV; profile - файл для свёрнутых стеков семплирующего профилировщика на время загрузки"""
         logger.info(f"Processing file: {csv_file}")
-        
-        self.db.clear_tables()
-        
-        history_batch = []
+
+        self.begin(coalesce=coalesce)
+
         processed_count = 0
-        
-        # Определяем колонки для разных форматов
-        sample_df = pd.read_csv(csv_file, comment='#', nrows=1)
-        if len(sample_df.columns) == 10:
-            columns = ['symbol', 'system', 'type', 'moment', 'id', 'action', 'price', 'volume', 'id_deal', 'price_deal']
-        elif len(sample_df.columns) == 7:
-            columns = ['symbol', 'type', 'moment', 'id', 'action', 'price', 'volume']
+        started = time.perf_counter()
+
+        with SamplingProfiler(profile) if profile else contextlib.nullcontext():
+            read_started = time.perf_counter()
+            for chunk in read_csv_chunks(csv_file, batch_size, vectorized):
+                self.metrics.observe('ingest_stage_seconds', time.perf_counter() - read_started, stage='read')
+                if limit:
+                    if processed_count >= limit:
+                        break
+                    chunk = chunk.iloc[:limit - processed_count]
+
+                with self.db.batch():
+                    if vectorized:
+                        with self.metrics.timer('ingest_stage_seconds', stage='decode'):
+                            cols = decode_chunk(chunk)
+                        self.process_columns(cols)
+                    else:
+                        self._process_rows(chunk)
+                        self._end_chunk()
+                        self.metrics.inc('ingest_events_total', len(chunk))
+                        self.metrics.inc('ingest_chunks_total')
+
+                processed_count += len(chunk)
+                logger.info(f"Processed: {processed_count}")
+                read_started = time.perf_counter()
+
+            self.finish()
+
+        elapsed = time.perf_counter() - started
+        rate = processed_count / elapsed if elapsed > 0 else 0.0
+        active_count = self.db.get_active_orders_count()
+        logger.info(f"Processing completed. Processed: {processed_count}, Active orders: {active_count}, "
+                    f"{rate:.0f} events/sec ({'vectorized' if vectorized else 'rows'})")
+        return {'processed': processed_count, 'elapsed': elapsed, 'events_per_sec': rate}
+
+    def process_binlog_file(self, path: str, limit: int = None, batch_size: int = 50000, coalesce: bool = False):
+        """Загрузка двоичного журнала (binlog.convert_csv): порции колонок читаются из memmap без разбора CSV"""
+        logger.info(f"Processing binary log: {path}")
+        reader = BinaryLogReader(path)
+        self.begin(coalesce=coalesce)
+
+        processed_count = 0
+        started = time.perf_counter()
+        read_started = time.perf_counter()
+        for cols in reader.chunks(batch_size, limit):
+            self.metrics.observe('ingest_stage_seconds', time.perf_counter() - read_started, stage='read')
+            self.process_columns(cols)
+            processed_count += len(cols['order_id'])
+            logger.info(f"Processed: {processed_count}")
+            read_started = time.perf_counter()
+        self.finish()
+
+        elapsed = time.perf_counter() - started
+        rate = processed_count / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Processing completed. Processed: {processed_count}, {rate:.0f} events/sec (binary log)")
+        return {'processed': processed_count, 'elapsed': elapsed, 'events_per_sec': rate}
+
+    def rebuild_active_orders(self, path: str, batch_size: int = 1000000):
+        """Пересчёт active_orders по двоичному журналу без истории: состояние считается векторно и пишется снимком"""
+        logger.info(f"Rebuilding active orders from: {path}")
+        started = time.perf_counter()
+        reader = BinaryLogReader(path)
+        active = None
+        for cols in reader.chunks(batch_size):
+            with self.metrics.timer('ingest_stage_seconds', stage='state'):
+                active = replay_active_columns(active, cols)
+        rows = list(zip(*(active[name].tolist() for name in ACTIVE_COLUMNS))) if active else []
+        with self.metrics.timer('ingest_stage_seconds', stage='flush'):
+            self.db.replace_active_orders(rows)
+        if self.engine:
+            with self.updating_state():
+                self.engine.reset()
+                self.engine.load(rows)
+
+        elapsed = time.perf_counter() - started
+        rate = len(reader) / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Active orders rebuilt: {len(rows)} from {len(reader)} events, {rate:.0f} events/sec")
+        return {'processed': len(reader), 'active': len(rows), 'elapsed': elapsed, 'events_per_sec': rate}
+
+    def follow_csv_file(self, csv_file: str, batch_size: int = 10000, poll_interval: float = 0.5,
+                        idle_timeout: float = None, stop_event=None, coalesce: bool = False):
+        """Слежение за растущим CSV: новые строки загружаются по мере появления.
+
+        Смещение в файле и последнее событие сохраняются в ingest_progress после каждой
+        загруженной порции, повторный запуск продолжает с этого места без очистки таблиц.
+        Порция и смещение фиксируются вместе, если БД поддерживает batch() (SQLite, PostgreSQL);
+        иначе при сбое между ними порция будет загружена повторно.
+        """
+        source = os.path.abspath(csv_file)
+        progress = self.db.get_ingest_progress(source)
+        if progress:
+            logger.info(f"Resuming file: {csv_file} from byte {progress['byte_offset']} "
+                        f"(processed: {progress['processed']})")
+            self.begin(coalesce=coalesce, clear=False)
+            if self._state:
+                # Движок восстанавливает книгу, свёртка - остатки записанных заявок
+                with self.updating_state():
+                    self._state.load(self.db.get_active_orders())
+            if self.analytics:
+                self.analytics.load(self.db.get_active_orders())
+            offset = progress['byte_offset']
+            processed_count = progress['processed']
+            last_timestamp, last_order_id = progress['last_timestamp'], progress['last_order_id']
         else:
-            raise ValueError(f"Unexpected number of columns: {len(sample_df.columns)}")
-        
-        # Читаем CSV порциями для экономии памяти
-        for chunk in pd.read_csv(csv_file, comment='#', chunksize=batch_size, names=columns, skiprows=1):
-            if limit and processed_count >= limit:
-                break
-            
+            logger.info(f"Following file: {csv_file}")
+            self.begin(coalesce=coalesce)
+            offset = None
+            processed_count = 0
+            last_timestamp = last_order_id = None
+
+        columns = None
+        idle_since = time.monotonic()
+        with open(csv_file, 'rb') as f:
+            while not (stop_event and stop_event.is_set()):
+                if offset is None:
+                    # Первая строка - заголовок, как и в process_csv_file; недописанный читается заново
+                    f.seek(0)
+                    header = f.readline()
+                    offset = len(header) if header.endswith(b'\n') else None
+                    data = b''
+                else:
+                    if os.fstat(f.fileno()).st_size < offset:
+                        raise RuntimeError(f"File was truncated: {csv_file}")
+                    f.seek(offset)
+                    data = f.read(FOLLOW_READ_BLOCK)
+                    data = data[:data.rfind(b'\n') + 1]
+
+                if not data:
+                    if idle_timeout is not None and time.monotonic() - idle_since >= idle_timeout:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                if columns is None:
+                    first_line = next(line for line in data.splitlines() if line.strip() and not line.startswith(b'#'))
+                    columns = columns_for(first_line.count(b',') + 1)
+
+                with self.metrics.timer('ingest_stage_seconds', stage='read'):
+                    frame = pd.read_csv(io.BytesIO(data), comment='#', names=columns, header=None,
+                                        dtype=typed_dtypes(columns))
+                with self.db.batch():
+                    for start in range(0, len(frame), batch_size):
+                        with self.metrics.timer('ingest_stage_seconds', stage='decode'):
+                            cols = decode_chunk(frame.iloc[start:start + batch_size])
+                        self.process_columns(cols)
+                    if self._state:
+                        self._state.flush(self.db)
+                    for _, aggregator in self._aggregators():
+                        aggregator.flush(self.db)
+
+                    offset += len(data)
+                    processed_count += len(frame)
+                    if len(frame):
+                        last_timestamp, last_order_id = int(frame['moment'].iloc[-1]), int(frame['id'].iloc[-1])
+                    self.db.save_ingest_progress(source, offset, last_timestamp, last_order_id, processed_count)
+                logger.info(f"Processed: {processed_count} (offset {offset})")
+                idle_since = time.monotonic()
+
+        active_count = self.db.get_active_orders_count()
+        logger.info(f"Following stopped. Processed: {processed_count}, Active orders: {active_count}")
+        return {'processed': processed_count, 'byte_offset': offset}
+
+    def begin(self, coalesce: bool = False, clear: bool = True):
+        """Подготовка к загрузке потока событий порциями через process_columns"""
+        if clear:
+            self.db.clear_tables()
+
+        # Куда применяются события active_orders: движок в памяти, свёртка по порциям или сразу в БД
+        if self.engine:
+            self._state = self.engine
+        elif coalesce:
+            self._state = ActiveOrderCoalescer()
+        else:
+            self._state = None
+        if self._state:
+            with self.updating_state():
+                self._state.reset()
+        if self.checkpoints:
+            self.checkpoints.reset()
+        for _, aggregator in self._aggregators():
+            aggregator.reset()
+
+    def process_columns(self, cols: dict):
+        """Обработка одной порции событий в виде колонок (см. decode_chunk)"""
+        with self.db.batch():
+            self._process_columns(cols)
+            self._end_chunk()
+        self.metrics.inc('ingest_events_total', len(cols['order_id']))
+        self.metrics.inc('ingest_chunks_total')
+
+    @contextlib.contextmanager
+    def updating_state(self):
+        """Блок изменения состояния движка: под блокировкой, по выходе увеличивает version"""
+        with self.lock:
+            try:
+                yield
+            finally:
+                self.version += 1
+
+    def in_memory(self, timestamp: int = None):
+        """Можно ли ответить на запрос с фильтром timestamp <= ? по движку, без запроса к БД"""
+        return self.engine is not None and self._state is self.engine and self.engine.covers(timestamp)
+
+    def finish(self):
+        if self._state:
+            with self.metrics.timer('ingest_stage_seconds', stage='flush'):
+                self._state.flush(self.db)
+        for stage, aggregator in self._aggregators():
+            with self.metrics.timer('ingest_stage_seconds', stage=stage):
+                aggregator.flush(self.db)
+
+    def _aggregators(self):
+        """Потоковые агрегаты (бары, метрики потока) с именами этапов для метрик загрузки"""
+        return [(stage, aggregator) for stage, aggregator in (('bars', self.bars), ('analytics', self.analytics))
+                if aggregator]
+
+    def _end_chunk(self):
+        if self._state:
+            with self.metrics.timer('ingest_stage_seconds', stage='flush'):
+                self._state.maybe_flush(self.db)
+        for stage, aggregator in self._aggregators():
+            with self.metrics.timer('ingest_stage_seconds', stage=stage):
+                aggregator.maybe_flush(self.db)
+
+    def _process_rows(self, chunk: pd.DataFrame):
+        history_batch = []
+        state_started = time.perf_counter()
+
+        with self.updating_state():
             for _, row in chunk.iterrows():
-                if limit and processed_count >= limit:
-                    break
-                    
                 order_id = row['id']
                 action_type = row['action']
                 symbol = row['symbol']
@@ -41,34 +377,155 @@ class TickDataProcessor:
                 price = row['price']
                 volume = row['volume']
                 timestamp = row['moment']
-                
+
                 history_batch.append((symbol, operation, timestamp, order_id, action_type, price, volume))
-                
-                if action_type == 1:
+
+                if self.checkpoints:
+                    for _, checkpoint_timestamp in self.checkpoints.feed([timestamp]):
+                        self.checkpoints.write(self.db, self.engine, checkpoint_timestamp)
+
+                if self._state:
+                    self._state.apply(action_type, order_id, symbol, operation, price, volume, timestamp)
+                elif action_type == 1:
                     self.db.insert_active_order(order_id, symbol, operation, price, volume, timestamp)
                 elif action_type == 2:
                     self.db.process_trade(order_id, volume)
                 elif action_type == 0:
                     self.db.delete_active_order(order_id)
-                
-                processed_count += 1
-                
-                if len(history_batch) >= batch_size:
-                    self.db.insert_history_batch(history_batch)
-                    history_batch = []
-                    logger.info(f"Processed: {processed_count}")
-            
-            if limit and processed_count >= limit:
-                break
-        
+        self.metrics.observe('ingest_stage_seconds', time.perf_counter() - state_started, stage='state')
+
         if history_batch:
-            self.db.insert_history_batch(history_batch)
-        
-        active_count = self.db.get_active_orders_count()
-        logger.info(f"Processing completed. Processed: {processed_count}, Active orders: {active_count}")
-    
+            with self.metrics.timer('ingest_stage_seconds', stage='history'):
+                self.db.insert_history_batch(history_batch)
+
+        aggregators = self._aggregators()
+        if aggregators:
+            cols = decode_chunk(chunk)
+            for stage, aggregator in aggregators:
+                with self.metrics.timer('ingest_stage_seconds', stage=stage):
+                    aggregator.apply_columns(cols)
+
+    def _process_columns(self, cols: dict):
+        """Колоночная обработка порции: история и изменения active_orders пакетами"""
+        if not len(cols['order_id']):
+            return
+
+        with self.metrics.timer('ingest_stage_seconds', stage='state'), self.updating_state():
+            if self.checkpoints:
+                start = 0
+                for position, checkpoint_timestamp in self.checkpoints.feed(cols['timestamp']):
+                    self._state.apply_columns(slice_columns(cols, start, position))
+                    self.checkpoints.write(self.db, self.engine, checkpoint_timestamp)
+                    start = position
+                self._state.apply_columns(slice_columns(cols, start))
+            elif self._state:
+                self._state.apply_columns(cols)
+            else:
+                self._apply_active_columns(cols)
+
+        with self.metrics.timer('ingest_stage_seconds', stage='history'):
+            self.db.insert_history_batch(history_rows(cols))
+
+        for stage, aggregator in self._aggregators():
+            with self.metrics.timer('ingest_stage_seconds', stage=stage):
+                aggregator.apply_columns(cols)
+
+    def _apply_active_columns(self, cols: dict):
+        order_ids = cols['order_id']
+        action = cols['action']
+
+        kind = np.full(len(action), -1, dtype=np.int8)
+        kind[action == 1] = KIND_INSERT
+        kind[action == 2] = KIND_TRADE
+        kind[action == 0] = KIND_DELETE
+
+        # Пакетное применение (все вставки, затем сделки, затем снятия) эквивалентно
+        # построчному, если события каждой заявки в порции идут в этом же порядке.
+        # Заявки с иным порядком событий (повторная вставка после снятия и т.п.)
+        # обрабатываем построчно.
+        positions = np.flatnonzero(kind >= 0)
+        ids, kinds = order_ids[positions], kind[positions]
+        order = np.lexsort((positions, ids))
+        ids, kinds = ids[order], kinds[order]
+        out_of_order = (ids[1:] == ids[:-1]) & (kinds[1:] < kinds[:-1])
+        irregular = np.isin(order_ids, ids[1:][out_of_order]) & (kind >= 0)
+        regular = (kind >= 0) & ~irregular
+
+        inserts = np.flatnonzero(regular & (kind == KIND_INSERT))
+        if len(inserts):
+            self.db.insert_active_orders_batch(list(zip(
+                order_ids[inserts].tolist(), cols['symbol'][inserts].tolist(), cols['operation'][inserts].tolist(),
+                cols['price'][inserts].tolist(), cols['volume'][inserts].tolist(), cols['timestamp'][inserts].tolist(),
+            )))
+
+        trades = np.flatnonzero(regular & (kind == KIND_TRADE))
+        if len(trades):
+            traded_ids, inverse = np.unique(order_ids[trades], return_inverse=True)
+            traded_volume = np.zeros(len(traded_ids), dtype=np.int64)
+            np.add.at(traded_volume, inverse, cols['volume'][trades])
+            self.db.process_trades_batch(list(zip(traded_ids.tolist(), traded_volume.tolist())))
+
+        deletes = np.flatnonzero(regular & (kind == KIND_DELETE))
+        if len(deletes):
+            self.db.delete_active_orders_batch(np.unique(order_ids[deletes]).tolist())
+
+        for i in np.flatnonzero(irregular).tolist():
+            order_id = int(order_ids[i])
+            if kind[i] == KIND_INSERT:
+                self.db.insert_active_order(order_id, cols['symbol'][i], cols['operation'][i],
+                                            float(cols['price'][i]), int(cols['volume'][i]), int(cols['timestamp'][i]))
+            elif kind[i] == KIND_TRADE:
+                self.db.process_trade(order_id, int(cols['volume'][i]))
+            else:
+                self.db.delete_active_order(order_id)
+
     def get_best_prices(self, symbol: str, timestamp: int = None):
+        # Движок хранит уровни цен и отвечает без запроса к БД, если момент не раньше последнего события
+        if self.in_memory(timestamp):
+            return self.engine.get_best_prices(symbol, timestamp)
         return self.db.get_best_prices(symbol, timestamp)
+
+    def get_all_best_prices(self, timestamp: int = None):
+        """Лучшие цены по всем инструментам одним вызовом: {symbol: результат get_best_prices}"""
+        if self.in_memory(timestamp):
+            return self.engine.get_all_best_prices(timestamp)
+        return self.db.get_all_best_prices(timestamp)
+
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        """Уровни цен стакана: {'bids': [...], 'asks': [...]}, на уровне price, volume (суммарный остаток), orders"""
+        if self.in_memory(timestamp):
+            return self.engine.get_depth(symbol, levels, timestamp)
+        return self.db.get_depth(symbol, levels, timestamp)
+
+    def get_bars(self, symbol: str, period: str, from_ts: int, to_ts: int):
+        """Бары периода period ('1s', '1m', ...) с началом в [from_ts, to_ts]: OHLC, volume, vwap, trades"""
+        return self.db.get_bars(symbol, period, from_ts, to_ts)
+
+    def get_flow_metrics(self, symbol: str, from_ts: int, to_ts: int, period: str = None):
+        """Метрики потока по интервалам с началом в [from_ts, to_ts]: [{'timestamp': ..., 'ofi': ..., ...}]"""
+        if period is None:
+            period = self.analytics.interval if self.analytics else '1m'
+        intervals = {}
+        for row in self.db.get_flow_metrics(symbol, period, from_ts, to_ts):
+            intervals.setdefault(row['timestamp'], {'timestamp': row['timestamp']})[row['metric']] = row['value']
+        return list(intervals.values())
+
+    def get_best_prices_as_of(self, symbol: str, timestamp: int):
+        """Лучшие цены по состоянию книги на момент timestamp (снимок + история после него)"""
+        return AsOfBook(self.db).get_best_prices(symbol, timestamp)
+
+    def sample_best_prices(self, symbols, timestamps, source=None, batch_size: int = 500000) -> dict:
+        """Лучшие цены для массивов инструментов и моментов одним проходом (см. asof.sample_best_prices).
+
+        source - двоичный журнал или CSV с событиями; без source - история и снимки в БД.
+        """
+        if source is None:
+            return AsOfBook(self.db).sample_best_prices(symbols, timestamps)
+        if isinstance(source, str) and is_binary_log(source):
+            chunks = BinaryLogReader(source).chunks(batch_size)
+        else:
+            chunks = (decode_chunk(chunk) for chunk in read_csv_chunks(source, batch_size, typed=True))
+        return sample_best_prices(chunks, symbols, timestamps)
     
     def print_analysis(self):
         """Вывод анализа активных заявок"""
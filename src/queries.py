@@ -31,6 +31,297 @@ INSERT_HISTORY_BATCH = '''
     VALUES %s
 '''
 
+BOOK_CHECKPOINTS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS book_checkpoints (
+        checkpoint_id SERIAL PRIMARY KEY,
+        timestamp BIGINT NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+'''
+
+BOOK_CHECKPOINT_ORDERS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS book_checkpoint_orders (
+        checkpoint_id INTEGER NOT NULL,
+        symbol VARCHAR(20) NOT NULL,
+        order_id BIGINT NOT NULL,
+        operation CHAR(1) NOT NULL,
+        price DECIMAL(15,5) NOT NULL,
+        original_volume INTEGER NOT NULL,
+        remaining_volume INTEGER NOT NULL,
+        timestamp BIGINT NOT NULL,
+        PRIMARY KEY (checkpoint_id, symbol, order_id)
+    )
+'''
+
+IDX_HISTORY_SYMBOL_TS = 'CREATE INDEX IF NOT EXISTS idx_history_symbol_ts ON order_history(symbol, timestamp)'
+
+INSERT_CHECKPOINT = 'INSERT INTO book_checkpoints (timestamp) VALUES (%s) RETURNING checkpoint_id'
+
+INSERT_CHECKPOINT_ORDERS = '''
+    INSERT INTO book_checkpoint_orders
+        (checkpoint_id, order_id, symbol, operation, price, original_volume, remaining_volume, timestamp)
+    VALUES %s
+'''
+
+COPY_CHECKPOINT_ORDERS = '''
+    COPY book_checkpoint_orders
+        (checkpoint_id, order_id, symbol, operation, price, original_volume, remaining_volume, timestamp) FROM STDIN
+'''
+
+GET_CHECKPOINT = '''
+    SELECT checkpoint_id, timestamp FROM book_checkpoints
+    WHERE timestamp <= %s
+    ORDER BY timestamp DESC, checkpoint_id DESC
+    LIMIT 1
+'''
+
+GET_CHECKPOINT_ORDERS = '''
+    SELECT order_id, symbol, operation, price, original_volume, remaining_volume, timestamp
+    FROM book_checkpoint_orders
+    WHERE checkpoint_id = %s AND symbol = %s
+'''
+
+HISTORY_RANGE = '''
+    SELECT symbol, operation, timestamp, order_id, action_type, price, volume
+    FROM order_history
+    WHERE symbol = %s AND timestamp BETWEEN %s AND %s
+    ORDER BY id
+'''
+
+# Компактная схема: словарь инструментов, цена в шагах 1e-5, время в наносекундах от эпохи
+SYMBOLS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS symbols (
+        id SMALLSERIAL PRIMARY KEY,
+        symbol VARCHAR(20) NOT NULL UNIQUE
+    )
+'''
+
+# Колонки по убыванию выравнивания, чтобы в строке не было пустот
+ORDER_HISTORY_COMPACT_TABLE = '''
+    CREATE TABLE IF NOT EXISTS order_history_v2 (
+        id BIGSERIAL PRIMARY KEY,
+        timestamp_ns BIGINT NOT NULL,
+        order_id BIGINT NOT NULL,
+        price BIGINT NOT NULL,
+        volume INTEGER NOT NULL,
+        symbol_id SMALLINT NOT NULL,
+        action_type SMALLINT NOT NULL,
+        operation CHAR(1) NOT NULL
+    )
+'''
+
+INSERT_SYMBOLS = 'INSERT INTO symbols (symbol) VALUES %s ON CONFLICT (symbol) DO NOTHING'
+ALL_SYMBOLS = 'SELECT symbol, id FROM symbols'
+
+INSERT_HISTORY_COMPACT_BATCH = '''
+    INSERT INTO order_history_v2 (symbol_id, operation, timestamp_ns, order_id, action_type, price, volume)
+    VALUES %s
+'''
+
+COPY_HISTORY_COMPACT = '''
+    COPY order_history_v2 (symbol_id, operation, timestamp_ns, order_id, action_type, price, volume) FROM STDIN
+'''
+
+IDX_HISTORY_COMPACT_SYMBOL_TS = '''
+    CREATE INDEX IF NOT EXISTS idx_history_v2_symbol_ts ON order_history_v2(symbol_id, timestamp_ns)
+'''
+
+# Секционированная история: RANGE по времени (секция на торговый день), внутри дня
+# по желанию HASH по инструменту. Первичного ключа нет: он обязан включать ключ секционирования
+ORDER_HISTORY_PARTITIONED_TABLE = '''
+    CREATE TABLE IF NOT EXISTS order_history (
+        id BIGSERIAL,
+        symbol VARCHAR(20) NOT NULL,
+        operation CHAR(1) NOT NULL,
+        timestamp BIGINT NOT NULL,
+        order_id BIGINT NOT NULL,
+        action_type INTEGER NOT NULL,
+        price DECIMAL(15,5) NOT NULL,
+        volume INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW()
+    ) PARTITION BY RANGE (timestamp)
+'''
+
+ORDER_HISTORY_COMPACT_PARTITIONED_TABLE = '''
+    CREATE TABLE IF NOT EXISTS order_history_v2 (
+        id BIGSERIAL,
+        timestamp_ns BIGINT NOT NULL,
+        order_id BIGINT NOT NULL,
+        price BIGINT NOT NULL,
+        volume INTEGER NOT NULL,
+        symbol_id SMALLINT NOT NULL,
+        action_type SMALLINT NOT NULL,
+        operation CHAR(1) NOT NULL
+    ) PARTITION BY RANGE (timestamp_ns)
+'''
+
+# Имена таблиц подставляются из кода, не из данных
+HISTORY_DAY_PARTITION = '''
+    CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+    FOR VALUES FROM ({start}) TO ({end}) {subpartition}
+'''
+
+HISTORY_HASH_PARTITION = '''
+    CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table}
+    FOR VALUES WITH (MODULUS {modulus}, REMAINDER {remainder})
+'''
+
+# Строки с метками вне календаря (нельзя отнести к дню)
+HISTORY_DEFAULT_PARTITION = 'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT'
+
+# BRIN почти не замедляет вставку: история пишется по возрастанию времени
+IDX_HISTORY_TS_BRIN = '''
+    CREATE INDEX IF NOT EXISTS idx_{table}_ts_brin ON {table} USING BRIN ({column}) WITH (pages_per_range = 32)
+'''
+
+HISTORY_PARTITIONS = '''
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = to_regclass(%s)
+'''
+
+TABLE_KIND = 'SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)'
+
+# Один TRUNCATE на все таблицы (и секции истории): время не зависит от числа строк,
+# мёртвых строк не остаётся, счётчики id начинаются заново
+TRUNCATE_TABLES = 'TRUNCATE {tables} RESTART IDENTITY'
+
+# Секции создаются из нескольких процессов: DDL одной таблицы выполняется по очереди
+PARTITION_LOCK = 'SELECT pg_advisory_xact_lock(hashtext(%s))'
+
+GET_SYMBOL_ID = 'SELECT id FROM symbols WHERE symbol = %s'
+
+HISTORY_RANGE_COMPACT_BY_ID = '''
+    SELECT symbol_id, operation, timestamp_ns, order_id, action_type, price, volume
+    FROM order_history_v2
+    WHERE symbol_id = %s AND timestamp_ns BETWEEN %s AND %s
+    ORDER BY id
+'''
+
+INGEST_PROGRESS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS ingest_progress (
+        source TEXT PRIMARY KEY,
+        byte_offset BIGINT NOT NULL,
+        last_timestamp BIGINT,
+        last_order_id BIGINT,
+        processed BIGINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT NOW()
+    )
+'''
+
+GET_INGEST_PROGRESS = '''
+    SELECT byte_offset, last_timestamp, last_order_id, processed FROM ingest_progress WHERE source = %s
+'''
+
+# Бары по сделкам: timestamp - начало бара, turnover - сумма цена * объём (VWAP = turnover / volume).
+# Повторная запись того же бара складывается с ним: бары пишутся частями
+BARS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS bars (
+        symbol VARCHAR(20) NOT NULL,
+        period VARCHAR(8) NOT NULL,
+        timestamp BIGINT NOT NULL,
+        open DECIMAL(15,5) NOT NULL,
+        high DECIMAL(15,5) NOT NULL,
+        low DECIMAL(15,5) NOT NULL,
+        close DECIMAL(15,5) NOT NULL,
+        volume BIGINT NOT NULL,
+        turnover DOUBLE PRECISION NOT NULL,
+        trades INTEGER NOT NULL,
+        PRIMARY KEY (symbol, period, timestamp)
+    )
+'''
+
+UPSERT_BARS = '''
+    INSERT INTO bars (symbol, period, timestamp, open, high, low, close, volume, turnover, trades)
+    VALUES %s
+    ON CONFLICT (symbol, period, timestamp) DO UPDATE SET
+        high = GREATEST(bars.high, EXCLUDED.high),
+        low = LEAST(bars.low, EXCLUDED.low),
+        close = EXCLUDED.close,
+        volume = bars.volume + EXCLUDED.volume,
+        turnover = bars.turnover + EXCLUDED.turnover,
+        trades = bars.trades + EXCLUDED.trades
+'''
+
+BARS_RANGE = '''
+    SELECT symbol, period, timestamp, open, high, low, close, volume, turnover / volume AS vwap, trades
+    FROM bars
+    WHERE symbol = %s AND period = %s AND timestamp BETWEEN %s AND %s
+    ORDER BY timestamp
+'''
+
+# Выгрузка истории за период в порядке записи (архивирование старых дней)
+EXPORT_HISTORY = '''
+    SELECT symbol, operation, timestamp, order_id, action_type, price, volume
+    FROM order_history
+    WHERE timestamp BETWEEN %s AND %s
+    ORDER BY id
+'''
+
+EXPORT_HISTORY_COMPACT = '''
+    SELECT s.symbol, h.operation, h.timestamp_ns, h.order_id, h.action_type, h.price, h.volume
+    FROM order_history_v2 h JOIN symbols s ON s.id = h.symbol_id
+    WHERE h.timestamp_ns BETWEEN %s AND %s
+    ORDER BY h.id
+'''
+
+# Дни истории без секций: полный просмотр таблицы
+HISTORY_DAYS = 'SELECT DISTINCT timestamp / 1000000000 FROM order_history'
+HISTORY_DAYS_COMPACT = 'SELECT DISTINCT timestamp_ns / 86400000000000 FROM order_history_v2'
+
+DELETE_CHECKPOINT_ORDERS_BEFORE = '''
+    DELETE FROM book_checkpoint_orders
+    WHERE checkpoint_id IN (SELECT checkpoint_id FROM book_checkpoints WHERE timestamp < %s)
+'''
+
+DELETE_CHECKPOINTS_BEFORE = 'DELETE FROM book_checkpoints WHERE timestamp < %s'
+
+# Метрики потока заявок по интервалам (FlowAnalytics): timestamp - начало интервала.
+# Незакрытый интервал пишется повторно, новое значение заменяет старое
+FLOW_METRICS_TABLE = '''
+    CREATE TABLE IF NOT EXISTS flow_metrics (
+        symbol VARCHAR(20) NOT NULL,
+        period VARCHAR(8) NOT NULL,
+        metric VARCHAR(32) NOT NULL,
+        timestamp BIGINT NOT NULL,
+        value DOUBLE PRECISION,
+        PRIMARY KEY (symbol, period, timestamp, metric)
+    )
+'''
+
+UPSERT_FLOW_METRICS = '''
+    INSERT INTO flow_metrics (symbol, period, metric, timestamp, value)
+    VALUES %s
+    ON CONFLICT (symbol, period, timestamp, metric) DO UPDATE SET value = EXCLUDED.value
+'''
+
+FLOW_METRICS_RANGE = '''
+    SELECT symbol, period, metric, timestamp, value
+    FROM flow_metrics
+    WHERE symbol = %s AND period = %s AND timestamp BETWEEN %s AND %s
+    ORDER BY timestamp, metric
+'''
+
+SAVE_INGEST_PROGRESS = '''
+    INSERT INTO ingest_progress (source, byte_offset, last_timestamp, last_order_id, processed)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (source) DO UPDATE SET
+        byte_offset = EXCLUDED.byte_offset,
+        last_timestamp = EXCLUDED.last_timestamp,
+        last_order_id = EXCLUDED.last_order_id,
+        processed = EXCLUDED.processed,
+        updated_at = NOW()
+'''
+
+ALL_ACTIVE_ORDERS = '''
+    SELECT order_id, symbol, operation, price, original_volume, remaining_volume, timestamp FROM active_orders
+'''
+
+COPY_HISTORY = 'COPY order_history (symbol, operation, timestamp, order_id, action_type, price, volume) FROM STDIN'
+
+COPY_ACTIVE_ORDERS = '''
+    COPY active_orders (order_id, symbol, operation, price, original_volume, remaining_volume, timestamp) FROM STDIN
+'''
+
 INSERT_ACTIVE_ORDER = '''
     INSERT INTO active_orders (order_id, symbol, operation, price, original_volume, remaining_volume, timestamp)
     VALUES (%s, %s, %s, %s, %s, %s, %s)
@@ -41,6 +332,30 @@ GET_ACTIVE_ORDER = 'SELECT remaining_volume FROM active_orders WHERE order_id =
 UPDATE_ACTIVE_ORDER_VOLUME = 'UPDATE active_orders SET remaining_volume = %s WHERE order_id = %s'
 DELETE_ACTIVE_ORDER = 'DELETE FROM active_orders WHERE order_id = %s'
 
+INSERT_ACTIVE_ORDERS_BATCH = '''
+    INSERT INTO active_orders (order_id, symbol, operation, price, original_volume, remaining_volume, timestamp)
+    VALUES %s
+    ON CONFLICT (order_id) DO NOTHING
+'''
+
+APPLY_TRADES_BATCH = '''
+    UPDATE active_orders AS a
+    SET remaining_volume = a.remaining_volume - t.volume
+    FROM (VALUES %s) AS t(order_id, volume)
+    WHERE a.order_id = t.order_id
+'''
+
+DELETE_FILLED_ORDERS = 'DELETE FROM active_orders WHERE order_id = ANY(%s) AND remaining_volume <= 0'
+DELETE_ACTIVE_ORDERS_BATCH = 'DELETE FROM active_orders WHERE order_id = ANY(%s)'
+
+# Построчные варианты для конвейерной отправки (psycopg 3)
+INSERT_HISTORY = '''
+    INSERT INTO order_history (symbol, operation, timestamp, order_id, action_type, price, volume)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+'''
+APPLY_TRADE = 'UPDATE active_orders SET remaining_volume = remaining_volume - %s WHERE order_id = %s'
+DELETE_FILLED_ORDER = 'DELETE FROM active_orders WHERE order_id = %s AND remaining_volume <= 0'
+
 SAMPLE_ACTIVE_ORDERS = '''
     SELECT order_id, symbol, operation, price, original_volume, remaining_volume, timestamp
     FROM active_orders 
@@ -70,7 +385,7 @@ BEST_PRICES_QUERY = '''
             AND operation = 'B' 
             AND remaining_volume > 0
             AND timestamp <= %s
-        ORDER BY price DESC
+        ORDER BY price DESC, timestamp, order_id
         LIMIT 1
     ),
     best_sell AS (
@@ -80,7 +395,7 @@ BEST_PRICES_QUERY = '''
             AND operation = 'S' 
             AND remaining_volume > 0
             AND timestamp <= %s
-        ORDER BY price ASC
+        ORDER BY price ASC, timestamp, order_id
         LIMIT 1
     )
     SELECT 'BUY' as operation, order_id, price, remaining_volume FROM best_buy
@@ -88,6 +403,37 @@ BEST_PRICES_QUERY = '''
     SELECT 'SELL' as operation, order_id, price, remaining_volume FROM best_sell
 '''
 
+ALL_BEST_PRICES_QUERY = '''
+    SELECT DISTINCT ON (symbol, operation) symbol, operation, order_id, price, remaining_volume, timestamp
+    FROM active_orders
+    WHERE remaining_volume > 0
+        AND timestamp <= %s
+        AND operation IN ('B', 'S')
+    ORDER BY symbol, operation, CASE WHEN operation = 'B' THEN -price ELSE price END, timestamp, order_id
+'''
+
+# Уровни цен стакана: индекс (symbol, operation, price) отдаёт заявки в порядке цены,
+# агрегация останавливается после levels уровней
+DEPTH_QUERY = '''
+    (SELECT 'B' AS operation, price, SUM(remaining_volume) AS volume, COUNT(*) AS orders
+     FROM active_orders
+     WHERE symbol = %s AND operation = 'B' AND remaining_volume > 0 AND timestamp <= %s
+     GROUP BY price
+     ORDER BY price DESC
+     LIMIT %s)
+    UNION ALL
+    (SELECT 'S' AS operation, price, SUM(remaining_volume) AS volume, COUNT(*) AS orders
+     FROM active_orders
+     WHERE symbol = %s AND operation = 'S' AND remaining_volume > 0 AND timestamp <= %s
+     GROUP BY price
+     ORDER BY price ASC
+     LIMIT %s)
+'''
+
+IDX_ACTIVE_SYMBOL_SIDE_PRICE = '''
+    CREATE INDEX IF NOT EXISTS idx_active_symbol_side_price ON active_orders(symbol, operation, price)
+'''
+
 # SQLite queries
 ORDER_HISTORY_TABLE_SQLITE = '''
     CREATE TABLE IF NOT EXISTS order_history (
@@ -116,6 +462,209 @@ ACTIVE_ORDERS_TABLE_SQLITE = '''
     )
 '''
 
+BOOK_CHECKPOINTS_TABLE_SQLITE = '''
+    CREATE TABLE IF NOT EXISTS book_checkpoints (
+        checkpoint_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+BOOK_CHECKPOINT_ORDERS_TABLE_SQLITE = '''
+    CREATE TABLE IF NOT EXISTS book_checkpoint_orders (
+        checkpoint_id INTEGER NOT NULL,
+        symbol TEXT NOT NULL,
+        order_id INTEGER NOT NULL,
+        operation TEXT NOT NULL,
+        price REAL NOT NULL,
+        original_volume INTEGER NOT NULL,
+        remaining_volume INTEGER NOT NULL,
+        timestamp INTEGER NOT NULL,
+        PRIMARY KEY (checkpoint_id, symbol, order_id)
+    ) WITHOUT ROWID
+'''
+
+SYMBOLS_TABLE_SQLITE = '''
+    CREATE TABLE IF NOT EXISTS symbols (
+        id INTEGER PRIMARY KEY,
+        symbol TEXT NOT NULL UNIQUE
+    )
+'''
+
+# Строки хранятся в порядке (инструмент, время): диапазон по инструменту читается подряд
+ORDER_HISTORY_COMPACT_TABLE_SQLITE = '''
+    CREATE TABLE IF NOT EXISTS order_history_v2 (
+        symbol_id INTEGER NOT NULL,
+        timestamp_ns INTEGER NOT NULL,
+        id INTEGER NOT NULL,
+        operation TEXT NOT NULL,
+        order_id INTEGER NOT NULL,
+        action_type INTEGER NOT NULL,
+        price INTEGER NOT NULL,
+        volume INTEGER NOT NULL,
+        PRIMARY KEY (symbol_id, timestamp_ns, id)
+    ) WITHOUT ROWID
+'''
+
+INSERT_SYMBOL_SQLITE = 'INSERT OR IGNORE INTO symbols (symbol) VALUES (?)'
+ALL_SYMBOLS_SQLITE = 'SELECT symbol, id FROM symbols'
+MAX_HISTORY_COMPACT_ID_SQLITE = 'SELECT COALESCE(MAX(id), 0) FROM order_history_v2'
+
+INSERT_HISTORY_COMPACT_BATCH_SQLITE = '''
+    INSERT INTO order_history_v2 (id, symbol_id, operation, timestamp_ns, order_id, action_type, price, volume)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+HISTORY_RANGE_COMPACT_SQLITE = '''
+    SELECT h.symbol_id, h.operation, h.timestamp_ns, h.order_id, h.action_type, h.price, h.volume
+    FROM order_history_v2 h JOIN symbols s ON s.id = h.symbol_id
+    WHERE s.symbol = ? AND h.timestamp_ns BETWEEN ? AND ?
+    ORDER BY h.id
+'''
+
+IDX_HISTORY_COMPACT_ORDER_ID_SQLITE = 'CREATE INDEX IF NOT EXISTS idx_history_v2_order_id ON order_history_v2(order_id)'
+
+GET_SYMBOL_ID_SQLITE = 'SELECT id FROM symbols WHERE symbol = ?'
+
+HISTORY_RANGE_COMPACT_BY_ID_SQLITE = '''
+    SELECT symbol_id, operation, timestamp_ns, order_id, action_type, price, volume
+    FROM order_history_v2
+    WHERE symbol_id = ? AND timestamp_ns BETWEEN ? AND ?
+    ORDER BY id
+'''
+
+# Профиль загрузки: WAL без fsync на каждую транзакцию, крупные страницы и кэш, memory-mapped I/O.
+# page_size действует только для нового файла, поэтому идёт до journal_mode
+INGEST_PRAGMAS_SQLITE = [
+    'PRAGMA page_size = 16384',
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+    'PRAGMA cache_size = -262144',
+    'PRAGMA mmap_size = 1073741824',
+    'PRAGMA temp_store = MEMORY',
+]
+
+INGEST_PROGRESS_TABLE_SQLITE = '''
+    CREATE TABLE IF NOT EXISTS ingest_progress (
+        source TEXT PRIMARY KEY,
+        byte_offset INTEGER NOT NULL,
+        last_timestamp INTEGER,
+        last_order_id INTEGER,
+        processed INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+BARS_TABLE_SQLITE = '''
+    CREATE TABLE IF NOT EXISTS bars (
+        symbol TEXT NOT NULL,
+        period TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        open REAL NOT NULL,
+        high REAL NOT NULL,
+        low REAL NOT NULL,
+        close REAL NOT NULL,
+        volume INTEGER NOT NULL,
+        turnover REAL NOT NULL,
+        trades INTEGER NOT NULL,
+        PRIMARY KEY (symbol, period, timestamp)
+    ) WITHOUT ROWID
+'''
+
+UPSERT_BARS_SQLITE = '''
+    INSERT INTO bars (symbol, period, timestamp, open, high, low, close, volume, turnover, trades)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (symbol, period, timestamp) DO UPDATE SET
+        high = MAX(high, excluded.high),
+        low = MIN(low, excluded.low),
+        close = excluded.close,
+        volume = volume + excluded.volume,
+        turnover = turnover + excluded.turnover,
+        trades = trades + excluded.trades
+'''
+
+BARS_RANGE_SQLITE = '''
+    SELECT symbol, period, timestamp, open, high, low, close, volume, turnover / volume AS vwap, trades
+    FROM bars
+    WHERE symbol = ? AND period = ? AND timestamp BETWEEN ? AND ?
+    ORDER BY timestamp
+'''
+
+EXPORT_HISTORY_SQLITE = '''
+    SELECT symbol, operation, timestamp, order_id, action_type, price, volume
+    FROM order_history
+    WHERE timestamp BETWEEN ? AND ?
+    ORDER BY id
+'''
+
+# Код инструмента заменяется по словарю symbols основного файла (в файлах истории словаря нет)
+EXPORT_HISTORY_COMPACT_SQLITE = '''
+    SELECT symbol_id, operation, timestamp_ns, order_id, action_type, price, volume
+    FROM order_history_v2
+    WHERE timestamp_ns BETWEEN ? AND ?
+    ORDER BY id
+'''
+
+HISTORY_DAYS_SQLITE = 'SELECT DISTINCT timestamp / 1000000000 FROM order_history'
+HISTORY_DAYS_COMPACT_SQLITE = 'SELECT DISTINCT timestamp_ns / 86400000000000 FROM order_history_v2'
+
+DELETE_CHECKPOINT_ORDERS_BEFORE_SQLITE = '''
+    DELETE FROM book_checkpoint_orders
+    WHERE checkpoint_id IN (SELECT checkpoint_id FROM book_checkpoints WHERE timestamp < ?)
+'''
+
+DELETE_CHECKPOINTS_BEFORE_SQLITE = 'DELETE FROM book_checkpoints WHERE timestamp < ?'
+
+# Индексы файла, которые пересоздаются после сброса пересозданием файла
+INDEX_DEFINITIONS_SQLITE = "SELECT sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+
+# Таблицы файла без служебных sqlite_*: пересоздать файл можно, только если все они свои
+TABLE_NAMES_SQLITE = "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'"
+SCHEMA_OBJECTS_COUNT_SQLITE = 'SELECT COUNT(*) FROM sqlite_master'
+
+FLOW_METRICS_TABLE_SQLITE = '''
+    CREATE TABLE IF NOT EXISTS flow_metrics (
+        symbol TEXT NOT NULL,
+        period TEXT NOT NULL,
+        metric TEXT NOT NULL,
+        timestamp INTEGER NOT NULL,
+        value REAL,
+        PRIMARY KEY (symbol, period, timestamp, metric)
+    ) WITHOUT ROWID
+'''
+
+UPSERT_FLOW_METRICS_SQLITE = '''
+    INSERT INTO flow_metrics (symbol, period, metric, timestamp, value)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (symbol, period, timestamp, metric) DO UPDATE SET value = excluded.value
+'''
+
+FLOW_METRICS_RANGE_SQLITE = '''
+    SELECT symbol, period, metric, timestamp, value
+    FROM flow_metrics
+    WHERE symbol = ? AND period = ? AND timestamp BETWEEN ? AND ?
+    ORDER BY timestamp, metric
+'''
+
+GET_INGEST_PROGRESS_SQLITE = '''
+    SELECT byte_offset, last_timestamp, last_order_id, processed FROM ingest_progress WHERE source = ?
+'''
+
+SAVE_INGEST_PROGRESS_SQLITE = '''
+    INSERT INTO ingest_progress (source, byte_offset, last_timestamp, last_order_id, processed)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (source) DO UPDATE SET
+        byte_offset = excluded.byte_offset,
+        last_timestamp = excluded.last_timestamp,
+        last_order_id = excluded.last_order_id,
+        processed = excluded.processed,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+ALL_ACTIVE_ORDERS_SQLITE = '''
+    SELECT order_id, symbol, operation, price, original_volume, remaining_volume, timestamp FROM active_orders
+'''
+
 INSERT_HISTORY_BATCH_SQLITE = '''
     INSERT INTO order_history (symbol, operation, timestamp, order_id, action_type, price, volume)
     VALUES (?, ?, ?, ?, ?, ?, ?)
@@ -130,6 +679,9 @@ GET_ACTIVE_ORDER_SQLITE = 'SELECT remaining_volume FROM active_orders WHERE orde
 UPDATE_ACTIVE_ORDER_VOLUME_SQLITE = 'UPDATE active_orders SET remaining_volume = ? WHERE order_id = ?'
 DELETE_ACTIVE_ORDER_SQLITE = 'DELETE FROM active_orders WHERE order_id = ?'
 
+APPLY_TRADE_SQLITE = 'UPDATE active_orders SET remaining_volume = remaining_volume - ? WHERE order_id = ?'
+DELETE_FILLED_ORDER_SQLITE = 'DELETE FROM active_orders WHERE order_id = ? AND remaining_volume <= 0'
+
 SAMPLE_ACTIVE_ORDERS_SQLITE = '''
     SELECT order_id, symbol, operation, price, original_volume, remaining_volume, timestamp
     FROM active_orders 
@@ -158,7 +710,7 @@ BEST_PRICES_QUERY_SQLITE = '''
         AND operation = 'B' 
         AND remaining_volume > 0
         AND timestamp <= ?
-    ORDER BY price DESC
+    ORDER BY price DESC, timestamp, order_id
     LIMIT 1
 '''
 
@@ -169,12 +721,81 @@ BEST_PRICES_QUERY_SQLITE_SELL = '''
         AND operation = 'S' 
         AND remaining_volume > 0
         AND timestamp <= ?
-    ORDER BY price ASC
+    ORDER BY price ASC, timestamp, order_id
     LIMIT 1
 '''
 
+ALL_BEST_PRICES_QUERY_SQLITE = '''
+    SELECT symbol, operation, order_id, price, remaining_volume, timestamp
+    FROM (
+        SELECT symbol, operation, order_id, price, remaining_volume, timestamp,
+            ROW_NUMBER() OVER (
+                PARTITION BY symbol, operation
+                ORDER BY CASE WHEN operation = 'B' THEN -price ELSE price END, timestamp, order_id
+            ) AS rank
+        FROM active_orders
+        WHERE remaining_volume > 0
+            AND timestamp <= ?
+            AND operation IN ('B', 'S')
+    )
+    WHERE rank = 1
+'''
+
+DEPTH_QUERY_SQLITE = '''
+    SELECT * FROM (
+        SELECT 'B' AS operation, price, SUM(remaining_volume) AS volume, COUNT(*) AS orders
+        FROM active_orders
+        WHERE symbol = ? AND operation = 'B' AND remaining_volume > 0 AND timestamp <= ?
+        GROUP BY price
+        ORDER BY price DESC
+        LIMIT ?
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'S' AS operation, price, SUM(remaining_volume) AS volume, COUNT(*) AS orders
+        FROM active_orders
+        WHERE symbol = ? AND operation = 'S' AND remaining_volume > 0 AND timestamp <= ?
+        GROUP BY price
+        ORDER BY price ASC
+        LIMIT ?
+    )
+'''
+
+IDX_ACTIVE_SYMBOL_SIDE_PRICE_SQLITE = '''
+    CREATE INDEX IF NOT EXISTS idx_active_symbol_side_price ON active_orders(symbol, operation, price)
+'''
+
 GET_ACTIVE_ORDERS_COUNT = """
 SELECT COUNT(*) FROM active_orders
 """
 
-IDX_HISTORY_ORDER_ID_SQLITE = 'CREATE INDEX IF NOT EXISTS idx_history_order_id ON order_history(order_id)' 
\ No newline at end of file
+IDX_HISTORY_ORDER_ID_SQLITE = 'CREATE INDEX IF NOT EXISTS idx_history_order_id ON order_history(order_id)'
+IDX_HISTORY_SYMBOL_TS_SQLITE = 'CREATE INDEX IF NOT EXISTS idx_history_symbol_ts ON order_history(symbol, timestamp)'
+
+INSERT_CHECKPOINT_SQLITE = 'INSERT INTO book_checkpoints (timestamp) VALUES (?)'
+
+INSERT_CHECKPOINT_ORDERS_SQLITE = '''
+    INSERT INTO book_checkpoint_orders
+        (checkpoint_id, order_id, symbol, operation, price, original_volume, remaining_volume, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+GET_CHECKPOINT_SQLITE = '''
+    SELECT checkpoint_id, timestamp FROM book_checkpoints
+    WHERE timestamp <= ?
+    ORDER BY timestamp DESC, checkpoint_id DESC
+    LIMIT 1
+'''
+
+GET_CHECKPOINT_ORDERS_SQLITE = '''
+    SELECT order_id, symbol, operation, price, original_volume, remaining_volume, timestamp
+    FROM book_checkpoint_orders
+    WHERE checkpoint_id = ? AND symbol = ?
+'''
+
+HISTORY_RANGE_SQLITE = '''
+    SELECT symbol, operation, timestamp, order_id, action_type, price, volume
+    FROM order_history
+    WHERE symbol = ? AND timestamp BETWEEN ? AND ?
+    ORDER BY id
+''' 
\ No newline at end of file
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+import argparse
+import logging
+from .db import ColumnarDB, DBInterface, SQLiteDB
+
+logger = logging.getLogger(__name__)
+
+
+def day_range(day: int):
+    """Границы меток дня YYYYMMDD для запросов по диапазону"""
+    return day * 1000000000, day * 1000000000 + 235959999
+
+
+def archive_history(db: DBInterface, archive: ColumnarDB, before_day: int, batch_size: int = 100000):
+    """Переносит историю дней раньше before_day в колоночный архив; возвращает перенесённые дни.
+
+    В архиве история доступна через archive.get_history_range(). День, уже лежащий в архиве
+    (повтор после сбоя между переносом и удалением), переписывается заново.
+    """
+    days = [day for day in db.history_days() if day < before_day]
+    archived_days = set(archive.history_days())
+    for day in days:
+        if day in archived_days:
+            archive.drop_history_days([day])
+        rows = 0
+        for batch in db.export_history(*day_range(day), batch_size):
+            archive.insert_history_batch(batch)
+            rows += len(batch)
+        archive.flush()
+        logger.info(f"Archived {rows} history rows of {day}")
+    return days
+
+
+class RetentionPolicy:
+    """Горячая история хранит keep_days последних торговых дней (дней, за которые есть история).
+
+    Более старые дни удаляются из БД вместе со снимками книги (drop_history_before); если
+    задан archive (ColumnarDB), они сначала переносятся в него. Бары и метрики потока не трогаются.
+    """
+
+    def __init__(self, keep_days: int, archive: ColumnarDB = None, batch_size: int = 100000):
+        if keep_days < 1:
+            raise ValueError(f"keep_days must be positive: {keep_days}")
+        self.keep_days = keep_days
+        self.archive = archive
+        self.batch_size = batch_size
+
+    def cutoff(self, days):
+        """Первый сохраняемый день или None, если удалять нечего"""
+        return days[-self.keep_days] if len(days) > self.keep_days else None
+
+    def apply(self, db: DBInterface):
+        """Возвращает {'archived': [...], 'dropped': [...]}"""
+        cutoff = self.cutoff(db.history_days())
+        if cutoff is None:
+            return {'archived': [], 'dropped': []}
+        archived = archive_history(db, self.archive, cutoff, self.batch_size) if self.archive is not None else []
+        dropped = db.drop_history_before(cutoff)
+        logger.info(f"Dropped history before {cutoff}: {dropped}")
+        return {'archived': archived, 'dropped': dropped}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Удаление старых дней истории SQLite с переносом в архив')
+    parser.add_argument('db_path')
+    parser.add_argument('--keep-days', type=int, required=True)
+    parser.add_argument('--archive', help='Каталог колоночного архива (ColumnarDB)')
+    parser.add_argument('--compact', action='store_true', help='Компактная схема истории')
+    parser.add_argument('--shard-by', choices=['symbol', 'day'])
+    args = parser.parse_args()
+
+    db = SQLiteDB(args.db_path, compact=args.compact, shard_by=args.shard_by)
+    archive = None
+    if args.archive:
+        archive = ColumnarDB(args.archive)
+        archive.create_tables()
+    try:
+        RetentionPolicy(args.keep_days, archive).apply(db)
+    finally:
+        db.close()
+        if archive is not None:
+            archive.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
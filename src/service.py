@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import decimal
+import functools
+import itertools
+import json
+import logging
+import socket
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .binlog import is_binary_log
+from .db import SQLiteDB
+from .engine import OrderBookEngine
+from .processor import TickDataProcessor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+# Пакет запросов приходит одной строкой
+MAX_LINE = 64 << 20
+# Ответов в кеше снимков, после которого кеш очищается (разные limit, levels и т.п.)
+MAX_CACHED = 4096
+
+
+class QueryError(RuntimeError):
+    """Ошибка выполнения запроса на стороне сервиса"""
+
+
+def _json_default(value):
+    if isinstance(value, sqlite3.Row):
+        return dict(value)
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    raise TypeError(f"Not JSON serializable: {type(value).__name__}")
+
+
+class _Encoded(str):
+    """Результат, уже записанный в JSON (снимки кодируются один раз на версию состояния); value - сам результат"""
+
+    def __new__(cls, value):
+        encoded = super().__new__(cls, json.dumps(value, default=_json_default))
+        encoded.value = value
+        return encoded
+
+
+def _encode(response) -> str:
+    if isinstance(response, list):
+        return '[' + ', '.join(_encode(item) for item in response) + ']'
+    if isinstance(response.get('result'), _Encoded):
+        return '{"id": ' + json.dumps(response['id']) + ', "result": ' + response['result'] + '}'
+    return json.dumps(response, default=_json_default)
+
+
+class QueryService:
+    """Локальный сервис запросов только для чтения: строки JSON по TCP.
+
+    Запрос - {"id": ..., "method": ..., "params": {...}}, ответ - {"id": ..., "result": ...}
+    или {"id": ..., "error": "..."}; список запросов в одной строке - пакет, ответ - список
+    ответов в том же порядке. Текущее состояние книги берётся из движка процессора, который
+    ведёт загрузка (в этом же процессе, в другом потоке): ответы считаются под processor.lock
+    и кешируются до следующего изменения движка (processor.version). Пока загрузка применяет
+    порцию, отвечают снимки до неё - как и БД, где порция фиксируется целиком. Всё, чего нет
+    в памяти (движок не задан, момент раньше последнего события, бары, история), идёт в БД
+    процессора из пула потоков; SQLite для этого открывается с concurrent_reads=True. Снимки
+    тоже считаются в пуле, поэтому цикл событий не ждёт processor.lock.
+    """
+
+    # Методы, которые отвечают только из БД: вызываются у процессора как есть
+    DB_METHODS = ('get_bars', 'get_flow_metrics', 'get_best_prices_as_of')
+
+    def __init__(self, processor: TickDataProcessor, host: str = '127.0.0.1', port: int = DEFAULT_PORT,
+                 db_workers: int = 4):
+        self.processor = processor
+        self.host = host
+        self.port = port
+        self.metrics = processor.metrics
+        self._executor = ThreadPoolExecutor(db_workers, thread_name_prefix='query-db')
+        self._cache = {}
+        # Снимки, которые сейчас считаются в пуле: ключ -> future
+        self._building = {}
+        # Открытые подключения: задача обработчика -> writer
+        self._connections = {}
+        self._handlers = {
+            'get_best_prices': self.get_best_prices,
+            'get_all_best_prices': self.get_all_best_prices,
+            'get_depth': self.get_depth,
+            'get_symbols_summary': self.get_symbols_summary,
+            'get_active_orders_sample': self.get_active_orders_sample,
+            'get_active_orders_count': self.get_active_orders_count,
+            'get_status': self.get_status,
+        }
+        for method in self.DB_METHODS:
+            self._handlers[method] = functools.partial(self._from_db, getattr(processor, method))
+        self._loop = None
+        self._stopped = None
+        self._thread = None
+
+    # Методы запросов: значение из памяти или корутина запроса к БД
+
+    def get_best_prices(self, symbol: str, timestamp: int = None):
+        if not self.processor.in_memory(timestamp):
+            return self._from_db(self.processor.db.get_best_prices, symbol, timestamp)
+        return self._snapshot(('best', symbol), lambda: self.processor.engine.get_best_prices(symbol),
+                              None if timestamp is None else lambda best: dict(best, timestamp=timestamp))
+
+    def get_all_best_prices(self, timestamp: int = None):
+        if not self.processor.in_memory(timestamp):
+            return self._from_db(self.processor.db.get_all_best_prices, timestamp)
+        return self._snapshot(('all_best',), self.processor.engine.get_all_best_prices,
+                              None if timestamp is None else lambda best: {
+                                  symbol: dict(result, timestamp=timestamp) for symbol, result in best.items()})
+
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        if not self.processor.in_memory(timestamp):
+            return self._from_db(self.processor.db.get_depth, symbol, levels, timestamp)
+        return self._snapshot(('depth', symbol, levels), lambda: self.processor.engine.get_depth(symbol, levels),
+                              None if timestamp is None else lambda depth: dict(depth, timestamp=timestamp))
+
+    def get_symbols_summary(self):
+        if not self.processor.in_memory():
+            return self._from_db(self.processor.db.get_symbols_summary)
+        return self._snapshot(('summary',), self.processor.engine.get_symbols_summary)
+
+    def get_active_orders_sample(self, limit: int = 10):
+        if not self.processor.in_memory():
+            return self._from_db(self.processor.db.get_active_orders_sample, limit)
+        return self._snapshot(('sample', limit), lambda: self.processor.engine.get_active_orders_sample(limit))
+
+    def get_active_orders_count(self):
+        if not self.processor.in_memory():
+            return self._from_db(self.processor.db.get_active_orders_count)
+        return self._snapshot(('count',), self.processor.engine.get_active_orders_count)
+
+    def get_status(self):
+        """Версия состояния, последнее событие в памяти и отвечает ли сервис из памяти"""
+        in_memory = self.processor.in_memory()
+        return {
+            'in_memory': in_memory,
+            'version': self.processor.version,
+            'last_timestamp': self.processor.engine.last_timestamp if in_memory else None,
+        }
+
+    def _snapshot(self, key, compute, then=None):
+        """Ответ по состоянию движка в JSON, кешированный до следующего изменения состояния.
+
+        Из кеша - сразу значение, иначе корутина расчёта в пуле; then(value) - ответ из снимка
+        """
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == self.processor.version:
+            return cached[1] if then is None else then(cached[1].value)
+        return self._build(key, compute, cached, then)
+
+    async def _build(self, key, compute, cached, then):
+        while True:
+            # Одновременные запросы одного снимка ждут один расчёт
+            building = self._building.get(key)
+            if building is None:
+                building = self._building[key] = self._loop.run_in_executor(
+                    self._executor, self._compute, compute, cached is None)
+                building.add_done_callback(functools.partial(self._built, key))
+            # Загрузка применяет порцию: отвечает снимок до неё, если он есть
+            snapshot = await asyncio.shield(building) or self._cache.get(key)
+            if snapshot is not None:
+                return snapshot[1] if then is None else then(snapshot[1].value)
+            cached = None
+
+    def _compute(self, compute, blocking: bool):
+        """Расчёт снимка в потоке пула; None, если блокировка занята, а ждать не нужно"""
+        if not self.processor.lock.acquire(blocking=blocking):
+            return None
+        try:
+            version = self.processor.version
+            value = compute()
+        finally:
+            self.processor.lock.release()
+        return version, _Encoded(value)
+
+    def _built(self, key, future):
+        del self._building[key]
+        if future.cancelled() or future.exception() is not None or future.result() is None:
+            return
+        if len(self._cache) >= MAX_CACHED:
+            self._cache.clear()
+        self._cache[key] = future.result()
+
+    async def _from_db(self, method, *args, **kwargs):
+        self.metrics.inc('query_db_calls_total', method=method.__name__)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(method, *args, **kwargs))
+
+    # Сервер
+
+    def _call(self, request):
+        """Ответ на запрос из памяти или корутина, которая вернёт ответ из БД"""
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            handler = self._handlers.get(request.get('method'))
+            if handler is None:
+                raise ValueError(f"Unknown method: {request.get('method')}")
+            result = handler(**(request.get('params') or {}))
+        except Exception as error:
+            return self._error(request_id, error)
+        if asyncio.iscoroutine(result):
+            return self._await(request_id, result)
+        return {'id': request_id, 'result': result}
+
+    async def _await(self, request_id, result):
+        try:
+            return {'id': request_id, 'result': await result}
+        except Exception as error:
+            return self._error(request_id, error)
+
+    @staticmethod
+    def _error(request_id, error):
+        logger.debug(f"Query {request_id} failed: {error!r}")
+        return {'id': request_id, 'error': f"{type(error).__name__}: {error}"}
+
+    async def _respond(self, request):
+        if not isinstance(request, list):
+            self.metrics.inc('query_requests_total')
+            response = self._call(request)
+            return await response if asyncio.iscoroutine(response) else response
+        self.metrics.inc('query_requests_total', len(request))
+        responses = [self._call(item) for item in request]
+        # Запросы к БД внутри пакета идут параллельно в пуле потоков
+        pending = [index for index, response in enumerate(responses) if asyncio.iscoroutine(response)]
+        if pending:
+            for index, response in zip(pending, await asyncio.gather(*(responses[index] for index in pending))):
+                responses[index] = response
+        return responses
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        writer.get_extra_info('socket').setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._connections[asyncio.current_task()] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                except ValueError as error:
+                    response = {'id': None, 'error': f"Invalid JSON: {error}"}
+                else:
+                    response = await self._respond(request)
+                writer.write(_encode(response).encode() + b'\n')
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError) as error:
+            logger.debug(f"Query connection closed: {error!r}")
+        finally:
+            del self._connections[asyncio.current_task()]
+            writer.close()
+
+    async def serve(self, ready: threading.Event = None):
+        """Обслуживание до stop(); ready выставляется, когда порт открыт (self.port - фактический порт)"""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        server = await asyncio.start_server(self._handle, self.host, self.port, limit=MAX_LINE)
+        self.port = server.sockets[0].getsockname()[1]
+        logger.info(f"Query service listening on {self.host}:{self.port}")
+        if ready is not None:
+            ready.set()
+        async with server:
+            await self._stopped.wait()
+            server.close()
+            # Закрытие writer завершает чтение обработчика: он выходит сам, без отмены
+            for writer in list(self._connections.values()):
+                writer.close()
+            await asyncio.gather(*self._connections, return_exceptions=True)
+        self._executor.shutdown(wait=False)
+        logger.info("Query service stopped")
+
+    def start(self):
+        """Запуск в отдельном потоке; возвращает (host, port), когда порт открыт"""
+        ready = threading.Event()
+        errors = []
+
+        def run():
+            try:
+                asyncio.run(self.serve(ready))
+            except Exception as error:
+                errors.append(error)
+            finally:
+                ready.set()
+
+        self._thread = threading.Thread(target=run, name='query-service', daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            self._thread.join()
+            self._thread = None
+            raise RuntimeError(f"Query service failed to start on {self.host}:{self.port}") from errors[0]
+        return self.host, self.port
+
+    def stop(self):
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._stopped.set)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class QueryClient:
+    """Синхронный клиент QueryService: одно подключение, вызовы по одному или пакетом.
+
+    client.get_best_prices('RIH1'); client.batch([('get_best_prices', {'symbol': 'RIH1'}),
+    ('get_symbols_summary', {})]) - список результатов в порядке запросов.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT, timeout: float = 10.0):
+        self._socket = socket.create_connection((host, port), timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._file = self._socket.makefile('rb')
+        self._ids = itertools.count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def close(self):
+        self._file.close()
+        self._socket.close()
+
+    def _exchange(self, message):
+        self._socket.sendall(json.dumps(message).encode() + b'\n')
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError("Query service closed the connection")
+        return json.loads(line)
+
+    @staticmethod
+    def _result(response):
+        if 'error' in response:
+            raise QueryError(response['error'])
+        return response['result']
+
+    def call(self, method: str, **params):
+        return self._result(self._exchange({'id': next(self._ids), 'method': method, 'params': params}))
+
+    def batch(self, requests):
+        """requests - пары (method, params); QueryError при первой ошибке"""
+        messages = [{'id': next(self._ids), 'method': method, 'params': params} for method, params in requests]
+        if not messages:
+            return []
+        return [self._result(response) for response in self._exchange(messages)]
+
+    def get_best_prices(self, symbol: str, timestamp: int = None):
+        return self.call('get_best_prices', symbol=symbol, timestamp=timestamp)
+
+    def get_all_best_prices(self, timestamp: int = None):
+        return self.call('get_all_best_prices', timestamp=timestamp)
+
+    def get_depth(self, symbol: str, levels: int = 10, timestamp: int = None):
+        return self.call('get_depth', symbol=symbol, levels=levels, timestamp=timestamp)
+
+    def get_symbols_summary(self):
+        return self.call('get_symbols_summary')
+
+    def get_active_orders_sample(self, limit: int = 10):
+        return self.call('get_active_orders_sample', limit=limit)
+
+    def get_active_orders_count(self):
+        return self.call('get_active_orders_count')
+
+    def get_status(self):
+        return self.call('get_status')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный сервис запросов к стакану с загрузкой в этом же процессе')
+    parser.add_argument('source', nargs='?', help='CSV или двоичный журнал для загрузки; без него - ответы из БД')
+    parser.add_argument('--db', default='tick_data.db', help='Файл SQLite')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--follow', action='store_true', help='Следить за растущим CSV')
+    parser.add_argument('--batch-size', type=int, default=50000)
+    args = parser.parse_args()
+    if args.follow and not args.source:
+        parser.error('--follow requires a source CSV')
+
+    db = SQLiteDB(args.db, profile='ingest', concurrent_reads=True)
+    db.create_tables()
+    processor = TickDataProcessor(db, engine=OrderBookEngine())
+    service = QueryService(processor, args.host, args.port)
+    service.start()
+    # Загрузка идёт в основном потоке (в нём же подключение SQLite для записи), сервис - в своём
+    try:
+        if args.follow:
+            processor.follow_csv_file(args.source, args.batch_size)
+        elif args.source and is_binary_log(args.source):
+            processor.process_binlog_file(args.source, batch_size=args.batch_size)
+        elif args.source:
+            processor.process_csv_file(args.source, batch_size=args.batch_size, vectorized=True)
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        db.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,148 @@
+import bz2
+import glob
+import gzip
+import io
+import lzma
+import os
+import queue
+import re
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstd нужен только для архивов .zst
+    zstandard = None
+
+# Блок чтения распакованных данных и число блоков, которые читающий поток держит впереди разбора
+READ_BLOCK_SIZE = 4 << 20
+READ_AHEAD_BLOCKS = 4
+
+
+def _open_zstd(path, mode='rb'):
+    if zstandard is None:
+        raise ImportError(f"Reading {path} requires zstandard: pip install zstandard")
+    return zstandard.open(path, mode)
+
+
+# Сигнатура в начале файла -> функция открытия
+COMPRESSIONS = {
+    'gzip': (b'\x1f\x8b', gzip.open),
+    'xz': (b'\xfd7zXZ\x00', lzma.open),
+    'bz2': (b'BZh', bz2.open),
+    'zstd': (b'\x28\xb5\x2f\xfd', _open_zstd),
+}
+
+
+def sniff_compression(path: str):
+    """Формат сжатия по сигнатуре файла ('gzip', 'xz', 'bz2', 'zstd') или None для несжатого"""
+    with open(path, 'rb') as f:
+        magic = f.read(6)
+    for name, (signature, _) in COMPRESSIONS.items():
+        if magic.startswith(signature):
+            return name
+    return None
+
+
+def expand_sources(source):
+    """Файл, каталог, маска или список из них -> упорядоченный список файлов"""
+    if isinstance(source, (list, tuple)):
+        return [path for item in source for path in expand_sources(item)]
+    if os.path.isdir(source):
+        paths = sorted(
+            entry.path for entry in os.scandir(source) if entry.is_file() and not entry.name.startswith('.')
+        )
+    elif glob.has_magic(source):
+        paths = sorted(path for path in glob.glob(source) if os.path.isfile(path))
+    else:
+        return [source]
+    if not paths:
+        raise FileNotFoundError(f"No input files: {source}")
+    return paths
+
+
+def source_day(path: str):
+    """Торговый день YYYYMMDD из имени файла; без даты в имени - имя файла"""
+    name = os.path.basename(path)
+    match = re.search(r'(?<!\d)(\d{8})(?!\d)', name)
+    return match.group(1) if match else name
+
+
+def group_sources_by_day(paths):
+    """{день: файлы дня по порядку}"""
+    groups = {}
+    for path in paths:
+        groups.setdefault(source_day(path), []).append(path)
+    return groups
+
+
+class BackgroundReader(io.RawIOBase):
+    """Чтение потока крупными блоками в отдельном потоке.
+
+    gzip, lzma, bz2 и zstandard отпускают GIL на время распаковки, поэтому распаковка
+    следующих блоков идёт одновременно с разбором CSV в основном потоке.
+    """
+
+    def __init__(self, stream, block_size: int = READ_BLOCK_SIZE, read_ahead: int = READ_AHEAD_BLOCKS):
+        self._stream = stream
+        self._block_size = block_size
+        self._blocks = queue.Queue(read_ahead)
+        self._pending = memoryview(b'')
+        self._eof = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='source-reader', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                block = self._stream.read(self._block_size)
+                self._put(block)
+                if not block:
+                    return
+        except Exception as error:
+            self._put(error)
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._blocks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if not self._pending:
+            if self._eof:
+                return 0
+            block = self._blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if not block:
+                self._eof = True
+                return 0
+            self._pending = memoryview(block)
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._stream.close()
+        super().close()
+
+
+def open_source(path: str, block_size: int = READ_BLOCK_SIZE, background: bool = True):
+    """Двоичный поток с данными файла; сжатые файлы распаковываются на лету (в отдельном потоке)"""
+    compression = sniff_compression(path)
+    if compression is None:
+        return open(path, 'rb', buffering=block_size)
+    stream = COMPRESSIONS[compression][1](path, 'rb')
+    if not background:
+        return stream
+    return io.BufferedReader(BackgroundReader(stream, block_size), buffer_size=block_size)
@@ -0,0 +1,153 @@
+import math
+import os
+import random
+import pytest
+from src.db import SQLiteDB
+from src.engine import OrderBookEngine
+from src.processor import TickDataProcessor
+
+HEADER = '#SYMBOL,SYSTEM,TYPE,MOMENT,ID,ACTION,PRICE,VOLUME,ID_DEAL,PRICE_DEAL'
+SYMBOLS = ('AAA', 'BBB', 'CCC')
+
+
+def moment(day: int, ms: int) -> int:
+    """Метка YYYYMMDDHHMMSSmmm: day и ms от 10:00 этого дня"""
+    seconds, millis = divmod(ms, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return day * 1000000000 + (10 + hours) * 10000000 + minutes * 100000 + seconds * 1000 + millis
+
+
+def event_lines(seed: int, events: int = 600, ids: int = 40, days=(20241001,)):
+    """Строки CSV в формате 10 колонок. Небольшой набор order_id, поэтому id переиспользуются:
+    повторные вставки живых заявок, вставки после сделок и снятий, события до вставки"""
+    rng = random.Random(seed)
+    lines = []
+    per_day = events // len(days)
+    deal_id = 1000
+    for day in days:
+        ms = 0
+        for _ in range(per_day):
+            ms += rng.choice((0, 1, 3, 250))
+            order_id = rng.randrange(ids)
+            symbol = SYMBOLS[order_id % len(SYMBOLS)]
+            operation = 'B' if order_id % 2 else 'S'
+            action = rng.choices((1, 2, 0), weights=(45, 30, 25))[0]
+            price = rng.randint(9990, 10010) / 10
+            volume = rng.randint(1, 5)
+            if action == 2:
+                deal_id += 1
+                deal = f'{deal_id},{price:.5f}'
+            else:
+                deal = ','
+            lines.append(f'{symbol},F,{operation},{moment(day, ms)},{order_id},{action},{price:.5f},{volume},{deal}')
+    return lines
+
+
+@pytest.fixture
+def make_csv(tmp_path):
+    """Фабрика CSV: make_csv(seed, events=..., ids=..., days=...) -> путь к файлу"""
+    def make(seed: int = 0, name: str = None, **kwargs):
+        path = tmp_path / (name or f'events_{seed}.csv')
+        path.write_text(HEADER + '\n' + '\n'.join(event_lines(seed, **kwargs)) + '\n')
+        return str(path)
+    return make
+
+
+# Параметры PostgresDB/AsyncPostgresDB -> переменные окружения libpq
+POSTGRES_ENV = {'host': 'PGHOST', 'port': 'PGPORT', 'database': 'PGDATABASE', 'user': 'PGUSER', 'password': 'PGPASSWORD'}
+POSTGRES_TABLES = ('order_history', 'order_history_v2', 'symbols', 'active_orders', 'book_checkpoint_orders',
+                   'book_checkpoints', 'ingest_progress', 'bars', 'flow_metrics')
+
+
+@pytest.fixture
+def pg_params():
+    """Параметры подключения из PG*; без PGHOST и PGDATABASE тест пропускается.
+    База должна быть отдельной для тестов: таблицы в ней удаляются перед каждым тестом"""
+    if not (os.environ.get('PGHOST') and os.environ.get('PGDATABASE')):
+        pytest.skip('PostgreSQL tests need PGHOST and PGDATABASE')
+    params = {name: os.environ[variable] for name, variable in POSTGRES_ENV.items() if variable in os.environ}
+    psycopg2 = pytest.importorskip('psycopg2')
+    conn = psycopg2.connect(**params)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {", ".join(POSTGRES_TABLES)} CASCADE')
+    conn.close()
+    return params
+
+
+def active_rows(db):
+    """active_orders в виде сравнимых кортежей"""
+    return sorted(
+        (int(row[0]), row[1], row[2], round(float(row[3]), 5), int(row[4]), int(row[5]), int(row[6]))
+        for row in db.get_active_orders()
+    )
+
+
+# Режим загрузки потока (журнал, слежение за файлом) -> (фабрика движка, аргументы загрузки)
+STREAM_MODES = {
+    'rows': (None, {}),
+    'engine': (OrderBookEngine, {}),
+    'coalesce': (None, {'coalesce': True}),
+}
+
+
+def make_engine(factory):
+    return factory() if factory else None
+
+
+def load_csv(path, csv_file, batch_size=50, engine=None, **kwargs):
+    """SQLite после загрузки CSV; без engine и kwargs - построчный эталон для сравнения"""
+    db = SQLiteDB(str(path))
+    db.create_tables()
+    TickDataProcessor(db, engine=engine).process_csv_file(csv_file, batch_size=batch_size, **kwargs)
+    return db
+
+
+def assert_same_book(db, expected):
+    """active_orders и история всех инструментов совпадают с эталоном"""
+    assert active_rows(db) == active_rows(expected)
+    for symbol in SYMBOLS:
+        assert history_rows(db, symbol) == history_rows(expected, symbol)
+
+
+def summary_rows(summary):
+    """get_symbols_summary без различий в последних разрядах средней цены"""
+    return [dict(row, avg_price=round(row['avg_price'], 6)) for row in map(dict, summary)]
+
+
+def history_rows(db, symbol, from_ts=0, to_ts=99999999999999999):
+    return [
+        (row['symbol'], row['operation'], int(row['timestamp']), int(row['order_id']), int(row['action_type']),
+         round(float(row['price']), 5), int(row['volume']))
+        for row in db.get_history_range(symbol, from_ts, to_ts)
+    ]
+
+
+def csv_events(path):
+    """События CSV по порядку в аргументах OrderBookEngine.apply"""
+    events = []
+    for line in open(path).read().splitlines()[1:]:
+        symbol, _, operation, timestamp, order_id, action, price, volume, _, _ = line.split(',')
+        events.append((int(action), int(order_id), symbol, operation, float(price), int(volume), int(timestamp)))
+    return events
+
+
+def replay_best(events, symbol, timestamp):
+    """Лучшие цены полным проходом по событиям с меткой не позже timestamp: (цена, остаток, id) по сторонам"""
+    book = OrderBookEngine(track_changes=False)
+    for event in events:
+        if event[6] > timestamp:
+            break
+        book.apply(*event)
+    best = book.get_best_prices(symbol)
+    return tuple((side['price'], side['remaining_volume'], side['order_id']) if side else None
+                 for side in (best['max_buy_price'], best['min_sell_price']))
+
+
+def sampled_best(result, index):
+    """Точка index результата sample_best_prices в виде replay_best"""
+    return tuple(
+        None if math.isnan(result[f'{side}_price'][index]) else
+        (result[f'{side}_price'][index], result[f'{side}_volume'][index], result[f'{side}_order_id'][index])
+        for side in ('bid', 'ask'))
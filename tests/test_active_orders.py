@@ -0,0 +1,95 @@
+import pytest
+from src.db import SQLiteDB
+from src.engine import OrderBookEngine
+from src.order_store import ActiveOrderStore
+from src.processor import TickDataProcessor
+from conftest import active_rows, assert_same_book, load_csv, make_engine, summary_rows, SYMBOLS
+
+# Режим загрузки -> (фабрика движка, аргументы process_csv_file)
+MODES = {
+    'vectorized': (None, {'vectorized': True}),
+    'engine_diff': (lambda: OrderBookEngine(flush_every=50), {}),
+    'engine_snapshot': (lambda: OrderBookEngine(flush_every=50, flush_mode='snapshot'), {'vectorized': True}),
+    'coalesce_rows': (None, {'coalesce': True}),
+    'coalesce_vectorized': (None, {'coalesce': True, 'vectorized': True}),
+    # Малая ёмкость: колонки и индекс растут по ходу загрузки
+    'store_rows': (lambda: ActiveOrderStore(capacity=4, flush_every=50), {}),
+    'store_vectorized': (lambda: ActiveOrderStore(capacity=4), {'vectorized': True}),
+}
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('batch_size', [7, 100, 1000])
+@pytest.mark.parametrize('mode', list(MODES))
+def test_mode_matches_rows(tmp_path, make_csv, seed, batch_size, mode):
+    csv_file = make_csv(seed)
+    expected = load_csv(tmp_path / 'rows.db', csv_file, batch_size)
+    engine_factory, kwargs = MODES[mode]
+    db = load_csv(tmp_path / f'{mode}.db', csv_file, batch_size, make_engine(engine_factory), **kwargs)
+    try:
+        assert_same_book(db, expected)
+    finally:
+        db.close()
+        expected.close()
+
+
+def test_coalesce_reinsert_after_fill_from_previous_window(tmp_path):
+    """Заявка прошлого окна исполнена и выставлена заново с тем же id; повторная вставка живой заявки игнорируется"""
+    csv_file = tmp_path / 'reuse.csv'
+    csv_file.write_text('\n'.join([
+        '#SYMBOL,SYSTEM,TYPE,MOMENT,ID,ACTION,PRICE,VOLUME,ID_DEAL,PRICE_DEAL',
+        'AAA,F,B,20241001100000000,1,1,100.00000,5,,',
+        'AAA,F,B,20241001100000000,2,1,100.00000,5,,',
+        'AAA,F,B,20241001100000001,1,2,100.00000,5,10,100.00000',
+        'AAA,F,B,20241001100000001,1,1,101.00000,3,,',
+        'AAA,F,B,20241001100000002,2,1,102.00000,4,,',
+        'AAA,F,B,20241001100000002,2,2,100.00000,1,11,100.00000',
+    ]) + '\n')
+    expected = load_csv(tmp_path / 'rows.db', str(csv_file), 2)
+    db = load_csv(tmp_path / 'coalesce.db', str(csv_file), 2, coalesce=True)
+    try:
+        assert active_rows(db) == active_rows(expected) == [
+            (1, 'AAA', 'B', 101.0, 3, 3, 20241001100000001),
+            (2, 'AAA', 'B', 100.0, 5, 4, 20241001100000000),
+        ]
+    finally:
+        db.close()
+        expected.close()
+
+
+def test_coalesce_follow_resume(tmp_path, make_csv):
+    """Продолжение загрузки со свёрткой знает заявки, уже записанные в active_orders"""
+    lines = open(make_csv(3)).read().splitlines()
+    csv_file = tmp_path / 'grow.csv'
+    csv_file.write_text('\n'.join(lines[:300]) + '\n')
+    db = SQLiteDB(str(tmp_path / 'follow.db'))
+    db.create_tables()
+    TickDataProcessor(db).follow_csv_file(str(csv_file), batch_size=50, idle_timeout=0.05, poll_interval=0.01,
+                                          coalesce=True)
+    with open(csv_file, 'a') as f:
+        f.write('\n'.join(lines[300:]) + '\n')
+    TickDataProcessor(db).follow_csv_file(str(csv_file), batch_size=50, idle_timeout=0.05, poll_interval=0.01,
+                                          coalesce=True)
+    expected = load_csv(tmp_path / 'rows.db', str(csv_file))
+    try:
+        assert active_rows(db) == active_rows(expected)
+    finally:
+        db.close()
+        expected.close()
+
+
+def test_store_queries_match_engine(make_csv):
+    """Запросы ActiveOrderStore по колонкам совпадают с OrderBookEngine"""
+    engine, store = OrderBookEngine(track_changes=False), ActiveOrderStore(capacity=4)
+    for line in open(make_csv(4)).read().splitlines()[1:]:
+        symbol, _, operation, timestamp, order_id, action, price, volume, _, _ = line.split(',')
+        event = (int(action), int(order_id), symbol, operation, float(price), int(volume), int(timestamp))
+        engine.apply(*event)
+        store.apply(*event)
+    assert sorted(store.iter_orders()) == sorted(engine.iter_orders())
+    assert summary_rows(store.get_symbols_summary()) == summary_rows(engine.get_symbols_summary())
+    for symbol in SYMBOLS:
+        assert store.get_depth(symbol, 3) == engine.get_depth(symbol, 3)
+        best, expected = store.get_best_prices(symbol), engine.get_best_prices(symbol)
+        for side in ('max_buy_price', 'min_sell_price'):
+            assert (best[side] or {}).get('price') == (expected[side] or {}).get('price')
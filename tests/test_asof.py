@@ -0,0 +1,57 @@
+import random
+import pytest
+from src.asof import AsOfBook, CheckpointWriter
+from src.db import SQLiteDB
+from src.engine import OrderBookEngine
+from src.processor import TickDataProcessor
+from conftest import SYMBOLS, csv_events, moment, replay_best, sampled_best
+
+DAY = 20241001
+
+
+def query_points(events, seed=0, count=20):
+    """Точки запроса: метки событий (на метке применены все её события), моменты между ними и до начала дня"""
+    rng = random.Random(seed)
+    times = sorted({event[6] for event in events})
+    # 600 событий conftest занимают около 40 секунд от 10:00
+    timestamps = rng.sample(times, count) + [moment(DAY, rng.randrange(45000)) for _ in range(count)]
+    timestamps.append(DAY * 1000000000)
+    return [rng.choice(SYMBOLS) for _ in timestamps], timestamps
+
+
+def book_best(best):
+    return tuple((side['price'], side['remaining_volume'], side['order_id']) if side else None
+                 for side in (best['max_buy_price'], best['min_sell_price']))
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+@pytest.mark.parametrize('checkpoints', [None, {'every_events': 60}, {'every_ms': 2000}],
+                         ids=['no_checkpoints', 'every_events', 'every_ms'])
+def test_asof_matches_replay(tmp_path, make_csv, checkpoints, vectorized):
+    csv_file = make_csv(10)
+    events = csv_events(csv_file)
+    db = SQLiteDB(str(tmp_path / 'asof.db'))
+    db.create_tables()
+    processor = TickDataProcessor(db, engine=OrderBookEngine(),
+                                  checkpoints=CheckpointWriter(**checkpoints) if checkpoints else None)
+    processor.process_csv_file(csv_file, batch_size=50, vectorized=vectorized)
+    symbols, timestamps = query_points(events)
+    expected = [replay_best(events, symbol, timestamp) for symbol, timestamp in zip(symbols, timestamps)]
+    try:
+        assert [book_best(AsOfBook(db).get_best_prices(symbol, timestamp))
+                for symbol, timestamp in zip(symbols, timestamps)] == expected
+        result = processor.sample_best_prices(symbols, timestamps)
+        assert [sampled_best(result, index) for index in range(len(symbols))] == expected
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize('batch_size', [7, 1000])
+def test_sample_from_csv_matches_replay(make_csv, batch_size):
+    csv_file = make_csv(11)
+    events = csv_events(csv_file)
+    symbols, timestamps = query_points(events, seed=1)
+    result = TickDataProcessor(None).sample_best_prices(symbols, timestamps, source=csv_file, batch_size=batch_size)
+    assert list(result['timestamp']) == timestamps
+    assert [sampled_best(result, index) for index in range(len(symbols))] == [
+        replay_best(events, symbol, timestamp) for symbol, timestamp in zip(symbols, timestamps)]
@@ -0,0 +1,127 @@
+import random
+import numpy as np
+import pytest
+from src.bars import TRADES, BarAggregator, period_ms
+from src.db import ColumnarDB, SQLiteDB
+from src.encoding import LATEST_MOMENT, NS_PER_MS, moments_to_ns, ns_to_moments
+from src.processor import TickDataProcessor
+from conftest import event_lines, HEADER, SYMBOLS
+
+PERIODS = ('1s', '1m')
+
+
+def paired_lines(seed):
+    """События conftest, где у каждой сделки есть вторая сторона с тем же id_deal несколькими строками позже"""
+    rng = random.Random(seed)
+    lines = event_lines(seed, events=800)
+    pending = []
+    result = []
+    for line in lines:
+        result.append(line)
+        fields = line.split(',')
+        timestamp = fields[3]
+        still_pending = []
+        for due, counter in pending:
+            if due <= len(result):
+                # Вторая сторона не раньше предыдущей строки файла
+                result.append(','.join([*counter[:3], timestamp, *counter[4:]]))
+            else:
+                still_pending.append((due, counter))
+        pending = still_pending
+        if fields[5] == '2':
+            counter = list(fields)
+            counter[2] = 'S' if fields[2] == 'B' else 'B'
+            counter[4] = str(int(fields[4]) + 1000)
+            pending.append((len(result) + rng.randrange(0, 30), counter))
+    for _, counter in pending:
+        result.append(','.join([*counter[:3], result[-1].split(',')[3], *counter[4:]]))
+    return result
+
+
+def reference_bars(lines, period):
+    """Бары по первой строке каждого id_deal, построчно"""
+    length = period_ms(period)
+    seen = set()
+    bars = {}
+    for line in lines:
+        symbol, _, _, timestamp, _, action, price, volume, deal_id, deal_price = line.split(',')
+        if action != '2' or not deal_id or deal_id in seen:
+            continue
+        seen.add(deal_id)
+        start = int(moments_to_ns(int(timestamp))) // NS_PER_MS // length * length
+        price, volume = float(deal_price), int(volume)
+        bar = bars.get((symbol, start))
+        if bar is None:
+            bars[symbol, start] = [price, price, price, price, volume, price * volume, 1]
+        else:
+            bar[1], bar[2], bar[3] = max(bar[1], price), min(bar[2], price), price
+            bar[4] += volume
+            bar[5] += price * volume
+            bar[6] += 1
+    return {
+        symbol: [(int(ns_to_moments(start * NS_PER_MS)), *bar[:5], round(bar[5] / bar[4], 6), bar[6])
+                 for (bar_symbol, start), bar in sorted(bars.items()) if bar_symbol == symbol]
+        for symbol in SYMBOLS
+    }
+
+
+def stored_bars(db, symbol, period):
+    return [(row['timestamp'], row['open'], row['high'], row['low'], row['close'], row['volume'],
+             round(row['vwap'], 6), row['trades'])
+            for row in db.get_bars(symbol, period, 0, LATEST_MOMENT)]
+
+
+@pytest.fixture
+def paired_csv(tmp_path):
+    lines = paired_lines(5)
+    path = tmp_path / 'paired.csv'
+    path.write_text(HEADER + '\n' + '\n'.join(lines) + '\n')
+    return str(path), lines
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'columnar'])
+@pytest.mark.parametrize('vectorized', [False, True], ids=['rows', 'vectorized'])
+@pytest.mark.parametrize('batch_size', [7, 1000])
+def test_bars_count_each_deal_once(tmp_path, paired_csv, backend, vectorized, batch_size):
+    csv_file, lines = paired_csv
+    deals = [line for line in lines if line.split(',')[5] == '2']
+    assert len({line.split(',')[8] for line in deals}) * 2 == len(deals)
+    db = SQLiteDB(str(tmp_path / 'bars.db')) if backend == 'sqlite' else ColumnarDB(str(tmp_path / 'columnar'))
+    db.create_tables()
+    try:
+        TickDataProcessor(db, bars=BarAggregator(PERIODS)).process_csv_file(
+            csv_file, batch_size=batch_size, vectorized=vectorized)
+        for period in PERIODS:
+            expected = reference_bars(lines, period)
+            for symbol in SYMBOLS:
+                assert stored_bars(db, symbol, period) == expected[symbol]
+    finally:
+        db.close()
+
+
+def test_second_side_after_window_counted_again():
+    """id_deal помнится dedup_window_ms: вторая сторона позже окна считается новой сделкой"""
+    aggregator = BarAggregator(('1m',), dedup_window_ms=1000)
+    for timestamp, deal_id in ((20241001100000000, 1), (20241001100000500, 1), (20241001100005000, 2),
+                               (20241001100005000, 1)):
+        aggregator.apply_columns({
+            'symbol': np.array(['AAA'], dtype=object), 'action': np.array([2]), 'deal_id': np.array([deal_id]),
+            'timestamp': np.array([timestamp]), 'deal_price': np.array([100.0]), 'price': np.array([100.0]),
+            'volume': np.array([1]),
+        })
+    (bar,) = aggregator.bars.values()
+    assert bar[TRADES] == 3
+
+
+def test_seven_columns_skip_bars(tmp_path, caplog):
+    csv_file = tmp_path / 'short.csv'
+    csv_file.write_text('#SYMBOL,TYPE,MOMENT,ID,ACTION,PRICE,VOLUME\n' + 'AAA,B,20241001100000000,1,2,100.0,1\n')
+    db = SQLiteDB(str(tmp_path / 'short.db'))
+    db.create_tables()
+    try:
+        with caplog.at_level('WARNING'):
+            TickDataProcessor(db, bars=BarAggregator()).process_csv_file(str(csv_file), vectorized=True)
+        assert 'Bars require id_deal' in caplog.text
+        assert db.get_bars('AAA', '1s', 0, LATEST_MOMENT) == []
+    finally:
+        db.close()
@@ -0,0 +1,31 @@
+from src import benchmark
+
+
+def test_stress_without_baseline_rate(monkeypatch, make_csv, caplog):
+    """Нулевая базовая скорость: замедление None, отчёт не падает на форматировании"""
+    runs = iter([0.0, 1000.0])
+    monkeypatch.setattr(benchmark, 'stress_run', lambda *args: {
+        'events_per_sec': next(runs), 'reads': {}, 'read_errors': 0})
+    with caplog.at_level('INFO', logger=benchmark.logger.name):
+        result = benchmark.run_stress(make_csv(0), readers=1)
+    assert result['write_slowdown'] is None
+    assert 'slowdown n/a' in caplog.text
+
+
+def test_suite_forwards_generator_options(monkeypatch, tmp_path):
+    """Без --csv файл генерируется со всеми параметрами TickGenerator, и они записываются в отчёт"""
+    calls = []
+    monkeypatch.setattr(benchmark, 'run_suite', lambda csv_file, *args: calls.append((open(csv_file, 'rb').read(), args)))
+    monkeypatch.setattr('sys.argv', [
+        'benchmark', 'suite', '--events', '500', '--symbols', '4', '--seed', '7', '--lifetime', 'lognormal',
+        '--lifetime-mean-ms', '900', '--fill-ratio', '0.6', '--volatility', '0.002', '--orders-per-ms', '2',
+        '--block-orders', '300', '--output', str(tmp_path / 'report.json'),
+    ])
+    benchmark.main()
+    (data, args), = calls
+    options = {'symbols': 4, 'seed': 7, 'lifetime': 'lognormal', 'lifetime_mean_ms': 900.0, 'fill_ratio': 0.6,
+               'volatility': 0.002, 'orders_per_ms': 2.0, 'start_moment': 20241001100000000, 'block_orders': 300}
+    assert args[-2] == {'events': 500, 'columns': 10, **options}
+    expected = tmp_path / 'expected.csv'
+    benchmark.TickGenerator(**options).write_csv(str(expected), 500, 10)
+    assert data == expected.read_bytes()
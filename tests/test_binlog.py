@@ -0,0 +1,92 @@
+import math
+import pytest
+from src.binlog import BinaryLogReader, convert_csv, is_binary_log
+from src.db import SQLiteDB
+from src.engine import OrderBookEngine
+from src.processor import TickDataProcessor
+from conftest import (active_rows, assert_same_book, csv_events, load_csv, make_engine, replay_best, sampled_best,
+                      HEADER, STREAM_MODES, SYMBOLS)
+
+
+@pytest.fixture
+def converted(tmp_path, make_csv):
+    """(CSV, журнал из него и SQLite после построчной загрузки CSV)"""
+    csv_file = make_csv(16, days=(20241001, 20241002))
+    binlog = str(tmp_path / 'events.tlog')
+    # Маленькие порции: словарь инструментов пополняется между ними
+    assert convert_csv(csv_file, binlog, batch_size=64) == len(csv_events(csv_file))
+    expected = load_csv(tmp_path / 'rows.db', csv_file)
+    yield csv_file, binlog, expected
+    expected.close()
+
+
+def test_reader_round_trip(converted):
+    csv_file, binlog, _ = converted
+    assert is_binary_log(binlog) and not is_binary_log(csv_file)
+    reader = BinaryLogReader(binlog)
+    cols = reader.columns_at(0, len(reader))
+    events = list(zip(cols['action'].tolist(), cols['order_id'].tolist(), cols['symbol'].tolist(),
+                      cols['operation'].tolist(), cols['price'].tolist(), cols['volume'].tolist(),
+                      cols['timestamp'].tolist()))
+    assert events == csv_events(csv_file)
+    deals = open(csv_file).read().splitlines()[1:]
+    for line, deal_id, deal_price in zip(deals, cols['deal_id'].tolist(), cols['deal_price'].tolist()):
+        expected_id, expected_price = line.split(',')[8:]
+        if expected_id:
+            assert (deal_id, deal_price) == (int(expected_id), float(expected_price))
+        else:
+            assert deal_id == 0 and math.isnan(deal_price)
+
+
+@pytest.mark.parametrize('batch_size', [7, 1000])
+@pytest.mark.parametrize('mode', list(STREAM_MODES))
+def test_replay_matches_csv_rows(tmp_path, converted, mode, batch_size):
+    _, binlog, expected = converted
+    engine_factory, kwargs = STREAM_MODES[mode]
+    db = SQLiteDB(str(tmp_path / f'{mode}.db'))
+    db.create_tables()
+    TickDataProcessor(db, make_engine(engine_factory)).process_binlog_file(
+        binlog, batch_size=batch_size, **kwargs)
+    try:
+        assert_same_book(db, expected)
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize('batch_size', [5, 1000000])
+def test_rebuild_active_orders(tmp_path, converted, batch_size):
+    _, binlog, expected = converted
+    db = SQLiteDB(str(tmp_path / 'rebuild.db'))
+    db.create_tables()
+    processor = TickDataProcessor(db, OrderBookEngine())
+    try:
+        assert processor.rebuild_active_orders(binlog, batch_size)['active'] == expected.get_active_orders_count()
+        assert active_rows(db) == active_rows(expected)
+        assert sorted(processor.engine.iter_orders()) == active_rows(expected)
+    finally:
+        db.close()
+
+
+def test_sample_from_binlog_matches_replay(converted):
+    csv_file, binlog, expected = converted
+    events = csv_events(csv_file)
+    timestamps = sorted({event[6] for event in events})[::37]
+    symbols = [SYMBOLS[index % len(SYMBOLS)] for index in range(len(timestamps))]
+    result = TickDataProcessor(expected).sample_best_prices(symbols, timestamps, source=binlog, batch_size=50)
+    assert [sampled_best(result, index) for index in range(len(symbols))] == [
+        replay_best(events, symbol, timestamp) for symbol, timestamp in zip(symbols, timestamps)]
+
+
+def test_empty_log(tmp_path):
+    csv_file = tmp_path / 'empty.csv'
+    csv_file.write_text(HEADER + '\n')
+    binlog = str(tmp_path / 'empty.tlog')
+    assert convert_csv(str(csv_file), binlog) == 0
+    assert len(BinaryLogReader(binlog)) == 0
+    db = SQLiteDB(str(tmp_path / 'empty.db'))
+    db.create_tables()
+    try:
+        TickDataProcessor(db).process_binlog_file(binlog)
+        assert db.get_active_orders_count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,58 @@
+import pytest
+from src.db import ColumnarDB
+from src.processor import TickDataProcessor
+from src.retention import day_range
+from conftest import assert_same_book, history_rows, load_csv, moment, summary_rows, SYMBOLS
+
+DAYS = (20241001, 20241002)
+
+
+@pytest.fixture(params=[False, True], ids=['rows', 'vectorized'])
+def loaded(request, tmp_path, make_csv):
+    """(ColumnarDB, SQLiteDB) после загрузки одного CSV за два дня"""
+    csv_file = make_csv(15, days=DAYS)
+    expected = load_csv(tmp_path / 'rows.db', csv_file)
+    db = ColumnarDB(str(tmp_path / 'columnar'), block_rows=64)
+    db.create_tables()
+    TickDataProcessor(db).process_csv_file(csv_file, batch_size=50, vectorized=request.param)
+    yield db, expected
+    db.close()
+    expected.close()
+
+
+def rows(result):
+    return [dict(row) for row in result]
+
+
+def assert_same_queries(db, expected):
+    assert_same_book(db, expected)
+    assert db.get_active_orders_count() == expected.get_active_orders_count()
+    assert db.get_active_orders_sample(5) == rows(expected.get_active_orders_sample(5))
+    assert summary_rows(db.get_symbols_summary()) == summary_rows(expected.get_symbols_summary())
+    assert db.history_days() == expected.history_days()
+    # Текущее состояние и моменты внутри обоих дней
+    for timestamp in (None, moment(DAYS[0], 5000), moment(DAYS[1], 0), moment(DAYS[1], 10000)):
+        assert db.get_all_best_prices(timestamp) == expected.get_all_best_prices(timestamp)
+        for symbol in SYMBOLS:
+            assert db.get_best_prices(symbol, timestamp) == expected.get_best_prices(symbol, timestamp)
+            assert db.get_depth(symbol, 3, timestamp) == expected.get_depth(symbol, 3, timestamp)
+    for symbol in SYMBOLS:
+        for from_ts, to_ts in (day_range(DAYS[1]), (moment(DAYS[0], 2000), moment(DAYS[1], 3000))):
+            assert history_rows(db, symbol, from_ts, to_ts) == history_rows(expected, symbol, from_ts, to_ts)
+
+
+def test_queries_match_sqlite(loaded):
+    db, expected = loaded
+    assert_same_queries(db, expected)
+
+
+def test_reopen_matches_sqlite(loaded):
+    """После close() история и активные заявки читаются из файлов заново"""
+    db, expected = loaded
+    db.close()
+    reopened = ColumnarDB(db.base_dir)
+    reopened.create_tables()
+    try:
+        assert_same_queries(reopened, expected)
+    finally:
+        reopened.close()
@@ -0,0 +1,119 @@
+import pytest
+from src.bars import BarAggregator
+from src.db import ColumnarDB, DBInterface, InstrumentedDB, SQLiteDB
+from src.db.base import OPTIONAL_METHODS
+from src.metrics import MetricsRegistry
+from src.processor import TickDataProcessor
+from conftest import load_csv
+
+
+class MemoryDB(DBInterface):
+    """Бэкенд только с обязательными методами: active_orders в словаре"""
+
+    def __init__(self):
+        self.orders = {}
+
+    def create_tables(self):
+        pass
+
+    def create_indexes(self):
+        pass
+
+    def clear_tables(self):
+        self.orders = {}
+
+    def insert_history_batch(self, batch):
+        pass
+
+    def insert_active_order(self, order_id, symbol, operation, price, volume, timestamp):
+        self.orders.setdefault(order_id, (order_id, symbol, operation, price, volume, volume, timestamp))
+
+    def process_trade(self, order_id, trade_volume):
+        order = self.orders.get(order_id)
+        if order is not None:
+            remaining = order[5] - trade_volume
+            if remaining <= 0:
+                del self.orders[order_id]
+            else:
+                self.orders[order_id] = (*order[:5], remaining, order[6])
+
+    def delete_active_order(self, order_id):
+        self.orders.pop(order_id, None)
+
+    def insert_active_orders_batch(self, orders):
+        for order in orders:
+            self.insert_active_order(*order)
+
+    def process_trades_batch(self, trades):
+        for order_id, volume in trades:
+            self.process_trade(order_id, volume)
+
+    def delete_active_orders_batch(self, order_ids):
+        for order_id in order_ids:
+            self.delete_active_order(order_id)
+
+    def apply_active_changes(self, inserts, trades, deletes):
+        self.delete_active_orders_batch(deletes)
+        for order in inserts:
+            self.orders[order[0]] = tuple(order)
+        self.process_trades_batch(trades)
+
+    def replace_active_orders(self, orders):
+        self.orders = {order[0]: tuple(order) for order in orders}
+
+    def get_active_orders_count(self):
+        return len(self.orders)
+
+    def get_active_orders(self):
+        return list(self.orders.values())
+
+    def get_active_orders_sample(self, limit=10):
+        return list(self.orders.values())[:limit]
+
+    def get_symbols_summary(self):
+        return []
+
+    def get_best_prices(self, symbol, timestamp=None):
+        return self.get_all_best_prices(timestamp).get(symbol)
+
+    def get_all_best_prices(self, timestamp=None):
+        rows = [(symbol, operation, order_id, price, remaining, order_ts)
+                for order_id, symbol, operation, price, _, remaining, order_ts in self.orders.values()]
+        return self.group_best_prices(rows, timestamp)
+
+    def get_depth(self, symbol, levels=10, timestamp=None):
+        return self.group_depth([], symbol, timestamp)
+
+    def get_history_range(self, symbol, from_ts, to_ts):
+        return []
+
+    def close(self):
+        pass
+
+
+def test_required_methods_are_enough(make_csv, tmp_path):
+    db = MemoryDB()
+    assert not any(db.supports(capability) for capability in OPTIONAL_METHODS)
+    TickDataProcessor(db, metrics=MetricsRegistry()).process_csv_file(make_csv(3), batch_size=50)
+    expected = load_csv(tmp_path / 'rows.db', make_csv(3))
+    try:
+        assert sorted(db.get_active_orders()) == sorted(map(tuple, expected.get_active_orders()))
+    finally:
+        expected.close()
+
+
+@pytest.mark.parametrize('capability', list(OPTIONAL_METHODS))
+def test_optional_methods_fail_clearly(capability):
+    db = InstrumentedDB(MemoryDB(), MetricsRegistry())
+    for name in OPTIONAL_METHODS[capability]:
+        with pytest.raises(NotImplementedError, match=f'MemoryDB does not support {capability}'):
+            getattr(db, name)(*[None] * (getattr(DBInterface, name).__code__.co_argcount - 1))
+    assert not db.supports(capability)
+
+
+def test_stage_needs_capability(tmp_path):
+    with pytest.raises(ValueError, match='MemoryDB does not support bars'):
+        TickDataProcessor(MemoryDB(), bars=BarAggregator())
+    for db in (SQLiteDB(str(tmp_path / 'all.db')), ColumnarDB(str(tmp_path / 'columnar'))):
+        assert all(db.supports(capability) for capability in OPTIONAL_METHODS)
+        db.close()
@@ -0,0 +1,82 @@
+import pytest
+from src.db import ColumnarDB, SQLiteDB
+from src.engine import OrderBookEngine
+from src.order_store import ActiveOrderStore
+from src.processor import TickDataProcessor
+from conftest import HEADER, SYMBOLS
+
+# Равные цены: заявка 5 выставлена раньше 3, заявки 7 и 4 - в один момент (в файле 7 раньше 4)
+TIES = [
+    'AAA,F,B,20241001100000000,5,1,100.00000,1,,',
+    'AAA,F,B,20241001100000001,3,1,100.00000,2,,',
+    'AAA,F,S,20241001100000002,7,1,101.00000,3,,',
+    'AAA,F,S,20241001100000002,4,1,101.00000,4,,',
+    'AAA,F,S,20241001100000003,2,1,101.00000,5,,',
+    # У BBB книга опустела целиком
+    'BBB,F,B,20241001100000004,9,1,99.00000,1,,',
+    'BBB,F,B,20241001100000005,9,0,99.00000,1,,',
+    # У CCC осталась одна сторона
+    'CCC,F,S,20241001100000006,11,1,102.00000,1,,',
+    'CCC,F,B,20241001100000006,12,1,101.00000,1,,',
+    'CCC,F,B,20241001100000007,12,2,101.00000,1,100,101.00000',
+]
+
+
+def loaded(tmp_path, csv_file, engine):
+    db = SQLiteDB(str(tmp_path / f'{type(engine).__name__}.db'))
+    db.create_tables()
+    processor = TickDataProcessor(db, engine=engine)
+    processor.process_csv_file(csv_file, batch_size=3)
+    return processor
+
+
+@pytest.fixture
+def ties_csv(tmp_path):
+    csv_file = tmp_path / 'ties.csv'
+    csv_file.write_text('\n'.join([HEADER, *TIES]) + '\n')
+    return str(csv_file)
+
+
+def test_tie_break_and_empty_books(tmp_path, ties_csv):
+    processor = loaded(tmp_path, ties_csv, OrderBookEngine())
+    engine, db = processor.engine, processor.db
+    best = db.get_all_best_prices()
+    assert sorted(best) == ['AAA', 'CCC']
+    assert best['AAA']['max_buy_price']['order_id'] == 5
+    assert best['AAA']['min_sell_price']['order_id'] == 4
+    assert best['CCC']['max_buy_price'] is None
+    assert engine.get_all_best_prices() == best
+    assert engine.best_order('AAA', 'S') == 4 and engine.best_order('BBB', 'B') is None
+    for symbol in ('AAA', 'BBB', 'CCC'):
+        assert engine.get_best_prices(symbol) == db.get_best_prices(symbol)
+    # Книга, загруженная из active_orders в другом порядке, выбирает те же заявки
+    reloaded = OrderBookEngine()
+    reloaded.load(reversed(db.get_active_orders()))
+    assert reloaded.get_all_best_prices() == best
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_best_prices_match_db(tmp_path, make_csv, seed):
+    """Движок, ActiveOrderStore, ColumnarDB и SQLite отвечают одинаково, в том числе при равных ценах"""
+    csv_file = make_csv(seed)
+    engine = loaded(tmp_path, csv_file, OrderBookEngine())
+    store = loaded(tmp_path, csv_file, ActiveOrderStore(capacity=4))
+    columnar = ColumnarDB(str(tmp_path / 'columnar'))
+    columnar.create_tables()
+    TickDataProcessor(columnar).process_csv_file(csv_file, batch_size=50)
+    db = engine.db
+    last = engine.engine.last_timestamp
+    try:
+        for timestamp in (None, last, last - 5000):
+            expected = db.get_all_best_prices(timestamp)
+            assert columnar.get_all_best_prices(timestamp) == expected
+            assert store.engine.get_all_best_prices(timestamp) == expected
+            if engine.engine.covers(timestamp):
+                assert engine.engine.get_all_best_prices(timestamp) == expected
+            for symbol in SYMBOLS:
+                assert engine.get_best_prices(symbol, timestamp) == db.get_best_prices(symbol, timestamp)
+                assert columnar.get_best_prices(symbol, timestamp) == db.get_best_prices(symbol, timestamp)
+    finally:
+        columnar.close()
+        store.db.close()
+        db.close()
@@ -0,0 +1,91 @@
+import threading
+import time
+import pytest
+from src.db import SQLiteDB
+from src.engine import OrderBookEngine
+from src.processor import TickDataProcessor
+from conftest import assert_same_book, load_csv, make_engine, STREAM_MODES
+
+FOLLOW = {'batch_size': 50, 'poll_interval': 0.01}
+
+
+@pytest.mark.parametrize('mode', list(STREAM_MODES))
+def test_resume_after_partial_line(tmp_path, make_csv, mode):
+    """Незаконченная последняя строка не загружается; повторный запуск дочитывает её с сохранённого смещения"""
+    content = open(make_csv(12)).read()
+    cut = content.index('\n', len(content) // 2) + 20
+    csv_file = tmp_path / 'grow.csv'
+    csv_file.write_text(content[:cut])
+    engine_factory, kwargs = STREAM_MODES[mode]
+    db = SQLiteDB(str(tmp_path / 'follow.db'))
+    db.create_tables()
+    TickDataProcessor(db, make_engine(engine_factory)).follow_csv_file(
+        str(csv_file), idle_timeout=0.05, **FOLLOW, **kwargs)
+    progress = db.get_ingest_progress(str(csv_file))
+    assert progress['byte_offset'] == content.rindex('\n', 0, cut) + 1
+    assert progress['processed'] == content.count('\n', 0, cut) - 1
+
+    with open(csv_file, 'a') as f:
+        f.write(content[cut:])
+    TickDataProcessor(db, make_engine(engine_factory)).follow_csv_file(
+        str(csv_file), idle_timeout=0.05, **FOLLOW, **kwargs)
+    expected = load_csv(tmp_path / 'rows.db', str(csv_file))
+    try:
+        assert db.get_ingest_progress(str(csv_file))['processed'] == content.count('\n') - 1
+        assert_same_book(db, expected)
+    finally:
+        db.close()
+        expected.close()
+
+
+def test_follow_growing_file(tmp_path, make_csv):
+    """Файл дописывается кусками с разрывами посреди строк, пока идёт слежение"""
+    content = open(make_csv(13)).read()
+    csv_file = tmp_path / 'grow.csv'
+    csv_file.write_text('')
+
+    def append():
+        with open(csv_file, 'a') as f:
+            for start in range(0, len(content), 997):
+                f.write(content[start:start + 997])
+                f.flush()
+                time.sleep(0.005)
+
+    writer = threading.Thread(target=append)
+    db = SQLiteDB(str(tmp_path / 'follow.db'))
+    db.create_tables()
+    writer.start()
+    TickDataProcessor(db, OrderBookEngine()).follow_csv_file(str(csv_file), idle_timeout=0.5, **FOLLOW)
+    writer.join()
+    expected = load_csv(tmp_path / 'rows.db', str(csv_file))
+    try:
+        assert_same_book(db, expected)
+    finally:
+        db.close()
+        expected.close()
+
+
+def test_follow_partial_header(tmp_path, make_csv):
+    """Заголовок появляется не целиком: слежение дочитывает его и загружает строки после него"""
+    content = open(make_csv(14)).read()
+    csv_file = tmp_path / 'grow.csv'
+    csv_file.write_text(content[:20])
+
+    def append():
+        time.sleep(0.2)
+        with open(csv_file, 'a') as f:
+            f.write(content[20:])
+
+    writer = threading.Thread(target=append)
+    db = SQLiteDB(str(tmp_path / 'follow.db'))
+    db.create_tables()
+    writer.start()
+    TickDataProcessor(db).follow_csv_file(str(csv_file), idle_timeout=0.6, **FOLLOW)
+    writer.join()
+    expected = load_csv(tmp_path / 'rows.db', str(csv_file))
+    try:
+        assert db.get_ingest_progress(str(csv_file))['byte_offset'] == len(content)
+        assert_same_book(db, expected)
+    finally:
+        db.close()
+        expected.close()
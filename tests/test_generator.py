@@ -0,0 +1,33 @@
+import pytest
+from src.generator import TickGenerator
+from src.processor import read_csv_chunks
+
+OPTIONS = {'symbols': 5, 'lifetime': 'pareto', 'lifetime_mean_ms': 800, 'fill_ratio': 0.5, 'volatility': 0.001,
+           'orders_per_ms': 3, 'block_orders': 500}
+
+
+def generate(tmp_path, name, events=3000, columns=10, **options):
+    path = tmp_path / name
+    TickGenerator(**{**OPTIONS, **options}).write_csv(str(path), events, columns)
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize('columns', [7, 10])
+def test_same_seed_same_file(tmp_path, columns):
+    assert generate(tmp_path, 'a.csv', columns=columns, seed=3) == generate(tmp_path, 'b.csv', columns=columns, seed=3)
+    assert generate(tmp_path, 'c.csv', columns=columns, seed=3) != generate(tmp_path, 'd.csv', columns=columns, seed=4)
+
+
+def test_options_change_output(tmp_path):
+    base = generate(tmp_path, 'base.csv', seed=1)
+    for option, value in [('fill_ratio', 0.1), ('volatility', 0.01), ('lifetime', 'lognormal'), ('orders_per_ms', 10)]:
+        assert generate(tmp_path, f'{option}.csv', seed=1, **{option: value}) != base
+
+
+def test_events_are_ordered(tmp_path):
+    path = tmp_path / 'ordered.csv'
+    TickGenerator(seed=2, **OPTIONS).write_csv(str(path), 3000)
+    chunk = next(read_csv_chunks(str(path), 10000))
+    assert len(chunk) == 3000
+    assert chunk['moment'].is_monotonic_increasing
+    assert set(chunk['action']) == {0, 1, 2}
@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import pytest
+from src.db import InstrumentedDB, SQLiteDB
+from src.metrics import MetricsRegistry, NullMetrics, get_registry, set_registry
+from src.processor import TickDataProcessor
+from conftest import csv_events
+
+
+def counter(metrics, name, **labels):
+    return sum(item['value'] for item in metrics.snapshot()['counters']
+               if item['name'] == name and labels.items() <= item['labels'].items())
+
+
+def timer(metrics, name, **labels):
+    """{метки: (число, сумма, максимум)} таймера name с метками labels"""
+    return {tuple(sorted(item['labels'].items())): (item['count'], item['sum'], item['max'])
+            for item in metrics.snapshot()['timers']
+            if item['name'] == name and labels.items() <= item['labels'].items()}
+
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    db = SQLiteDB(str(tmp_path / 'metrics.db'))
+    db.create_tables()
+    yield db
+    db.close()
+
+
+def test_registry():
+    metrics = MetricsRegistry()
+    metrics.inc('events_total', 3, stage='read')
+    metrics.inc('events_total', stage='read')
+    metrics.observe('stage_seconds', 0.5, stage='read')
+    metrics.observe('stage_seconds', 0.25, stage='read')
+    with metrics.timer('stage_seconds', stage='flush'):
+        pass
+    metrics.set_gauge('queue_depth', 5, queue='active')
+    metrics.set_gauge('queue_depth', 2, queue='active')
+    snapshot = metrics.snapshot()
+    assert snapshot['counters'] == [{'name': 'events_total', 'labels': {'stage': 'read'}, 'value': 4}]
+    assert timer(metrics, 'stage_seconds', stage='read') == {(('stage', 'read'),): (2, 0.75, 0.5)}
+    assert timer(metrics, 'stage_seconds', stage='flush')[(('stage', 'flush'),)][0] == 1
+    assert snapshot['gauges'] == [{'name': 'queue_depth', 'labels': {'queue': 'active'}, 'value': 2, 'max': 5}]
+
+    # Снимки воркеров складываются с дополнительной меткой
+    total = MetricsRegistry()
+    total.merge(snapshot, worker=0)
+    total.merge(snapshot, worker=0)
+    total.merge(snapshot, worker=1)
+    assert counter(total, 'events_total', worker=0) == 8 and counter(total, 'events_total', worker=1) == 4
+    assert timer(total, 'stage_seconds', stage='read', worker=0) == {
+        (('stage', 'read'), ('worker', 0)): (4, 1.5, 0.5)}
+    assert {item['labels']['worker']: (item['value'], item['max']) for item in total.snapshot()['gauges']} == {
+        0: (2, 5), 1: (2, 5)}
+
+    metrics.reset()
+    assert metrics.snapshot() == {'counters': [], 'timers': [], 'gauges': []}
+
+
+def test_registry_threads():
+    metrics = MetricsRegistry()
+
+    def work():
+        for _ in range(1000):
+            metrics.inc('events_total')
+            metrics.observe('stage_seconds', 0.001)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter(metrics, 'events_total') == 8000
+    assert timer(metrics, 'stage_seconds')[()][0] == 8000
+
+
+def test_prometheus(tmp_path):
+    metrics = MetricsRegistry()
+    metrics.inc('db_errors_total', method='get"x"\n')
+    metrics.observe('db_call_seconds', 0.5, method='insert')
+    metrics.set_gauge('ingest_queue_depth', 3)
+    path = str(tmp_path / 'metrics.prom')
+    metrics.write_prometheus(path)
+    lines = open(path).read().splitlines()
+    assert lines == [
+        '# TYPE tick_db_errors_total counter',
+        'tick_db_errors_total{method="get\\"x\\"\\n"} 1',
+        '# TYPE tick_db_call_seconds summary',
+        'tick_db_call_seconds_count{method="insert"} 1',
+        'tick_db_call_seconds_sum{method="insert"} 0.500000000',
+        '# TYPE tick_db_call_seconds_max gauge',
+        'tick_db_call_seconds_max{method="insert"} 0.500000000',
+        '# TYPE tick_ingest_queue_depth gauge',
+        'tick_ingest_queue_depth 3',
+        '# TYPE tick_ingest_queue_depth_max gauge',
+        'tick_ingest_queue_depth_max 3',
+    ]
+
+
+def test_instrumented_db(sqlite_db):
+    metrics = MetricsRegistry()
+    db = InstrumentedDB(sqlite_db, metrics)
+    with db.batch():
+        with db.batch():
+            db.insert_active_order(1, 'AAA', 'B', 100.0, 5, 20241001100000000)
+        db.insert_active_order(2, 'AAA', 'S', 101.0, 5, 20241001100000001)
+    assert db.get_active_orders_count() == 2
+    with pytest.raises(TypeError):
+        db.insert_active_order(3)
+    labels = {'backend': 'SQLiteDB'}
+    calls = {dict(key)['method']: count for key, (count, _, _) in timer(metrics, 'db_call_seconds', **labels).items()}
+    assert calls == {'insert_active_order': 3, 'get_active_orders_count': 1}
+    assert counter(metrics, 'db_errors_total', method='insert_active_order', **labels) == 1
+    # Вложенная транзакция учитывается один раз, вместе с внешней
+    assert timer(metrics, 'db_batch_seconds')[(('backend', 'SQLiteDB'),)][0] == 1
+    # Обёртка кэшируется, прочие атрибуты передаются как есть
+    assert db.insert_active_order is db.insert_active_order
+    assert db.insert_active_order.__name__ == 'insert_active_order'
+    assert db.db_path == sqlite_db.db_path and db.supports('checkpoints')
+
+
+def test_instrumented_async_methods():
+    class AsyncDB:
+        async def apply_events(self, events):
+            if not events:
+                raise ValueError('no events')
+            return len(events)
+
+        async def helper(self):
+            return 'plain'
+
+    metrics = MetricsRegistry()
+    db = InstrumentedDB(AsyncDB(), metrics)
+
+    async def run():
+        assert await db.apply_events([1, 2]) == 2
+        with pytest.raises(ValueError):
+            await db.apply_events([])
+        assert await db.helper() == 'plain'
+
+    asyncio.run(run())
+    # Учитываются только методы DBInterface и apply_events
+    assert [(key, count) for key, (count, _, _) in timer(metrics, 'db_call_seconds').items()] == [
+        ((('backend', 'AsyncDB'), ('method', 'apply_events')), 2)]
+    assert counter(metrics, 'db_errors_total', method='apply_events') == 1
+
+
+@pytest.mark.parametrize('vectorized', [False, True])
+def test_processor_metrics(sqlite_db, make_csv, vectorized):
+    csv_file = make_csv(40)
+    metrics = MetricsRegistry()
+    processor = TickDataProcessor(sqlite_db, metrics=metrics)
+    assert isinstance(processor.db, InstrumentedDB)
+    processor.process_csv_file(csv_file, batch_size=50, vectorized=vectorized)
+    events = len(csv_events(csv_file))
+    assert counter(metrics, 'ingest_events_total') == events
+    assert counter(metrics, 'ingest_chunks_total') == -(-events // 50)
+    stages = {dict(key)['stage'] for key in timer(metrics, 'ingest_stage_seconds')}
+    assert {'read', 'state', 'history'} <= stages
+    assert timer(metrics, 'db_call_seconds', method='insert_history_batch')
+    assert timer(metrics, 'db_batch_seconds')
+
+
+def test_null_and_process_registry(sqlite_db):
+    # NullMetrics отключает учёт: БД не оборачивается
+    assert TickDataProcessor(sqlite_db, metrics=NullMetrics()).db is sqlite_db
+    previous = get_registry()
+    registry = MetricsRegistry()
+    set_registry(registry)
+    try:
+        processor = TickDataProcessor(sqlite_db)
+        assert processor.metrics is registry
+        processor.db.get_active_orders_count()
+        assert timer(registry, 'db_call_seconds', method='get_active_orders_count')
+        set_registry(NullMetrics())
+        assert TickDataProcessor(sqlite_db).db is sqlite_db
+    finally:
+        set_registry(previous)
@@ -0,0 +1,68 @@
+import pytest
+from src.db import SQLiteDB
+from src.engine import OrderBookEngine
+from src.metrics import MetricsRegistry
+from src.parallel import ParallelIngestor, SQLitePartitions, symbol_partition
+from conftest import active_rows, assert_same_book, csv_events, load_csv, SYMBOLS
+
+# При трёх воркерах AAA попадает в партицию 1, BBB и CCC - в 0, партиция 2 пустая
+WORKERS = 3
+
+
+@pytest.fixture
+def expected(tmp_path, make_csv):
+    """(CSV за два дня, SQLite после построчной загрузки)"""
+    csv_file = make_csv(50, days=(20241001, 20241002))
+    db = load_csv(tmp_path / 'rows.db', csv_file)
+    yield csv_file, db
+    db.close()
+
+
+@pytest.mark.parametrize('compact', [False, True], ids=['plain', 'compact'])
+@pytest.mark.parametrize('engine_factory', [None, OrderBookEngine], ids=['rows', 'engine'])
+def test_parallel_merge_matches_rows(tmp_path, expected, engine_factory, compact):
+    csv_file, rows_db = expected
+    partitions = SQLitePartitions(str(tmp_path / 'part{partition}.db'), compact=compact)
+    metrics = MetricsRegistry()
+    ingestor = ParallelIngestor(partitions, workers=WORKERS, engine_factory=engine_factory, metrics=metrics)
+    report = ingestor.process_csv_file(csv_file, batch_size=50)
+    events = csv_events(csv_file)
+    assert report['processed'] == len(events)
+    by_partition = {worker['partition']: worker['processed'] for worker in report['workers']}
+    assert by_partition == {
+        partition: sum(symbol_partition(event[2], WORKERS) == partition for event in events)
+        for partition in range(WORKERS)}
+    assert {item['labels']['worker'] for item in metrics.snapshot()['counters']
+            if item['name'] == 'ingest_events_total'} == {0, 1}
+
+    # В файле партиции только её инструменты
+    for partition in range(WORKERS):
+        db = SQLiteDB(partitions.path(partition), compact=compact)
+        try:
+            assert {row[1] for row in active_rows(db)} <= {
+                symbol for symbol in SYMBOLS if symbol_partition(symbol, WORKERS) == partition}
+        finally:
+            db.close()
+
+    # Повторное слияние в ту же БД заменяет её содержимое
+    partitions.merge(str(tmp_path / 'merged.db'), WORKERS).close()
+    merged = partitions.merge(str(tmp_path / 'merged.db'), WORKERS)
+    try:
+        assert_same_book(merged, rows_db)
+    finally:
+        merged.close()
+
+
+def test_parallel_limit(tmp_path, expected):
+    csv_file, _ = expected
+    partitions = SQLitePartitions(str(tmp_path / 'part{partition}.db'))
+    report = ParallelIngestor(partitions, workers=WORKERS, metrics=MetricsRegistry()).process_csv_file(
+        csv_file, limit=120, batch_size=50)
+    assert report['processed'] == sum(worker['processed'] for worker in report['workers']) == 120
+    expected_db = load_csv(tmp_path / 'limit.db', csv_file, limit=120)
+    merged = partitions.merge(str(tmp_path / 'merged.db'), WORKERS)
+    try:
+        assert_same_book(merged, expected_db)
+    finally:
+        merged.close()
+        expected_db.close()
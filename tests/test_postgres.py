@@ -0,0 +1,58 @@
+import pytest
+from src.db import PostgresDB
+from src.db.postgres import format_copy_row
+from src.engine import OrderBookEngine
+from src.order_store import ActiveOrderStore
+from src.processor import TickDataProcessor
+from conftest import assert_same_book, history_rows, load_csv, SYMBOLS
+
+DAYS = (20241001, 20241002)
+
+
+def test_format_copy_row_escapes():
+    row = ['a\tb', 'c\\d', 'e\nf\rg', None, float('nan'), 1.5, 7, '']
+    line = format_copy_row(row)
+    assert line == 'a\\tb\tc\\\\d\te\\nf\\rg\t\\N\tnan\t1.5\t7\t\n'
+    # Разделители внутри значений экранированы: полей столько же, сколько значений
+    assert len(line[:-1].split('\t')) == len(row)
+
+
+@pytest.fixture
+def expected(tmp_path, make_csv):
+    """(CSV за два дня, SQLite после построчной загрузки)"""
+    csv_file = make_csv(20, days=DAYS)
+    db = load_csv(tmp_path / 'rows.db', csv_file)
+    yield csv_file, db
+    db.close()
+
+
+@pytest.mark.parametrize('compact', [False, True], ids=['plain', 'compact'])
+@pytest.mark.parametrize('use_copy', [True, False], ids=['copy', 'insert'])
+def test_copy_matches_rows(pg_params, expected, use_copy, compact):
+    csv_file, rows_db = expected
+    # Маленькие порции COPY: буфер собирается несколько раз за вызов
+    db = PostgresDB(**pg_params, use_copy=use_copy, copy_batch_size=7, compact=compact)
+    db.create_tables()
+    try:
+        TickDataProcessor(db).process_csv_file(csv_file, batch_size=50, vectorized=True)
+        assert_same_book(db, rows_db)
+        db.clear_tables()
+        assert db.get_active_orders_count() == 0 and history_rows(db, SYMBOLS[0]) == []
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize('engine', [
+    lambda: OrderBookEngine(flush_every=100, flush_mode='snapshot'),
+    lambda: ActiveOrderStore(capacity=4, flush_every=100),
+], ids=['engine', 'store'])
+@pytest.mark.parametrize('use_copy', [True, False], ids=['copy', 'insert'])
+def test_snapshot_replaces_active_orders(pg_params, expected, engine, use_copy):
+    csv_file, rows_db = expected
+    db = PostgresDB(**pg_params, use_copy=use_copy)
+    db.create_tables()
+    try:
+        TickDataProcessor(db, engine()).process_csv_file(csv_file, batch_size=50)
+        assert_same_book(db, rows_db)
+    finally:
+        db.close()
@@ -0,0 +1,175 @@
+import asyncio
+import types
+import pytest
+from src.db import SQLiteDB
+from src.processor import TickDataProcessor
+from src.queries import INSERT_HISTORY, PARTITION_LOCK, TABLE_KIND
+from conftest import active_rows
+
+psycopg = pytest.importorskip('psycopg')
+from src.async_ingest import AsyncIngestor
+from src.db.postgres import PostgresSchema
+from src.db.postgres_async import AsyncPostgresDB
+
+IDLE, INERROR = psycopg.pq.TransactionStatus.IDLE, psycopg.pq.TransactionStatus.INERROR
+
+
+class FakeConnection:
+    """Подключение для проверки пула без сервера: rollback_error - ошибка отката"""
+
+    def __init__(self, rollback_error=None):
+        self.closed = False
+        self.info = types.SimpleNamespace(transaction_status=IDLE)
+        self.rollback_error = rollback_error
+
+    async def rollback(self):
+        if self.rollback_error is not None:
+            self.info.transaction_status = INERROR
+            raise self.rollback_error
+        self.info.transaction_status = IDLE
+
+    async def close(self):
+        self.closed = True
+
+
+class RecordingConnection(FakeConnection):
+    """Подключение, которое запоминает запросы; TABLE_KIND отвечает «секционирована»"""
+
+    def __init__(self):
+        super().__init__()
+        self.statements = []
+
+    def cursor(self):
+        return RecordingCursor(self.statements)
+
+    async def commit(self):
+        pass
+
+
+class RecordingCursor:
+    def __init__(self, statements):
+        self.statements = statements
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        pass
+
+    async def execute(self, statement, params=None):
+        self.statements.append(statement)
+
+    async def executemany(self, statement, rows):
+        self.statements.append(statement)
+
+    async def fetchone(self):
+        return ('p',)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """AsyncPostgresDB, у которого новые подключения - FakeConnection из списка connections"""
+    connections = []
+
+    async def connect(**params):
+        return connections.pop(0)
+
+    monkeypatch.setattr(psycopg.AsyncConnection, 'connect', connect)
+    return AsyncPostgresDB(max_conn=2), connections
+
+
+def test_connection_reused(pool):
+    db, connections = pool
+    conn = FakeConnection()
+    connections.append(conn)
+
+    async def use():
+        async with db.connection() as first:
+            pass
+        async with db.connection() as second:
+            return first, second
+
+    assert asyncio.run(use()) == (conn, conn)
+    assert db._idle == [conn] and not conn.closed
+
+
+def test_connection_reused_after_rollback(pool):
+    db, connections = pool
+    conn = FakeConnection()
+    connections.append(conn)
+
+    async def fail():
+        async with db.connection() as used:
+            used.info.transaction_status = INERROR
+            raise ValueError('query failed')
+
+    with pytest.raises(ValueError):
+        asyncio.run(fail())
+    assert db._idle == [conn] and not conn.closed
+
+
+def test_broken_connection_closed(pool):
+    """Откат не удался: исходная ошибка не теряется, подключение закрывается и в пул не возвращается"""
+    db, connections = pool
+    conn = FakeConnection(rollback_error=psycopg.OperationalError('server closed the connection'))
+    connections.append(conn)
+
+    async def fail():
+        async with db.connection() as used:
+            used.info.transaction_status = INERROR
+            raise ValueError('query failed')
+
+    with pytest.raises(ValueError, match='query failed'):
+        asyncio.run(fail())
+    assert db._idle == [] and conn.closed
+
+
+def test_schema_shared_with_postgres_db(pool):
+    """DDL, секции по дням и TRUNCATE берутся из PostgresSchema, общей с PostgresDB"""
+    _, connections = pool
+    db = AsyncPostgresDB(max_conn=1, use_copy=False, partition_by='day', symbol_partitions=2)
+    schema = PostgresSchema(partition_by='day', symbol_partitions=2)
+    conn = RecordingConnection()
+    connections.append(conn)
+    row = ('AAA', 'B', 20241001100000000, 1, 1, 100.0, 1)
+
+    async def run():
+        await db.create_tables()
+        await db.insert_history_batch([row, (*row[:2], 20241002100000000, *row[3:])])
+        await db.insert_history_batch([row])
+        await db.clear_tables()
+
+    asyncio.run(run())
+    partitions = schema.day_partition_statements(20241001) + schema.day_partition_statements(20241002)
+    assert conn.statements == [
+        *schema.table_statements(), TABLE_KIND, *schema.partition_statements(),
+        PARTITION_LOCK, *partitions, INSERT_HISTORY,
+        INSERT_HISTORY,
+        schema.truncate_statement(),
+    ]
+    assert any('bars' in statement for statement in schema.table_statements())
+
+
+@pytest.mark.parametrize('coalesce', [False, True])
+def test_pipeline_matches_rows(tmp_path, make_csv, pg_params, coalesce):
+    """Конвейер apply_events и apply_active_changes совпадает с построчной загрузкой в SQLite"""
+    csv_file = make_csv(7)
+
+    async def create_tables():
+        setup = AsyncPostgresDB(**pg_params)
+        await setup.create_tables()
+        await setup.close()
+
+    asyncio.run(create_tables())
+    AsyncIngestor(AsyncPostgresDB(**pg_params), coalesce=coalesce).run(csv_file, batch_size=50)
+    expected = SQLiteDB(str(tmp_path / 'rows.db'))
+    expected.create_tables()
+    TickDataProcessor(expected).process_csv_file(csv_file, batch_size=50)
+    with psycopg.connect(**AsyncPostgresDB(**pg_params).connection_params) as conn, conn.cursor() as cursor:
+        cursor.execute('SELECT order_id, symbol, operation, price, original_volume, remaining_volume, timestamp '
+                       'FROM active_orders')
+        rows = cursor.fetchall()
+    try:
+        assert active_rows(types.SimpleNamespace(get_active_orders=lambda: rows)) == active_rows(expected)
+    finally:
+        expected.close()
@@ -0,0 +1,123 @@
+import datetime
+import threading
+import pytest
+from src.db import PostgresDB
+from src.db.postgres import DAY_PARTITION_NAME, PostgresSchema
+from src.encoding import moments_to_ns
+from src.processor import TickDataProcessor
+from src.queries import PARTITION_LOCK
+from conftest import assert_same_book, history_rows, load_csv, moment
+
+DAYS = (20241001, 20241002)
+
+
+@pytest.fixture
+def expected(tmp_path, make_csv):
+    """(CSV за два дня, SQLite после построчной загрузки)"""
+    csv_file = make_csv(20, days=DAYS)
+    db = load_csv(tmp_path / 'rows.db', csv_file)
+    yield csv_file, db
+    db.close()
+
+
+def test_day_partition_names_and_bounds():
+    schema = PostgresSchema(partition_by='day')
+    assert schema.day_partition_name(20241001) == 'order_history_d20241001'
+    assert DAY_PARTITION_NAME.search(schema.day_partition_name(20241001)).group(1) == '20241001'
+    assert DAY_PARTITION_NAME.search(f'{schema.day_partition_name(20241001)}_h0') is None
+    assert schema.day_bounds(20241001) == (20241001000000000, 20241002000000000)
+    assert schema.day_bounds(20241231) == (20241231000000000, 20250101000000000)
+    # Не даты: секции нет, строки попадут в секцию по умолчанию
+    for day in (20241301, 20240230, 20241000, 99991231):
+        assert schema.day_bounds(day) is None
+        assert schema.day_partition_statements(day) == []
+    compact = PostgresSchema(compact=True, partition_by='day')
+    assert compact.day_partition_name(20241001) == 'order_history_v2_d20241001'
+    start, end = compact.day_bounds(20241001)
+    assert start == int(moments_to_ns(20241001000000000)) and end - start == 86400 * 10 ** 9
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_day_bounds_are_contiguous(compact):
+    """Секции соседних дней стыкуются без зазоров, в том числе на границах месяцев и годов"""
+    schema = PostgresSchema(compact=compact, partition_by='day')
+    day = datetime.date(2024, 2, 25)
+    previous_end = None
+    for _ in range(400):
+        start, end = schema.day_bounds(int(day.strftime('%Y%m%d')))
+        assert start < end and previous_end in (None, start)
+        previous_end = end
+        day += datetime.timedelta(days=1)
+
+
+def test_partition_statements():
+    schema = PostgresSchema(partition_by='day', symbol_partitions=2)
+    day, hash0, hash1 = schema.day_partition_statements(20241001)
+    assert 'order_history_d20241001 PARTITION OF order_history' in day and 'PARTITION BY HASH (symbol)' in day
+    assert 'order_history_d20241001_h0 PARTITION OF order_history_d20241001' in hash0
+    assert 'MODULUS 2, REMAINDER 1' in hash1
+    compact = PostgresSchema(compact=True, partition_by='day', symbol_partitions=2)
+    assert 'PARTITION BY HASH (symbol_id)' in compact.day_partition_statements(20241001)[0]
+    assert 'symbols' in compact.truncate_statement() and 'symbols' not in schema.truncate_statement()
+    with pytest.raises(ValueError, match='Unknown partition mode'):
+        PostgresSchema(partition_by='month')
+
+
+@pytest.mark.parametrize('compact', [False, True], ids=['plain', 'compact'])
+def test_day_partitions(pg_params, expected, compact):
+    csv_file, rows_db = expected
+    db = PostgresDB(**pg_params, partition_by='day', symbol_partitions=2, compact=compact)
+    db.create_tables()
+    try:
+        TickDataProcessor(db).process_csv_file(csv_file, batch_size=50, vectorized=True)
+        assert db.history_partitions() == list(DAYS) and db.history_days() == list(DAYS)
+        assert_same_book(db, rows_db)
+        if not compact:
+            # Метка вне календаря (в наносекунды не переводится) попадает в секцию по умолчанию
+            outside = ('AAA', 'B', 20241399100000000, 1, 1, 100.0, 1)
+            db.insert_history_batch([outside])
+            assert history_rows(db, 'AAA', outside[2], outside[2]) == [outside]
+            assert db.history_partitions() == list(DAYS)
+        assert db.drop_history_before(DAYS[1]) == [DAYS[0]]
+        assert db.history_partitions() == [DAYS[1]]
+        assert history_rows(db, 'AAA', 0, moment(DAYS[1], 0) - 1) == []
+    finally:
+        db.close()
+
+
+def test_partitioned_over_plain_table_fails(pg_params):
+    plain = PostgresDB(**pg_params)
+    plain.create_tables()
+    plain.close()
+    db = PostgresDB(**pg_params, partition_by='day')
+    try:
+        with pytest.raises(RuntimeError, match='not partitioned'):
+            db.create_tables()
+    finally:
+        db.close()
+
+
+def test_partition_lock_serializes_ddl(pg_params):
+    """Секция дня создаётся только после того, как другая транзакция отпустит advisory lock таблицы"""
+    psycopg2 = pytest.importorskip('psycopg2')
+    db = PostgresDB(**pg_params, partition_by='day')
+    db.create_tables()
+    holder = psycopg2.connect(**pg_params)
+    done = threading.Event()
+
+    def insert():
+        db.insert_history_batch([('AAA', 'B', moment(DAYS[0], 0), 1, 1, 100.0, 1)])
+        done.set()
+
+    try:
+        with holder.cursor() as cursor:
+            cursor.execute(PARTITION_LOCK, (db.history_table,))
+        worker = threading.Thread(target=insert)
+        worker.start()
+        assert not done.wait(0.5)
+        holder.commit()
+        worker.join(10)
+        assert done.is_set() and db.history_partitions() == [DAYS[0]]
+    finally:
+        holder.close()
+        db.close()
@@ -0,0 +1,82 @@
+import sqlite3
+import pytest
+from src.db import ColumnarDB, SQLiteDB
+from src.processor import TickDataProcessor
+from src.retention import RetentionPolicy, day_range
+from conftest import active_rows, history_rows, load_csv, SYMBOLS
+
+DAYS = (20241001, 20241002, 20241003)
+
+
+def history(db, days):
+    return {symbol: [row for day in days for row in history_rows(db, symbol, *day_range(day))] for symbol in SYMBOLS}
+
+
+@pytest.mark.parametrize('options', [{}, {'compact': True}, {'shard_by': 'day'}], ids=['plain', 'compact', 'shards'])
+def test_retention_archives_old_days(tmp_path, make_csv, options):
+    csv_file = make_csv(8, days=DAYS)
+    expected = load_csv(tmp_path / 'rows.db', csv_file)
+    db = SQLiteDB(str(tmp_path / 'hot.db'), **options)
+    db.create_tables()
+    TickDataProcessor(db).process_csv_file(csv_file, batch_size=50)
+    archive = ColumnarDB(str(tmp_path / 'archive'))
+    archive.create_tables()
+    try:
+        assert RetentionPolicy(1, archive).apply(db) == {'archived': list(DAYS[:2]), 'dropped': list(DAYS[:2])}
+        assert db.history_days() == list(DAYS[2:])
+        assert archive.history_days() == list(DAYS[:2])
+        assert history(db, DAYS) == history(expected, DAYS[2:])
+        assert history(archive, DAYS) == history(expected, DAYS[:2])
+        # Активные заявки retention не трогает
+        assert active_rows(db) == active_rows(expected)
+        assert RetentionPolicy(1, archive).apply(db) == {'archived': [], 'dropped': []}
+    finally:
+        archive.close()
+        db.close()
+        expected.close()
+
+
+def test_clear_tables_recreates_owned_file(tmp_path, make_csv):
+    """Файл, созданный SQLiteDB, пересоздаётся с прежними индексами"""
+    path = str(tmp_path / 'owned.db')
+    db = SQLiteDB(path)
+    db.create_tables()
+    TickDataProcessor(db).process_csv_file(make_csv(9), batch_size=50)
+    db.create_indexes()
+    indexes = [sql for sql, in db.get_connection().execute("SELECT sql FROM sqlite_master WHERE type = 'index'")]
+    db.clear_tables()
+    try:
+        # Пересозданный файл без свободных страниц (после DELETE они бы остались)
+        assert db.get_connection().execute('PRAGMA freelist_count').fetchone()[0] == 0
+        assert db.get_active_orders_count() == 0
+        assert [sql for sql, in db.get_connection().execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index'")] == indexes
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize('foreign', ['created_before', 'added_after'])
+def test_clear_tables_keeps_foreign_tables(tmp_path, make_csv, foreign):
+    """Чужая таблица в файле: только DELETE из своих таблиц"""
+    path = str(tmp_path / 'shared.db')
+    if foreign == 'created_before':
+        with sqlite3.connect(path) as conn:
+            conn.execute('CREATE TABLE notes (text TEXT)')
+    db = SQLiteDB(path)
+    db.create_tables()
+    if foreign == 'added_after':
+        db.get_connection().execute('CREATE TABLE notes (text TEXT)')
+    db.get_connection().execute("INSERT INTO notes VALUES ('keep')")
+    db.get_connection().commit()
+    TickDataProcessor(db).process_csv_file(make_csv(9), batch_size=50)
+    reader = sqlite3.connect(path)
+    db.clear_tables()
+    try:
+        assert db.get_active_orders_count() == 0
+        assert history_rows(db, 'AAA') == []
+        assert [tuple(row) for row in db.get_connection().execute('SELECT text FROM notes')] == [('keep',)]
+        assert db.get_connection().execute('PRAGMA freelist_count').fetchone()[0] > 0
+        assert reader.execute('SELECT COUNT(*) FROM active_orders').fetchone()[0] == 0
+    finally:
+        reader.close()
+        db.close()
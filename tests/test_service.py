@@ -0,0 +1,99 @@
+import logging
+import threading
+import pytest
+from src.db import SQLiteDB
+from src.engine import OrderBookEngine
+from src.processor import TickDataProcessor
+from src.service import QueryClient, QueryError, QueryService
+from conftest import summary_rows, SYMBOLS
+
+
+@pytest.fixture
+def served(tmp_path, make_csv):
+    """Сервис после загрузки CSV с движком: (processor, клиент)"""
+    db = SQLiteDB(str(tmp_path / 'service.db'), concurrent_reads=True)
+    db.create_tables()
+    processor = TickDataProcessor(db, engine=OrderBookEngine())
+    processor.process_csv_file(make_csv(5), batch_size=100, vectorized=True)
+    service = QueryService(processor, port=0)
+    host, port = service.start()
+    client = QueryClient(host, port)
+    yield processor, client
+    client.close()
+    service.stop()
+    db.close()
+
+
+def rows(result):
+    return [dict(row) for row in result]
+
+
+def test_memory_matches_db(served):
+    processor, client = served
+    db = processor.db
+    assert client.get_status()['in_memory']
+    for symbol in SYMBOLS:
+        assert client.get_best_prices(symbol) == db.get_best_prices(symbol)
+        assert client.get_depth(symbol, 3) == db.get_depth(symbol, 3)
+    assert client.get_all_best_prices() == db.get_all_best_prices()
+    assert client.get_active_orders_count() == db.get_active_orders_count()
+    assert client.get_active_orders_sample(5) == rows(db.get_active_orders_sample(5))
+    assert summary_rows(client.get_symbols_summary()) == summary_rows(db.get_symbols_summary())
+
+
+def test_past_timestamp_from_db(served):
+    """Момент раньше последнего события движок не покрывает: ответ из БД"""
+    processor, client = served
+    timestamp = processor.engine.last_timestamp - 10000
+    for symbol in SYMBOLS:
+        assert client.get_best_prices(symbol, timestamp) == processor.db.get_best_prices(symbol, timestamp)
+        assert client.get_depth(symbol, 5, timestamp) == processor.db.get_depth(symbol, 5, timestamp)
+
+
+def test_batch(served):
+    processor, client = served
+    best, count = client.batch([('get_best_prices', {'symbol': 'AAA'}), ('get_active_orders_count', {})])
+    assert best == processor.db.get_best_prices('AAA')
+    assert count == processor.db.get_active_orders_count()
+    with pytest.raises(QueryError, match='Unknown method'):
+        client.batch([('get_status', {}), ('no_such_method', {})])
+
+
+def test_snapshot_does_not_block_loop(served):
+    """Пока загрузка держит processor.lock, другие подключения обслуживаются; после - ответ по новому состоянию"""
+    processor, client = served
+    host, port = client._socket.getpeername()
+    results = []
+
+    def query():
+        with QueryClient(host, port) as other:
+            results.append(other.get_depth('BBB', 2))
+
+    with processor.updating_state():
+        waiting = threading.Thread(target=query)
+        waiting.start()
+        waiting.join(0.2)
+        assert waiting.is_alive()
+        assert client.get_status()['in_memory']
+    waiting.join(5)
+    assert results == [processor.db.get_depth('BBB', 2)]
+    # Снимок есть: под блокировкой отвечает он, не дожидаясь порции
+    with processor.updating_state():
+        assert client.get_depth('BBB', 2) == results[0]
+
+
+def test_stop_closes_connections(tmp_path, make_csv, caplog):
+    db = SQLiteDB(str(tmp_path / 'stop.db'), concurrent_reads=True)
+    db.create_tables()
+    processor = TickDataProcessor(db, engine=OrderBookEngine())
+    processor.process_csv_file(make_csv(6), batch_size=100)
+    service = QueryService(processor, port=0)
+    host, port = service.start()
+    idle = QueryClient(host, port)
+    idle.get_status()
+    with caplog.at_level(logging.DEBUG):
+        service.stop()
+    assert idle._file.readline() == b''
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    idle.close()
+    db.close()
@@ -0,0 +1,148 @@
+import bz2
+import gzip
+import io
+import lzma
+import pytest
+from src.db import SQLiteDB
+from src.metrics import MetricsRegistry
+from src.parallel import DailyIngestor, SQLitePartitions
+from src.sources import (BackgroundReader, expand_sources, group_sources_by_day, open_source, sniff_compression,
+                         source_day)
+from conftest import assert_same_book, event_lines, load_csv, HEADER
+
+DAYS = (20241001, 20241002)
+COMPRESSORS = {'gzip': gzip.compress, 'xz': lzma.compress, 'bz2': bz2.compress}
+
+
+def write_source(path, lines, compression=None):
+    data = (HEADER + '\n' + '\n'.join(lines) + '\n').encode()
+    path.write_bytes(COMPRESSORS[compression](data) if compression else data)
+    return str(path)
+
+
+def day_lines(seed, day):
+    return event_lines(seed, events=300, days=(day,))
+
+
+def source_lines(path):
+    with open_source(path, background=False) as stream:
+        return stream.read().decode().splitlines()[1:]
+
+
+@pytest.mark.parametrize('background', [True, False])
+@pytest.mark.parametrize('compression', list(COMPRESSORS))
+def test_compressed_matches_plain(tmp_path, compression, background):
+    lines = event_lines(30, days=DAYS)
+    plain = write_source(tmp_path / 'plain.csv', lines)
+    packed = write_source(tmp_path / f'packed.csv.{compression}', lines, compression)
+    assert sniff_compression(packed) == compression and sniff_compression(plain) is None
+    # Маленький блок: BackgroundReader отдаёт файл по частям
+    with open_source(packed, block_size=256, background=background) as stream:
+        assert stream.read() == open(plain, 'rb').read()
+    expected = load_csv(tmp_path / 'plain.db', plain)
+    db = load_csv(tmp_path / 'packed.db', packed, vectorized=True)
+    try:
+        assert_same_book(db, expected)
+    finally:
+        db.close()
+        expected.close()
+
+
+def test_zstd_matches_plain(tmp_path):
+    zstandard = pytest.importorskip('zstandard')
+    lines = event_lines(31)
+    plain = write_source(tmp_path / 'plain.csv', lines)
+    packed = tmp_path / 'packed.csv.zst'
+    packed.write_bytes(zstandard.ZstdCompressor().compress(open(plain, 'rb').read()))
+    assert sniff_compression(str(packed)) == 'zstd'
+    with open_source(str(packed), block_size=256) as stream:
+        assert stream.read() == open(plain, 'rb').read()
+
+
+def test_background_reader_propagates_errors():
+    class Failing(io.RawIOBase):
+        def readable(self):
+            return True
+
+        def read(self, size=-1):
+            raise OSError('broken archive')
+
+    reader = BackgroundReader(Failing(), block_size=16)
+    with pytest.raises(OSError, match='broken archive'):
+        reader.read(16)
+    reader.close()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Каталог архива: 20241001 в двух файлах (второй сжат), 20241002 в одном файле xz и скрытый файл"""
+    directory = tmp_path / 'archive'
+    directory.mkdir()
+    first = day_lines(32, DAYS[0])
+    paths = [
+        write_source(directory / f'{DAYS[0]}_1.csv', first[:150]),
+        write_source(directory / f'{DAYS[0]}_2.csv.gz', first[150:], 'gzip'),
+        write_source(directory / f'{DAYS[1]}.csv.xz', day_lines(33, DAYS[1]), 'xz'),
+    ]
+    (directory / '.partial.csv').write_text('garbage')
+    return directory, paths
+
+
+def test_expand_sources(tmp_path, archive):
+    directory, paths = archive
+    assert expand_sources(str(directory)) == paths
+    assert expand_sources(str(directory / '2024*.csv*')) == paths
+    assert expand_sources([paths[2], str(directory / f'{DAYS[0]}_*')]) == [paths[2], *paths[:2]]
+    assert expand_sources(paths[0]) == [paths[0]]
+    empty = tmp_path / 'empty'
+    empty.mkdir()
+    for source in (str(empty), str(directory / '*.parquet')):
+        with pytest.raises(FileNotFoundError, match='No input files'):
+            expand_sources(source)
+
+
+def test_group_sources_by_day(archive):
+    _, paths = archive
+    assert source_day(paths[1]) == str(DAYS[0]) and source_day('/x/events.csv') == 'events.csv'
+    # Восемь цифр внутри длинного числа - не дата
+    assert source_day('/x/run_2024100112.csv') == 'run_2024100112.csv'
+    assert group_sources_by_day(paths) == {str(DAYS[0]): paths[:2], str(DAYS[1]): paths[2:]}
+
+
+def test_directory_matches_concatenated_file(tmp_path, archive):
+    """Каталог загружается как один файл из строк всех его файлов по порядку"""
+    directory, paths = archive
+    lines = [line for path in paths for line in source_lines(path)]
+    expected = load_csv(tmp_path / 'joined.db', write_source(tmp_path / 'joined.csv', lines))
+    db = load_csv(tmp_path / 'archive.db', str(directory), batch_size=7)
+    try:
+        assert_same_book(db, expected)
+    finally:
+        db.close()
+        expected.close()
+
+
+def test_daily_ingestor(tmp_path, archive):
+    directory, paths = archive
+    partitions = SQLitePartitions(str(tmp_path / 'day.{partition}.db'))
+    metrics = MetricsRegistry()
+    report = DailyIngestor(partitions, workers=2, metrics=metrics).process_sources(str(directory), batch_size=50)
+    assert [(day['day'], day['files']) for day in report['days']] == [(str(DAYS[0]), 2), (str(DAYS[1]), 1)]
+    assert report['processed'] == sum(day['processed'] for day in report['days']) == 600
+    # Каждый день начинается с пустой книги и совпадает с отдельной загрузкой своих файлов
+    for day, files in ((DAYS[0], paths[:2]), (DAYS[1], paths[2:])):
+        expected = load_csv(tmp_path / f'expected{day}.db', files)
+        db = SQLiteDB(partitions.path(str(day)))
+        try:
+            assert_same_book(db, expected)
+        finally:
+            db.close()
+            expected.close()
+    events = {item['labels']['day']: item['value'] for item in metrics.snapshot()['counters']
+              if item['name'] == 'ingest_events_total'}
+    assert events == {str(DAYS[0]): 300, str(DAYS[1]): 300}
+
+
+def test_daily_ingestor_without_days(tmp_path):
+    report = DailyIngestor(SQLitePartitions(str(tmp_path / 'day.{partition}.db'))).process_sources([])
+    assert report['processed'] == 0 and report['days'] == []
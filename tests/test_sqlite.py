@@ -0,0 +1,26 @@
+import pytest
+from src.db import SQLiteDB
+from conftest import history_rows, moment
+
+
+def event(symbol, order_id, ms):
+    return (symbol, 'B', moment(20241001, ms), order_id, 1, 100.0, 1)
+
+
+@pytest.mark.parametrize('options', [{'compact': True}, {'compact': True, 'shard_by': 'day'}], ids=['compact', 'shards'])
+def test_rollback_resets_compact_caches(tmp_path, options):
+    """После откаченной порции новые инструменты и id истории берутся из БД, а не из кеша"""
+    db = SQLiteDB(str(tmp_path / 'compact.db'), **options)
+    db.create_tables()
+    try:
+        db.insert_history_batch([event('AAA', 1, 0)])
+        with pytest.raises(RuntimeError):
+            with db.batch():
+                db.insert_history_batch([event('BBB', 2, 1), event('AAA', 3, 2)])
+                raise RuntimeError('failed chunk')
+        assert 'BBB' not in db.symbol_ids
+        db.insert_history_batch([event('BBB', 4, 3), event('AAA', 5, 4)])
+        assert history_rows(db, 'AAA') == [event('AAA', 1, 0), event('AAA', 5, 4)]
+        assert history_rows(db, 'BBB') == [event('BBB', 4, 3)]
+    finally:
+        db.close()